@@ -0,0 +1,181 @@
+"""本機模擬 Roblox API 伺服器，供離線壓力測試 (搭配 ROBLOX_API_BASE 使用)
+
+    python bench/mock_roblox.py --port 8765 --latency 20 --page-size 100 --throttle 0.01
+    ROBLOX_API_BASE=http://127.0.0.1:8765 python roblox_cli.py scan-user 1000001000 -w 1000
+
+路徑格式為 /<原主機名稱>/<原路徑>，例如 /groups.roblox.com/v1/groups/1000/roles。
+資料依 ID 決定 (不需錄製檔)，規模直接編碼在 ID 裡：
+  - 玩家 SIZE_BASE + n：好友 n/2 人、粉絲 n/4 人、關注 n/4 人 (成員 ID 為 1..n)
+  - 群組 SIZE_BASE + n：Member / Officer 兩個階層共 n 人 (成員 ID 為 1..n)
+  - 遊戲 SIZE_BASE + n：約 n/20 台公開伺服器，共 n 位玩家 (playerTokens 可換回同樣的頭像 URL)
+  - 預警社群 WARNING_GROUP (同盟 ALLY_GROUP)：成員為 7 的倍數、共 --roster-size 人；5 的倍數屬於同盟社群
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SIZE_BASE = 1_000_000_000
+WARNING_GROUP = 1000
+ALLY_GROUP = 2000
+PLAYERS_PER_SERVER = 20
+
+class MockConfig:
+    def __init__(self, latency=0.0, page_size=100, throttle=0.0, retry_after=0.5, roster_size=20_000):
+        self.latency, self.page_size, self.throttle, self.retry_after, self.roster_size = latency, page_size, throttle, retry_after, roster_size
+        self.requests, self.throttled = 0, 0
+        self.lock = threading.Lock()
+
+def headshot_url(uid):
+    return f"https://tr.rbxcdn.com/bench-{uid}/150/150/AvatarHeadshot/Png"
+
+def page(items, qs, cfg):
+    """以字串化位移作為 cursor 的分頁 (每頁筆數不超過 --page-size)"""
+    limit = min(int(qs.get("limit", ["100"])[0]), cfg.page_size)
+    start = int(qs.get("cursor", ["0"])[0] or 0)
+    end = min(start + limit, items.count)
+    return {"data": [items(i) for i in range(start, end)], "nextPageCursor": str(end) if end < items.count else None, "previousPageCursor": None}
+
+class LazyRange:
+    """依索引產生資料的唯讀序列 (10 萬人規模也不必預先建立清單)"""
+    def __init__(self, count, make):
+        self.count, self.make = count, make
+
+    def __call__(self, i):
+        return self.make(i)
+
+def social_sizes(n):
+    friends, followers = n // 2, n // 4
+    return {"friends": (0, friends), "followers": (friends, followers), "followings": (friends + followers, n - friends - followers)}
+
+def user_groups(uid, cfg):
+    groups = []
+    if uid % 7 == 0 and uid // 7 <= cfg.roster_size:
+        groups.append({"group": {"id": WARNING_GROUP, "name": "[WARN] Bench Warning"}, "role": {"id": WARNING_GROUP + 1, "name": "Colonel", "rank": 200}})
+    if uid % 5 == 0:
+        groups.append({"group": {"id": ALLY_GROUP, "name": "[ALLY] Bench Ally"}, "role": {"id": ALLY_GROUP + 1, "name": "Private", "rank": 10}})
+    groups.append({"group": {"id": 3000 + uid % 3, "name": "Bench Random"}, "role": {"id": 1, "name": "Member", "rank": 1}})
+    return groups
+
+def group_roles(gid, cfg):
+    if gid == WARNING_GROUP: return [{"id": 1, "name": "Guest", "rank": 0, "memberCount": 0}, {"id": WARNING_GROUP + 1, "name": "Colonel", "rank": 200, "memberCount": cfg.roster_size}]
+    n = gid - SIZE_BASE if gid > SIZE_BASE else 100
+    members = n * 9 // 10
+    return [{"id": 1, "name": "Guest", "rank": 0, "memberCount": 0}, {"id": 2, "name": "Member", "rank": 1, "memberCount": members}, {"id": 3, "name": "Officer", "rank": 100, "memberCount": n - members}]
+
+def role_members(gid, rid, cfg):
+    if gid == WARNING_GROUP: return LazyRange(cfg.roster_size if rid == WARNING_GROUP + 1 else 0, lambda i: {"userId": 7 * (i + 1), "username": f"bench{7 * (i + 1)}"})
+    roles = {r["id"]: r for r in group_roles(gid, cfg)}
+    offset = sum(r["memberCount"] for r in roles.values() if r["id"] < rid)
+    return LazyRange(roles.get(rid, {}).get("memberCount", 0), lambda i: {"userId": offset + i + 1, "username": f"bench{offset + i + 1}"})
+
+def game_servers(place_id):
+    n = place_id - SIZE_BASE if place_id > SIZE_BASE else 100
+    count = -(-n // PLAYERS_PER_SERVER)
+
+    def server(k):
+        players = range(k * PLAYERS_PER_SERVER + 1, min(n, (k + 1) * PLAYERS_PER_SERVER) + 1)
+        return {"id": f"bench-server-{k:06d}", "maxPlayers": PLAYERS_PER_SERVER, "playing": len(players), "ping": 40 + k % 30, "fps": 59.0 + (k % 10) / 10, "playerTokens": [f"tok{u}" for u in players]}
+    return LazyRange(count, server)
+
+def route(method, path, qs, body, cfg):
+    """回傳 (狀態碼, JSON)"""
+    host, _, path = path.lstrip("/").partition("/")
+    path = "/" + path
+    if host == "users.roblox.com":
+        if path == "/v1/usernames/users":
+            return 200, {"data": [{"id": int(m[1]), "name": n, "displayName": n, "requestedUsername": n} for n in body.get("usernames", []) if (m := re.fullmatch(r"bench(\d+)", n))]}
+        if path == "/v1/users" and method == "POST":
+            return 200, {"data": [{"id": u, "name": f"bench{u}", "displayName": f"Bench {u}", "hasVerifiedBadge": False} for u in body.get("userIds", [])]}
+        if (m := re.fullmatch(r"/v1/users/(\d+)", path)):
+            u = int(m[1]); return 200, {"id": u, "name": f"bench{u}", "displayName": f"Bench {u}", "created": "2020-01-01T00:00:00Z", "isBanned": False, "description": ""}
+    if host == "friends.roblox.com":
+        if (m := re.fullmatch(r"/v1/users/(\d+)/friends/count", path)):
+            u = int(m[1]); return 200, {"count": social_sizes(u - SIZE_BASE)["friends"][1] if u > SIZE_BASE else 0}
+        if (m := re.fullmatch(r"/v1/users/(\d+)/(friends|followers|followings)", path)):
+            u = int(m[1])
+            start, count = social_sizes(u - SIZE_BASE)[m[2]] if u > SIZE_BASE else (0, 0)
+            return 200, page(LazyRange(count, lambda i: {"id": start + i + 1, "name": f"bench{start + i + 1}"}), qs, cfg)
+    if host == "groups.roblox.com":
+        if (m := re.fullmatch(r"/v1/users/(\d+)/groups/roles", path)): return 200, {"data": user_groups(int(m[1]), cfg)}
+        if (m := re.fullmatch(r"/v1/groups/(\d+)/relationships/allies", path)):
+            return 200, {"relatedGroups": [{"id": ALLY_GROUP, "name": "[ALLY] Bench Ally"}] if int(m[1]) == WARNING_GROUP else [], "nextRowIndex": None}
+        if (m := re.fullmatch(r"/v1/groups/(\d+)/roles", path)): return 200, {"groupId": int(m[1]), "roles": group_roles(int(m[1]), cfg)}
+        if (m := re.fullmatch(r"/v1/groups/(\d+)/roles/(\d+)/users", path)): return 200, page(role_members(int(m[1]), int(m[2]), cfg), qs, cfg)
+    if host == "thumbnails.roblox.com":
+        if path == "/v1/users/avatar-headshot":
+            ids = [int(u) for u in qs.get("userIds", [""])[0].split(",") if u]
+            return 200, {"data": [{"targetId": u, "state": "Completed", "imageUrl": headshot_url(u)} for u in ids]}
+        if path == "/v1/batch":
+            return 200, {"data": [{"requestId": r.get("requestId"), "targetId": 0, "state": "Completed", "imageUrl": headshot_url(r["token"][3:])} for r in body]}
+        if path == "/v1/games/icons": return 200, {"data": [{"targetId": 0, "state": "Completed", "imageUrl": "https://tr.rbxcdn.com/bench-game/150/150/Image/Png"}]}
+    if host == "apis.roblox.com" and (m := re.fullmatch(r"/universes/v1/places/(\d+)/universe", path)):
+        return 200, {"universeId": int(m[1])}
+    if host == "games.roblox.com":
+        if path == "/v1/games":
+            u = int(qs.get("universeIds", ["0"])[0])
+            return 200, {"data": [{"id": u, "rootPlaceId": u, "name": f"Bench Game {u}", "playing": max(0, u - SIZE_BASE), "favoritedCount": 0, "description": ""}]}
+        if (m := re.fullmatch(r"/v1/games/(\d+)/servers/Public", path)): return 200, page(game_servers(int(m[1])), qs, cfg)
+    return 404, {"errors": [{"code": 0, "message": "NotFound"}]}
+
+def make_handler(cfg):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # 保持連線，與真實 API 一樣可重複使用連線池
+        disable_nagle_algorithm = True  # 標頭與內容分開寫出，避免 Nagle + delayed ACK 造成每個請求多 40ms
+
+        def _handle(self, method):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+            with cfg.lock: cfg.requests += 1
+            if cfg.latency: time.sleep(cfg.latency)
+            u = urlparse(self.path)
+            headers = {}
+            if cfg.throttle and random.random() < cfg.throttle:
+                with cfg.lock: cfg.throttled += 1
+                code, payload, headers = 429, {"errors": [{"code": 0, "message": "TooManyRequests"}]}, {"Retry-After": str(cfg.retry_after)}
+            elif u.path == "/__stats":
+                code, payload = 200, {"requests": cfg.requests, "throttled": cfg.throttled}
+            else:
+                code, payload = route(method, u.path, parse_qs(u.query), body, cfg)
+            data = json.dumps(payload).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in headers.items(): self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self): self._handle("GET")
+        def do_POST(self): self._handle("POST")
+        def log_message(self, *args): pass
+    return Handler
+
+def make_server(cfg, host="127.0.0.1", port=0):
+    server = ThreadingHTTPServer((host, port), make_handler(cfg))
+    server.daemon_threads = True
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本機模擬 Roblox API 伺服器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765, help="0 表示自動選擇")
+    parser.add_argument("--latency", type=float, default=0.0, help="每個請求的延遲毫秒數")
+    parser.add_argument("--page-size", type=int, default=100, help="分頁端點每頁最多回傳筆數")
+    parser.add_argument("--throttle", type=float, default=0.0, help="隨機回傳 429 的比例 (0~1)")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="429 回應的 Retry-After 秒數")
+    parser.add_argument("--roster-size", type=int, default=20_000, help="預警社群成員數")
+    args = parser.parse_args(argv)
+    cfg = MockConfig(args.latency / 1000, args.page_size, args.throttle, args.retry_after, args.roster_size)
+    server = make_server(cfg, args.host, args.port)
+    # 第一行輸出實際位址，供 run_bench.py 讀取
+    print(f"http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt: pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""離線壓力測試：啟動 bench/mock_roblox.py，依不同規模執行 Tab 1 社交圈掃描、Tab 2 階層掃描與 Tab 4 伺服器清單
+
+    python bench/run_bench.py                                  # 100 ~ 10 萬人，預設限速
+    python bench/run_bench.py --sizes 1000,10000 --latency 50 --throttle 0.02
+    python bench/run_bench.py --scenarios user --rate 1000     # 放寬限速，只量測抓取層本身
+
+每個 (情境, 規模) 在獨立子行程中執行 (使用全新的快取資料庫)，以取得準確的尖峰記憶體；
+輸出 requests/sec、請求延遲 p50 / p99、429 次數、尖峰記憶體與總耗時。
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCENARIOS = ("user", "group", "servers")
+DEFAULT_SIZES = "100,1000,10000,100000"
+
+def percentile(sorted_values, q):
+    if not sorted_values: return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+def run_child(scenario, size, rate):
+    """子行程：在模擬伺服器上執行單一情境並輸出一行 JSON 結果"""
+    sys.path.insert(0, os.path.dirname(BENCH_DIR))
+    import roblox_core as core
+    from mock_roblox import SIZE_BASE, WARNING_GROUP
+
+    if rate: core.RATE_LIMITER = core.RateLimiter({host: rate for host in core.HOST_RATE_LIMITS})
+    # 在連線層計時：包含限速器以外的所有網路與重試成本
+    latencies, statuses = [], {}
+    send = core.HTTP_SESSION.request
+
+    def timed_request(*args, **kwargs):
+        started = time.perf_counter()
+        res = send(*args, **kwargs)
+        latencies.append(time.perf_counter() - started)
+        statuses[res.status_code] = statuses.get(res.status_code, 0) + 1
+        return res
+    core.HTTP_SESSION.request = timed_request
+
+    job = core.ScanJob("bench", scenario, f"bench {scenario} {size}")
+    warning = frozenset({WARNING_GROUP})
+    target = SIZE_BASE + size
+    started = time.perf_counter()
+    if scenario == "user":
+        core.job_scan_user(job, str(target), warning, None)
+    elif scenario == "group":
+        roles = sorted(core.get_group_roles(target), key=lambda r: r.get("rank", 0))
+        sweep_id = core.SweepStore.job_id(target, roles, warning)
+        core.job_group_sweep(job, sweep_id, target, roles, warning, sum(r.get("memberCount", 0) for r in roles))
+    else:
+        core.job_game_monitor(job, str(target), 0)
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    processed = job.data["summary"]["servers"] if scenario == "servers" else job.done
+    print(json.dumps({
+        "scenario": scenario, "size": size, "status": "failed" if job.status == "failed" else "done", "error": job.error,
+        "processed": processed, "alerts": len(job.alerts), "requests": len(latencies), "throttled": statuses.get(429, 0),
+        "wall_s": round(wall, 3), "rps": round(len(latencies) / wall, 1) if wall else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        # Linux 的 ru_maxrss 單位為 KB
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }))
+
+def start_mock(args):
+    cmd = [sys.executable, os.path.join(BENCH_DIR, "mock_roblox.py"), "--port", "0", "--latency", str(args.latency), "--page-size", str(args.page_size),
+           "--throttle", str(args.throttle), "--retry-after", str(args.retry_after), "--roster-size", str(args.roster_size)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    return proc, proc.stdout.readline().strip()
+
+def format_row(r):
+    if r.get("status") != "done": return f"{r['scenario']:<8} {r['size']:>7}  ❌ {r.get('status')} {r.get('error') or ''}"
+    return (f"{r['scenario']:<8} {r['size']:>7} {r['processed']:>9} {r['requests']:>8} {r['throttled']:>5} {r['rps']:>9} "
+            f"{r['p50_ms']:>8} {r['p99_ms']:>8} {r['peak_rss_mb']:>8} {r['wall_s']:>9}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Roblox 掃描引擎離線壓力測試")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="以逗號分隔的人數規模")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="user (Tab 1) / group (Tab 2) / servers (Tab 4)")
+    parser.add_argument("--latency", type=float, default=20.0, help="模擬伺服器每個請求的延遲毫秒數")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--throttle", type=float, default=0.0, help="隨機回傳 429 的比例")
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    parser.add_argument("--roster-size", type=int, default=20_000, help="預警社群成員數")
+    parser.add_argument("--rate", type=float, help="覆寫各主機初始每秒請求數 (預設沿用 HOST_RATE_LIMITS)")
+    parser.add_argument("--json", help="另存完整結果 (JSON) 的路徑")
+    parser.add_argument("--child", nargs=2, metavar=("SCENARIO", "SIZE"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child: return run_child(args.child[0], int(args.child[1]), args.rate)
+
+    mock, base = start_mock(args)
+    results = []
+    print(f"模擬伺服器：{base} (延遲 {args.latency} ms，每頁 {args.page_size} 筆，429 比例 {args.throttle})", file=sys.stderr)
+    print(f"{'scenario':<8} {'size':>7} {'processed':>9} {'requests':>8} {'429':>5} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'peak MB':>8} {'wall s':>9}")
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for scenario in args.scenarios.split(","):
+                for size in (int(s) for s in args.sizes.split(",")):
+                    env = dict(os.environ, ROBLOX_API_BASE=base, ROBLOX_MONITOR_CACHE_DB=os.path.join(tmp, f"{scenario}_{size}.sqlite3"))
+                    cmd = [sys.executable, os.path.abspath(__file__), "--child", scenario, str(size)] + (["--rate", str(args.rate)] if args.rate else [])
+                    out = subprocess.run(cmd, env=env, capture_output=True, text=True)
+                    try:
+                        result = json.loads(out.stdout.strip().splitlines()[-1])
+                    except (IndexError, json.JSONDecodeError):
+                        result = {"scenario": scenario, "size": size, "status": "crashed", "error": "".join(out.stderr.strip().splitlines()[-1:])}
+                    results.append(result)
+                    print(format_row(result), flush=True)
+    finally:
+        mock.terminate()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump(results, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""Roblox 情報交叉比對命令列工具：不需啟動網頁，掃描結果以 JSON Lines 逐筆輸出到 stdout，進度訊息輸出到 stderr
+
+    python roblox_cli.py scan-user <玩家名稱或 ID> -w 11826423,36093699 [--depth 2 --budget 5000 --all --ally-only]
+    python roblox_cli.py scan-group <群組 ID> -w 11826423 [--min-rank 1 --max-rank 254 --reset --max-hits 50 --max-calls 2000 --max-minutes 10 | --sharded --local-workers 4]
+    python roblox_cli.py shard-worker [--sweep <進度 ID>]    # 同一台主機的其他行程以 ROBLOX_SHARD_DB 指向同一個佇列檔案加入分片掃描 (不支援網路磁碟)
+    python roblox_cli.py watch-game <Place ID> [--interval 30 | --once] [--watch-presence]
+    python roblox_cli.py lookup Roblox 1 builderman ... | lookup -f names.txt -w 11826423
+    python roblox_cli.py monitor add group <群組 ID> -w 11826423 | monitor add user <玩家名稱或 ID> -w 11826423
+    python roblox_cli.py monitor run [--interval 86400] | monitor list | monitor remove <目標 key>
+    python roblox_cli.py query-alerts [--min-rank 200 --days 30 --group 11826423 --type core --out alerts.parquet]
+
+預警社群也可由環境變數 ROBLOX_WARNING_GROUPS 指定。Ctrl+C 會停止工作 (群組掃描進度仍會保存，下次執行相同參數時續掃)。
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+from roblox_core import (
+    ALERT_COLUMNS, ALERT_MATCH_TYPES, ALERT_STORE, CRAWL_DEFAULT_BUDGET, GAME_MONITOR_INTERVAL, JOB_RUNNER, METRICS, MONITOR_STORE, SHARD_DB_PATH, SHARD_QUEUE, SWEEP_STORE, ScanBudget, SweepStore,
+    export_alert_rows, get_group_roles, job_bulk_lookup, job_incremental_monitor, resolve_user_input, job_game_monitor, job_group_sweep, job_scan_user, job_sharded_sweep, run_shard_worker,
+)
+
+CLI_POLL_INTERVAL = 0.2     # 讀取背景工作新結果的秒數
+CLI_PROGRESS_INTERVAL = 5.0 # 輸出進度訊息到 stderr 的最短間隔
+
+def emit(record):
+    sys.stdout.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    sys.stdout.flush()
+
+def log(message, quiet=False):
+    if not quiet: print(message, file=sys.stderr, flush=True)
+
+def parse_group_ids(raw):
+    return frozenset(int(g) for g in (raw or "").replace(" ", "").split(",") if g.isdigit())
+
+def stop_budget(args):
+    stop = ScanBudget(args.max_hits, args.max_calls, args.max_minutes)
+    return stop if stop else None
+
+def run_job(args, kind, title, fn, *job_args, on_tick=None, key=None, emit_alerts=True, dedicated=False):
+    """送出背景工作並邊執行邊輸出新的命中結果，結束時輸出一筆 summary；回傳程式結束碼"""
+    job = JOB_RUNNER.get(JOB_RUNNER.submit(kind, title, fn, *job_args, key=key, dedicated=dedicated))
+    sent, last_progress = 0, 0.0
+    while True:
+        # 先記下狀態再讀結果，確保工作結束前產生的命中都會被輸出
+        active = job.active
+        while emit_alerts and sent < len(job.alerts):
+            emit({"event": "alert", **job.alerts[sent]})
+            sent += 1
+        if on_tick: on_tick(job)
+        if not active: break
+        if time.monotonic() - last_progress >= CLI_PROGRESS_INTERVAL:
+            progress = f"{job.done}/{job.total}" if job.total else ""
+            log(f"[{job.status}] {job.stage} {progress}", args.quiet)
+            last_progress = time.monotonic()
+        try:
+            time.sleep(CLI_POLL_INTERVAL)
+        except KeyboardInterrupt:
+            log("⏹️ 收到中斷訊號，正在停止工作...", args.quiet)
+            job.cancel()
+    emit({"event": "summary", "kind": kind, "status": job.status, "done": job.done, "total": job.total, "alerts": len(job.alerts), "error": job.error, "stopped": job.data.get("stopped"), "incomplete": job.data.get("incomplete")})
+    return 1 if job.status == "failed" else 0
+
+def cmd_scan_user(args):
+    warning_group_ids = parse_group_ids(args.warning)
+    if not warning_group_ids: sys.exit("❌ 請以 -w 或 ROBLOX_WARNING_GROUPS 指定預警社群 ID")
+    sent_target = []
+
+    def on_tick(job):
+        # 目標玩家本體的結果存放在 job.data，另外輸出一次
+        if "target_alert" in job.data and not sent_target:
+            sent_target.append(True)
+            emit({"event": "target", "user_id": job.data["target_id"], "user_name": job.data["target_name"], "alert": job.data["target_alert"]})
+
+    budget = args.budget if args.depth > 1 else None
+    return run_job(args, "user", f"{args.user} 深度掃描", job_scan_user, args.user, warning_group_ids, None if args.all else 100, args.ally_only, args.depth, budget, stop_budget(args), on_tick=on_tick)
+
+def cmd_scan_group(args):
+    warning_group_ids = parse_group_ids(args.warning)
+    if not warning_group_ids: sys.exit("❌ 請以 -w 或 ROBLOX_WARNING_GROUPS 指定預警社群 ID")
+    roles = sorted(get_group_roles(args.group) or [], key=lambda r: r.get("rank", 0))
+    roles = [r for r in roles if args.min_rank <= r.get("rank", 0) <= args.max_rank]
+    if not roles: sys.exit("❌ 無法取得群組階層，或指定的 Rank 區間內沒有階層")
+    total_est = sum(r.get("memberCount", 0) for r in roles)
+    # 與網頁 Tab 2 使用相同的進度 ID，兩邊可互相續掃
+    sweep_id = SweepStore.job_id(args.group, roles, warning_group_ids, args.ally_only)
+    if args.reset:
+        SWEEP_STORE.reset_job(sweep_id)
+        SHARD_QUEUE.reset_sweep(sweep_id)
+    log(f"🎯 群組 {args.group}：{len(roles)} 個階層，約 {total_est} 人 (進度 ID {sweep_id})", args.quiet)
+    if args.sharded:
+        log(f"🧩 分片模式：同一台主機的其他行程可執行 ROBLOX_SHARD_DB={SHARD_DB_PATH} python roblox_cli.py shard-worker --sweep {sweep_id}", args.quiet)
+        return run_job(args, "group", f"群組 {args.group} 分片排查", job_sharded_sweep, sweep_id, args.group, roles, warning_group_ids, total_est, args.ally_only, args.local_workers, key=("sweep", sweep_id))
+    return run_job(args, "group", f"群組 {args.group} 深度排查", job_group_sweep, sweep_id, args.group, roles, warning_group_ids, total_est, args.ally_only, stop_budget(args), key=("sweep", sweep_id))
+
+def cmd_shard_worker(args):
+    # worker 在背景執行緒中執行，主執行緒才能接收 Ctrl+C 並讓它交還手上的分片
+    stop = threading.Event()
+    worker = threading.Thread(target=run_shard_worker, args=(args.worker_id, args.sweep, stop), daemon=True)
+    worker.start()
+    log(f"👷 分片 worker 已啟動 (佇列 {SHARD_DB_PATH}{'，掃描 ' + args.sweep if args.sweep else ''})", args.quiet)
+    try:
+        while worker.is_alive(): worker.join(CLI_POLL_INTERVAL)
+    except KeyboardInterrupt:
+        log("⏹️ 收到中斷訊號，正在交還分片...", args.quiet)
+        stop.set()
+        worker.join()
+    return 0
+
+def cmd_watch_game(args):
+    seen = [0]
+
+    def on_tick(job):
+        # 每完成一次輪詢輸出一筆快照 (伺服器完整清單過大，只輸出彙總、差異與名單命中)
+        d = job.data
+        if d.get("samples", 0) == seen[0]: return
+        seen[0] = d["samples"]
+        diff = d["last_diff"]
+        record = {"event": "sample", "place_id": args.place, "ts": d["last_sample"], "game_playing": d["game_info"].get("playing"), **d["summary"],
+                  "opened": len(diff["opened"]), "closed": len(diff["closed"]), "changed": len(diff["changed"])}
+        if "watch_hits" in d: record["watch_hits"] = d["watch_hits"]
+        emit(record)
+
+    interval = 0 if args.once else args.interval
+    return run_job(args, "game", f"遊戲 {args.place} 持續監控", job_game_monitor, args.place, interval, args.watch_presence, on_tick=on_tick, dedicated=bool(interval))
+
+def cmd_lookup(args):
+    names = list(args.users)
+    if args.file:
+        with (sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")) as f: names += f.read().replace(",", " ").split()
+    if not names: sys.exit("❌ 請指定玩家名稱或 ID (或以 -f 指定清單檔)")
+    sent = [0]
+
+    def on_tick(job):
+        rows = job.data.get("rows", [])
+        while sent[0] < len(rows):
+            emit({"event": "profile", **rows[sent[0]]})
+            sent[0] += 1
+        if not job.active:
+            for u in job.data.get("unresolved", []): emit({"event": "unresolved", "input": u})
+
+    # 批次查詢不會輸出 alert 事件，命中資訊已包含在 profile 中
+    return run_job(args, "lookup", f"批次查詢 {len(names)} 位玩家", job_bulk_lookup, names, parse_group_ids(args.warning), args.ally_only, on_tick=on_tick, emit_alerts=False)
+
+def cmd_monitor(args):
+    if args.action == "list":
+        for t in MONITOR_STORE.targets(): emit({"event": "target", **t})
+        return 0
+    if args.action == "remove":
+        MONITOR_STORE.remove_target(args.target)
+        return 0
+    if args.action == "add":
+        warning_group_ids = parse_group_ids(args.warning)
+        if not warning_group_ids: sys.exit("❌ 請以 -w 或 ROBLOX_WARNING_GROUPS 指定預警社群 ID")
+        if args.kind == "group":
+            if not get_group_roles(args.target): sys.exit("❌ 無法取得群組階層，請確認群組 ID")
+            key = MONITOR_STORE.add_target("group", args.target, f"群組 {args.target}", warning_group_ids, args.ally_only)
+        else:
+            uid, uname = resolve_user_input(args.target)
+            if not uid: sys.exit("❌ 無法解析目標玩家")
+            key = MONITOR_STORE.add_target("user", uid, uname, warning_group_ids, args.ally_only)
+        emit({"event": "added", "key": key})
+        return 0
+    sent = [0]
+
+    def on_tick(job):
+        # 每筆變動事件輸出一次 (首次執行的目標只建立基準，不會有事件)
+        changes = job.data.get("changes", [])
+        while sent[0] < len(changes):
+            emit({"event": "change", **changes[sent[0]]})
+            sent[0] += 1
+
+    return run_job(args, "monitor", "增量監控", job_incremental_monitor, None, args.interval, on_tick=on_tick, key=("monitor",) if args.interval else None, dedicated=bool(args.interval))
+
+def cmd_query_alerts(args):
+    since = time.time() - args.days * 86400 if args.days else None
+    rows = ALERT_STORE.query(args.min_rank, since, parse_group_ids(args.group), args.type or ["core"])
+    if args.out:
+        # 依副檔名決定匯出格式，不輸出到 stdout
+        try:
+            data = export_alert_rows(rows, "parquet" if args.out.endswith(".parquet") else "csv")
+        except RuntimeError as e:
+            sys.exit(f"❌ {e}")
+        with open(args.out, "wb") as f: f.write(data)
+        log(f"💾 已匯出 {len(rows)} 筆命中紀錄到 {args.out}", args.quiet)
+    else:
+        for row in rows: emit({"event": "alert_row", **dict(zip(ALERT_COLUMNS, row))})
+    emit({"event": "summary", "kind": "query", "rows": len(rows), "users": len({row[2] for row in rows})})
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Roblox 情報交叉比對命令列工具 (JSON Lines 輸出)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="不輸出進度訊息")
+    parser.add_argument("--metrics-out", help="結束時寫出執行指標 (副檔名 .json 為 JSON，其餘為 Prometheus 文字格式)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_warning_args(p):
+        p.add_argument("-w", "--warning", default=os.environ.get("ROBLOX_WARNING_GROUPS"), help="預警社群 ID，以逗號分隔")
+        p.add_argument("--ally-only", action="store_true", help="同時標記僅加入預警社群同盟者")
+
+    def add_stop_args(p):
+        p.add_argument("--max-hits", type=int, help="命中人數達到此數即停止 (依命中可能性優先掃描)")
+        p.add_argument("--max-calls", type=int, help="API 請求數達到此數即停止")
+        p.add_argument("--max-minutes", type=float, help="執行超過此分鐘數即停止")
+
+    p = sub.add_parser("scan-user", help="掃描目標玩家本體及其社交圈")
+    p.add_argument("user", help="玩家名稱或 ID")
+    add_warning_args(p)
+    p.add_argument("--all", action="store_true", help="解除關注 / 粉絲的人數限制")
+    p.add_argument("--depth", type=int, default=1, help="社交圈擴散層數")
+    p.add_argument("--budget", type=int, default=CRAWL_DEFAULT_BUDGET, help="多層擴散時的 API 請求預算")
+    add_stop_args(p)
+    p.set_defaults(func=cmd_scan_user)
+
+    p = sub.add_parser("scan-group", help="可續掃的群組大範圍掃描")
+    p.add_argument("group", help="目標群組 ID")
+    add_warning_args(p)
+    p.add_argument("--min-rank", type=int, default=0)
+    p.add_argument("--max-rank", type=int, default=255)
+    p.add_argument("--reset", action="store_true", help="清除已保存的進度並重新掃描")
+    add_stop_args(p)
+    p.add_argument("--sharded", action="store_true", help="分片模式：多個 worker (同一台主機的多個行程) 平行掃描，不支援提前停止條件")
+    p.add_argument("--local-workers", type=int, default=2, help="分片模式下本行程啟動的 worker 數量")
+    p.set_defaults(func=cmd_scan_group)
+
+    p = sub.add_parser("shard-worker", help="加入分片掃描的 worker (Ctrl+C 停止)")
+    p.add_argument("--sweep", help="只處理指定進度 ID 的掃描 (完成後結束)；未指定時持續處理所有掃描")
+    p.add_argument("--worker-id", help="worker 名稱 (預設為主機名稱與 PID)")
+    p.set_defaults(func=cmd_shard_worker)
+
+    p = sub.add_parser("watch-game", help="監控遊戲公開伺服器 (Ctrl+C 停止)")
+    p.add_argument("place", help="遊戲 Place ID")
+    p.add_argument("--interval", type=int, default=GAME_MONITOR_INTERVAL, help="輪詢秒數")
+    p.add_argument("--once", action="store_true", help="只讀取一次快照")
+    p.add_argument("--watch-presence", action="store_true", help="比對預警名單玩家所在伺服器")
+    p.set_defaults(func=cmd_watch_game)
+
+    p = sub.add_parser("lookup", help="批次查詢多位玩家的帳號資料並比對預警名單")
+    p.add_argument("users", nargs="*", help="玩家名稱或 ID")
+    p.add_argument("-f", "--file", help="名稱清單檔 (以換行、逗號或空白分隔；- 為 stdin)")
+    add_warning_args(p)
+    p.set_defaults(func=cmd_lookup)
+
+    p = sub.add_parser("monitor", help="定期增量監控：只重查有變動的成員並輸出變動事件")
+    actions = p.add_subparsers(dest="action", required=True)
+    a = actions.add_parser("add", help="加入監控目標")
+    a.add_argument("kind", choices=["group", "user"])
+    a.add_argument("target", help="群組 ID 或玩家名稱 / ID")
+    add_warning_args(a)
+    a = actions.add_parser("run", help="對所有目標執行增量檢查")
+    a.add_argument("--interval", type=int, default=0, help="每隔幾秒再檢查一輪 (0 為只執行一輪，適合搭配 cron)")
+    actions.add_parser("list", help="列出監控目標")
+    a = actions.add_parser("remove", help="移除監控目標與其快照")
+    a.add_argument("target", help="目標 key (見 monitor list)")
+    p.set_defaults(func=cmd_monitor)
+
+    p = sub.add_parser("query-alerts", help="查詢歷次掃描保存的命中紀錄 (不需重新掃描)")
+    p.add_argument("--min-rank", type=int, help="最低階級")
+    p.add_argument("--days", type=float, help="只查詢最近幾天")
+    p.add_argument("--group", help="限定群組 ID，以逗號分隔")
+    p.add_argument("--type", action="append", choices=sorted(ALERT_MATCH_TYPES.values()), help="命中類型，可重複指定 (預設 core)")
+    p.add_argument("--out", help="匯出檔案路徑 (.parquet 或 .csv)；未指定時以 JSON Lines 輸出")
+    p.set_defaults(func=cmd_query_alerts)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    code = args.func(args)
+    if args.metrics_out:
+        with open(args.metrics_out, "w", encoding="utf-8") as f:
+            if args.metrics_out.endswith(".json"): json.dump(METRICS.snapshot(), f, ensure_ascii=False, indent=2)
+            else: f.write(METRICS.to_prometheus())
+    return code
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2279 @@
+"""Roblox 情報交叉比對核心：API 抓取、限速、快取、預警索引與掃描引擎
+
+不依賴 Streamlit / pandas，可直接被網頁介面 (roblox_monitor.py)、命令列 (roblox_cli.py) 或排程工作匯入。
+模組層級的單例 (限速器、連線池、快取、背景工作池) 在同一行程內只建立一次，網頁重跑時沿用。
+"""
+import requests
+import time
+import re
+import os
+import json
+import hashlib
+import uuid
+import random
+import sqlite3
+import queue
+import itertools
+import heapq
+import functools
+import contextvars
+import csv
+import io
+import tempfile
+import socket
+from array import array
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from requests.adapters import HTTPAdapter
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+# ================= 配置區 =================
+SCAN_WORKERS = 8        # 社交圈並行查詢的執行緒數
+# 各 API 主機的初始每秒請求數 (會依節流狀況自動升降)
+HOST_RATE_LIMITS = {
+    "groups.roblox.com": 10, "friends.roblox.com": 10, "users.roblox.com": 10,
+    "thumbnails.roblox.com": 10, "games.roblox.com": 5, "apis.roblox.com": 5,
+}
+DEFAULT_HOST_RATE = 5
+RATE_MAX_MULTIPLIER = 3     # 無節流時最多加速到初始速率的倍數
+RATE_MIN = 0.5              # 連續節流時的最低每秒請求數
+RATE_INCREASE_STEP = 0.02   # 每次成功請求增加的速率 (初始速率的比例)
+THUMBNAIL_BATCH_SIZE = 100  # 頭像 API 單次最多可查詢的 userIds 數
+PROFILE_BATCH_SIZE = 100    # POST /v1/users 單次最多可查詢的 userIds 數
+USERNAME_BATCH_SIZE = 100   # POST /v1/usernames/users 單次最多可查詢的 usernames 數
+BULK_LOOKUP_MAX = 1000      # 批次查詢單次最多接受的玩家數
+ALERT_FLUSH_INTERVAL = 2.0  # 命中者最多累積幾秒就批次補齊頭像並送出
+SCAN_MAX_IN_FLIGHT = SCAN_WORKERS * 4  # 掃描引擎同時排隊中的查詢上限 (控制記憶體)
+MEMBER_PREFETCH = 200       # 成員分頁最多預先抓取領先檢查進度的人數
+SCAN_PRIORITY_WINDOW = 2000 # 群組掃描在此人數的緩衝區內依命中可能性重排 (維持串流與記憶體上限)
+ROSTER_MAX_MEMBERS = 200_000  # 預警社群超過此人數時不使用名冊反查
+ROSTER_TTL = 6 * 3600       # 名冊階層即使人數未變，超過此秒數也會重新抓取
+CRAWL_MAX_DEPTH = 3         # 社交圈最多擴散層數
+CRAWL_DEFAULT_BUDGET = 5000 # 多層擴散時預設的 API 請求預算
+ID_SPILL_CHUNK = 1_000_000  # 解除人數限制時，社交圈 ID 在記憶體累積到此數量就排序後寫入暫存檔
+GAME_SERVER_PAGE_SIZE = 100 # 公開伺服器清單每頁筆數 (API 上限)
+GAME_SERVER_MAX_PAGES = 500 # 單次快照最多翻頁數 (避免超大型遊戲無止境翻頁)
+GAME_MONITOR_INTERVAL = 30  # 遊戲持續監控的預設輪詢秒數
+GAME_HISTORY_RETENTION = 7 * 86400  # 遊戲監控歷史保留秒數
+MONITOR_DEFAULT_INTERVAL = 24 * 3600  # 增量監控預設的重新檢查間隔秒數
+MONITOR_FULL_REFRESH = 7 * 86400    # 增量監控的群組階層即使人數未變，超過此秒數也會完整重抓成員
+MONITOR_SOCIAL_LIMIT = 100          # 增量監控玩家目標時關注 / 粉絲最多讀取人數
+HEADSHOT_PARAMS = {"size": "150x150", "format": "Png", "isCircular": True}  # 頭像規格 (playerToken 比對時必須與名單頭像一致)
+JOB_WORKERS = 4             # 可同時執行的背景掃描工作數
+JOB_HISTORY = 50            # 保留在記憶體中的已結束工作數
+DEFAULT_AVATAR_URL = "https://tr.rbxcdn.com/38c6edcb50633730ff4cf39ac8859840/150/150/AvatarHeadshot/Png"
+HTTP_TIMEOUT = (5, 15)      # (連線, 讀取) 秒數；呼叫端未指定 timeout 時套用
+# 設定後所有 API 改連此位址，原主機名稱成為路徑前綴 (例如 bench/mock_roblox.py 的 http://127.0.0.1:8765)
+API_BASE_OVERRIDE = os.environ.get("ROBLOX_API_BASE")
+HTTP_POOL_MAXSIZE = 32      # 每個主機保留的 keep-alive 連線數 (需 >= SCAN_WORKERS)
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+CACHE_DB_PATH = os.environ.get("ROBLOX_MONITOR_CACHE_DB", "roblox_monitor_cache.sqlite3")
+# 分片掃描的工作佇列與結果 (同一台主機上的多個行程共用；SQLite 的 WAL 與檔案鎖不支援網路磁碟，不可跨主機共用)
+# 轉成絕對路徑，從其他工作目錄啟動的 worker 才會指向同一個檔案
+SHARD_DB_PATH = os.path.abspath(os.environ.get("ROBLOX_SHARD_DB", CACHE_DB_PATH))
+SHARD_PAGES = 10            # 每個分片負責的成員頁數 (每頁 100 人)
+SHARD_LEASE_SECONDS = 120   # 分片租約秒數；worker 超過此時間沒有心跳，分片會交給其他 worker
+SHARD_HEARTBEAT = 20        # worker 更新租約的間隔秒數
+SHARD_MAX_ATTEMPTS = 5      # 同一分片最多被租用幾次 (超過視為失敗，不再派發)
+SHARD_POLL_INTERVAL = 2.0   # 沒有可租用分片時的等待秒數
+# 各類資料的快取有效秒數
+CACHE_TTLS = {
+    "user_groups": 6 * 3600, "group_allies": 24 * 3600, "group_roles": 24 * 3600,
+    "friends": 6 * 3600, "profiles": 7 * 86400,
+}
+CACHE_STALE_WHILE_REVALIDATE = True  # 過期後仍先回傳舊資料，並於背景更新
+# 過期資料最多還能被沿用的秒數；群組成員資格會直接決定預警結果，只容許過期一個 TTL 週期
+CACHE_STALE_TTLS = {
+    "user_groups": 6 * 3600, "group_allies": 24 * 3600, "group_roles": 24 * 3600,
+    "friends": 24 * 3600, "profiles": 7 * 86400,
+}
+CACHE_REVALIDATE_WORKERS = 2         # 背景更新過期資料的執行緒上限 (其餘更新排隊等候)
+METRICS_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # 延遲直方圖級距 (秒)
+# ==========================================
+
+# ================= 執行指標 =================
+class Metrics:
+    """行程內的輕量指標 (計數器與延遲直方圖，標籤以關鍵字參數指定)，可匯出為 Prometheus 文字格式或 JSON"""
+    def __init__(self, buckets=METRICS_LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counters, self.histograms = {}, {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock: self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            # [各級距次數..., +Inf 次數, 總和]
+            hist = self.histograms.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            hist[next((i for i, b in enumerate(self.buckets) if seconds <= b), len(self.buckets))] += 1
+            hist[-1] += seconds
+
+    def timed(self, name, **labels):
+        """函數裝飾器：把每次呼叫的耗時記錄到 name 直方圖"""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try: return fn(*args, **kwargs)
+                finally: self.observe(name, time.perf_counter() - started, **labels)
+            return wrapper
+        return decorator
+
+    def counter(self, name, **labels):
+        """指定標籤的計數總和 (未指定的標籤全部加總)"""
+        want = set(labels.items())
+        with self.lock:
+            return sum(v for (n, lbl), v in self.counters.items() if n == name and want <= set(lbl))
+
+    def histogram(self, name, **labels):
+        """指定標籤的直方圖加總 (回傳 {"count", "sum", "buckets"} 或 None)"""
+        want, merged = set(labels.items()), None
+        with self.lock:
+            for (n, lbl), hist in self.histograms.items():
+                if n != name or not want <= set(lbl): continue
+                merged = hist[:] if merged is None else [a + b for a, b in zip(merged, hist)]
+        if merged is None: return None
+        return {"count": sum(merged[:-1]), "sum": merged[-1], "buckets": merged[:-1]}
+
+    def quantile(self, name, q, **labels):
+        """以直方圖級距估算分位數 (回傳該級距上限秒數；落在 +Inf 級距時回傳 float('inf')，沒有樣本時回傳 None)"""
+        hist = self.histogram(name, **labels)
+        if not hist or not hist["count"]: return None
+        target, seen = q * hist["count"], 0
+        for bound, n in zip(self.buckets, hist["buckets"]):
+            seen += n
+            if seen >= target: return bound
+        return float("inf")
+
+    def format_quantile(self, value):
+        """分位數的顯示文字：一般級距為「≤0.5s」，超過最大級距為「>10s」"""
+        if value is None: return "—"
+        return f">{self.buckets[-1]:g}s" if value == float("inf") else f"≤{value:g}s"
+
+    def label_values(self, name, label):
+        with self.lock:
+            keys = list(self.counters) + list(self.histograms)
+        return sorted({dict(lbl).get(label) for n, lbl in keys if n == name and label in dict(lbl)})
+
+    def snapshot(self):
+        with self.lock:
+            counters = [{"name": n, "labels": dict(lbl), "value": v} for (n, lbl), v in sorted(self.counters.items())]
+            histograms = [{"name": n, "labels": dict(lbl), "buckets": dict(zip([*map(str, self.buckets), "+Inf"], h[:-1])), "count": sum(h[:-1]), "sum": h[-1]} for (n, lbl), h in sorted(self.histograms.items())]
+        return {"timestamp": time.time(), "counters": counters, "histograms": histograms}
+
+    def to_prometheus(self):
+        def fmt(labels):
+            return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}" if labels else ""
+        lines, typed = [], set()
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed: lines.append(f"# TYPE {name} counter"); typed.add(name)
+                lines.append(f"{name}{fmt(labels)} {value}")
+            for (name, labels), hist in sorted(self.histograms.items()):
+                if name not in typed: lines.append(f"# TYPE {name} histogram"); typed.add(name)
+                cumulative = 0
+                for bound, n in zip([*map(str, self.buckets), "+Inf"], hist[:-1]):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{fmt((*labels, ('le', bound)))} {cumulative}")
+                lines.append(f"{name}_sum{fmt(labels)} {hist[-1]}")
+                lines.append(f"{name}_count{fmt(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self.lock: self.counters.clear(); self.histograms.clear()
+
+METRICS = Metrics()
+
+# ================= 各主機自適應限速器 =================
+class HostRateLimiter:
+    """單一 API 主機的自適應令牌桶：無節流時逐步加速，遇到 429 時減半並暫停"""
+    def __init__(self, rate, burst=None):
+        self.base_rate = rate
+        self.rate = rate
+        self.max_rate = rate * RATE_MAX_MULTIPLIER
+        self.min_rate = RATE_MIN
+        self.burst = burst or max(1.0, rate)
+        self.tokens = self.burst
+        self.last_refill = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def on_success(self, headers):
+        with self.lock:
+            remaining, reset = parse_ratelimit_headers(headers)
+            if remaining is not None and remaining <= 0 and reset:
+                # 配額已耗盡：暫停至視窗重置，不再加速
+                self.blocked_until = max(self.blocked_until, time.monotonic() + reset)
+                return
+            # 加法遞增：每次成功請求都往上限靠近一點
+            self.rate = min(self.max_rate, self.rate + self.base_rate * RATE_INCREASE_STEP)
+
+    def on_throttle(self, delay):
+        with self.lock:
+            now = time.monotonic()
+            # 乘法遞減 (同一波並行的 429 只減速一次)，並讓所有共用此主機的執行緒一起等待
+            if now >= self.blocked_until: self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0
+            self.blocked_until = max(self.blocked_until, now + delay)
+
+class RateLimiter:
+    """依 Roblox API 主機分桶的限速器集合"""
+    def __init__(self, host_rates):
+        self.host_rates = host_rates
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def for_host(self, host):
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = HostRateLimiter(self.host_rates.get(host, DEFAULT_HOST_RATE))
+            return self.hosts[host]
+
+def parse_ratelimit_headers(headers):
+    """解析 x-ratelimit-remaining / x-ratelimit-reset (格式如 "59" 或 "60, 60;w=60")"""
+    def first_number(value):
+        try: return float(str(value).split(",")[0].split(";")[0].strip())
+        except (TypeError, ValueError): return None
+    return first_number(headers.get("x-ratelimit-remaining")), first_number(headers.get("x-ratelimit-reset"))
+
+def parse_retry_after(res):
+    if res is None: return None
+    value = res.headers.get("Retry-After")
+    if value is None:
+        remaining, reset = parse_ratelimit_headers(res.headers)
+        return reset if reset else None
+    try: return max(0.0, float(value))
+    except ValueError:
+        try: return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError): return None
+
+def backoff_delay(attempt):
+    # 指數退避 + 抖動，避免多執行緒同時重試
+    return min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)) * random.uniform(0.5, 1.5)
+
+def get_rate_limiter():
+    # 同一伺服器行程內的所有分頁與重跑共用同一組限速器
+    return RateLimiter(HOST_RATE_LIMITS)
+
+RATE_LIMITER = get_rate_limiter()
+
+def get_http_session():
+    # 整個伺服器行程共用一個連線池，重複利用各 roblox.com 主機的 TCP/TLS 連線
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=len(HOST_RATE_LIMITS) + 2, pool_maxsize=HTTP_POOL_MAXSIZE, pool_block=True, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept": "application/json", "Accept-Encoding": "gzip, deflate"})
+    return session
+
+HTTP_SESSION = get_http_session()
+
+def api_url(url):
+    """套用 API_BASE_OVERRIDE：https://groups.roblox.com/v1/... -> {base}/groups.roblox.com/v1/..."""
+    if not API_BASE_OVERRIDE: return url
+    u = urlparse(url)
+    return f"{API_BASE_OVERRIDE.rstrip('/')}/{u.netloc}{u.path}" + (f"?{u.query}" if u.query else "")
+
+class RequestCounter:
+    """單一工作發出的 API 請求數 (含重試)；由 ScanBudget 設定到 JOB_REQUEST_COUNTER"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def inc(self):
+        with self.lock: self.count += 1
+
+# 目前工作的請求計數器；工作衍生的抓取執行緒以 contextvars.copy_context() 繼承
+JOB_REQUEST_COUNTER = contextvars.ContextVar("job_request_counter", default=None)
+
+def roblox_request(method, url, max_retries=MAX_RETRIES, **kwargs):
+    """所有 Roblox API 呼叫的統一入口：套用主機限速，並以有限次數重試 429 / 5xx / 連線錯誤"""
+    host = urlparse(url).hostname
+    limiter = RATE_LIMITER.for_host(host)
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+    res = None
+    for attempt in range(max_retries + 1):
+        # 分開記錄等待限速 / 退避的時間與實際網路時間，找出掃描慢在哪裡
+        started = time.perf_counter()
+        limiter.acquire()
+        METRICS.inc("roblox_sleep_seconds_total", time.perf_counter() - started, host=host, reason="rate_limit")
+        started = time.perf_counter()
+        try:
+            res = HTTP_SESSION.request(method, api_url(url), **kwargs)
+        except requests.RequestException:
+            res = None
+        METRICS.observe("roblox_request_seconds", time.perf_counter() - started, host=host)
+        METRICS.inc("roblox_requests_total", host=host, status=res.status_code if res is not None else "error")
+        if (counter := JOB_REQUEST_COUNTER.get()) is not None: counter.inc()
+        if res is not None and res.status_code != 429 and res.status_code < 500:
+            limiter.on_success(res.headers)
+            return res
+        if attempt == max_retries: break
+        if res is not None and res.status_code == 429:
+            METRICS.inc("roblox_retries_total", host=host, reason="throttled")
+            delay = parse_retry_after(res)
+            limiter.on_throttle(delay if delay is not None else backoff_delay(attempt))
+        else:
+            METRICS.inc("roblox_retries_total", host=host, reason="server_error" if res is not None else "network")
+            delay = backoff_delay(attempt)
+            METRICS.inc("roblox_sleep_seconds_total", delay, host=host, reason="backoff")
+            time.sleep(delay)
+    return res
+
+def roblox_get(url, **kwargs):
+    return roblox_request("GET", url, **kwargs)
+
+# ================= 同鍵請求合併 (single-flight) =================
+class SingleFlight:
+    """行程內的同鍵請求合併：同一個 key 的抓取正在進行時，後到的呼叫者 (其他工作階段或掃描執行緒) 等待並共用其結果，不重複發出請求"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}  # key -> {"done": Event, "value", "error"}
+
+    def do(self, key, fn, kind="other"):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader: call = self.calls[key] = {"done": threading.Event(), "value": None, "error": None}
+        METRICS.inc("singleflight_calls_total", kind=kind, result="leader" if leader else "coalesced")
+        if not leader:
+            call["done"].wait()
+            if call["error"]: raise call["error"]
+            return call["value"]
+        try:
+            call["value"] = fn()
+            return call["value"]
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self.lock: del self.calls[key]
+            call["done"].set()
+
+    def in_flight(self):
+        with self.lock: return len(self.calls)
+
+SINGLE_FLIGHT = SingleFlight()
+
+# ================= 延遲建立的儲存單例 =================
+class LazyStore:
+    """模組層級的 SQLite 儲存單例：第一次使用時才呼叫 factory 建立，匯入模組 (測試、cron) 不會建立或開啟任何資料庫檔案"""
+    def __init__(self, factory):
+        self._factory, self._instance, self._lock = factory, None, threading.Lock()
+
+    def _get(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None: self._instance = self._factory()
+        return self._instance
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+    def __len__(self):
+        return len(self._get())
+
+# ================= 本機持久化快取 (SQLite) =================
+class PersistentCache:
+    """跨工作階段與行程共用的 SQLite 快取，每種資料各有 TTL，過期資料可先回傳再於背景更新"""
+    def __init__(self, path, ttls, stale_ttls):
+        self.ttls = ttls
+        self.stale_ttls = stale_ttls
+        self.lock = threading.Lock()
+        self.refreshing = set()
+        # 大量過期資料同時命中時 (例如隔很久後重掃大型群組) 只排隊，不會每筆各開一個執行緒
+        self.pending, self.refreshers = queue.Queue(), 0
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS cache (kind TEXT, key TEXT, value TEXT, fetched_at REAL, PRIMARY KEY (kind, key))")
+            # 清掉連過期寬限期都已超過的資料
+            self.conn.execute("DELETE FROM cache WHERE fetched_at < ?", (time.time() - max(ttls[k] + stale_ttls.get(k, 0) for k in ttls),))
+
+    def get_many(self, kind, keys):
+        """回傳 ({key: value}, [需背景更新的過期 key])；超過寬限期的資料視為未命中"""
+        keys = [str(k) for k in keys]
+        found, stale, now = {}, [], time.time()
+        with self.lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self.conn.execute(f"SELECT key, value, fetched_at FROM cache WHERE kind = ? AND key IN ({','.join('?' * len(chunk))})", [kind, *chunk]).fetchall()
+                for key, value, fetched_at in rows:
+                    age = now - fetched_at
+                    if age < self.ttls[kind]: found[key] = json.loads(value)
+                    elif CACHE_STALE_WHILE_REVALIDATE and age < self.ttls[kind] + self.stale_ttls.get(kind, 0):
+                        found[key] = json.loads(value); stale.append(key)
+        METRICS.inc("cache_lookups_total", len(found) - len(stale), kind=kind, result="hit")
+        METRICS.inc("cache_lookups_total", len(stale), kind=kind, result="stale")
+        METRICS.inc("cache_lookups_total", len(keys) - len(found), kind=kind, result="miss")
+        return found, stale
+
+    def set_many(self, kind, items):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO cache (kind, key, value, fetched_at) VALUES (?, ?, ?, ?)", [(kind, str(k), json.dumps(v), now) for k, v in items.items()])
+
+    def delete_many(self, kind, keys):
+        """讓指定資料失效，下次讀取時一定重新抓取 (增量監控確認有變動的人員時使用)"""
+        keys = [str(k) for k in keys]
+        with self.lock, self.conn:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                self.conn.execute(f"DELETE FROM cache WHERE kind = ? AND key IN ({','.join('?' * len(chunk))})", [kind, *chunk])
+
+    def revalidate(self, kind, keys, refresh):
+        """排入背景更新佇列，由最多 CACHE_REVALIDATE_WORKERS 個執行緒呼叫 refresh(keys) (同一筆只會有一個更新在進行或排隊)"""
+        with self.lock:
+            keys = [k for k in keys if (kind, k) not in self.refreshing]
+            self.refreshing.update((kind, k) for k in keys)
+            if not keys: return
+            self.pending.put((kind, keys, refresh))
+            if self.refreshers >= CACHE_REVALIDATE_WORKERS: return
+            self.refreshers += 1
+        # daemon 執行緒：結束行程時不必等佇列中的更新做完
+        threading.Thread(target=self._refresh_loop, daemon=True, name="cache-revalidate").start()
+
+    def _refresh_loop(self):
+        while True:
+            kind, keys, refresh = self.pending.get()
+            try: refresh(keys)
+            except Exception: pass
+            finally:
+                with self.lock: self.refreshing.difference_update((kind, k) for k in keys)
+
+    def get_or_fetch(self, kind, key, fetcher):
+        """單筆讀取；未命中時呼叫 fetcher()，其回傳 None 代表抓取失敗，不寫入快取"""
+        found, stale = self.get_many(kind, [key])
+        if stale: self.revalidate(kind, stale, lambda _: self._fetch_and_store(kind, key, fetcher))
+        if str(key) in found: return found[str(key)]
+        return self._fetch_and_store(kind, key, fetcher)
+
+    def _fetch_and_store(self, kind, key, fetcher):
+        # 寫入快取後才結束合併，之後的呼叫者直接命中快取
+        def fetch():
+            value = fetcher()
+            if value is not None: self.set_many(kind, {key: value})
+            return value
+        return SINGLE_FLIGHT.do((kind, str(key)), fetch, kind)
+
+def get_persistent_cache():
+    return PersistentCache(CACHE_DB_PATH, CACHE_TTLS, CACHE_STALE_TTLS)
+
+CACHE = LazyStore(get_persistent_cache)
+
+# ================= 群組大範圍掃描檢查點 =================
+class SweepStore:
+    """將 Tab 2 掃描工作的各階層游標、已檢查人員與命中報告寫入 SQLite，讓掃描可暫停、續掃或於當機後重啟"""
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS sweep_jobs (job_id TEXT PRIMARY KEY, group_id INTEGER, status TEXT, created_at REAL, updated_at REAL)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS sweep_roles (job_id TEXT, role_id INTEGER, cursor TEXT, done INTEGER, PRIMARY KEY (job_id, role_id))")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS sweep_processed (job_id TEXT, user_id INTEGER, PRIMARY KEY (job_id, user_id))")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS sweep_alerts (job_id TEXT, user_id INTEGER, report TEXT, PRIMARY KEY (job_id, user_id))")
+
+    @staticmethod
+    def job_id(group_id, roles, warning_group_ids, ally_only=False):
+        # 同一群組、同一階層區間、同一份預警名單 (與同盟標記設定) 視為同一個工作
+        raw = f"{group_id}|{sorted(r['id'] for r in roles)}|{sorted(warning_group_ids)}" + ("|ally_only" if ally_only else "")
+        return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+    def open_job(self, job_id, group_id, roles):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO sweep_jobs VALUES (?, ?, 'running', ?, ?)", (job_id, int(group_id), now, now))
+            self.conn.executemany("INSERT OR IGNORE INTO sweep_roles VALUES (?, ?, '', 0)", [(job_id, r["id"]) for r in roles])
+
+    def reset_job(self, job_id):
+        with self.lock, self.conn:
+            for table in ("sweep_jobs", "sweep_roles", "sweep_processed", "sweep_alerts"):
+                self.conn.execute(f"DELETE FROM {table} WHERE job_id = ?", (job_id,))
+
+    def summary(self, job_id):
+        """回傳 {"status", "processed", "alerts"}；工作不存在時回傳 None"""
+        with self.lock:
+            row = self.conn.execute("SELECT status FROM sweep_jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if not row: return None
+            processed = self.conn.execute("SELECT COUNT(*) FROM sweep_processed WHERE job_id = ?", (job_id,)).fetchone()[0]
+            alerts = self.conn.execute("SELECT COUNT(*) FROM sweep_alerts WHERE job_id = ?", (job_id,)).fetchone()[0]
+        return {"status": row[0], "processed": processed, "alerts": alerts}
+
+    def role_cursor(self, job_id, role_id):
+        with self.lock:
+            row = self.conn.execute("SELECT cursor, done FROM sweep_roles WHERE job_id = ? AND role_id = ?", (job_id, role_id)).fetchone()
+        return (row[0], bool(row[1])) if row else ("", False)
+
+    def save_cursor(self, job_id, role_id, cursor, done):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE sweep_roles SET cursor = ?, done = ? WHERE job_id = ? AND role_id = ?", (cursor or "", int(done), job_id, role_id))
+            self.conn.execute("UPDATE sweep_jobs SET updated_at = ? WHERE job_id = ?", (time.time(), job_id))
+
+    def processed_ids(self, job_id, user_ids):
+        user_ids = [int(u) for u in user_ids]
+        if not user_ids: return set()
+        with self.lock:
+            rows = self.conn.execute(f"SELECT user_id FROM sweep_processed WHERE job_id = ? AND user_id IN ({','.join('?' * len(user_ids))})", [job_id, *user_ids]).fetchall()
+        return {r[0] for r in rows}
+
+    def record_results(self, job_id, results):
+        """批次寫入 [(user ID, 預警報告或 None)] (分片掃描合併結果時使用)"""
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO sweep_processed VALUES (?, ?)", [(job_id, int(uid)) for uid, _ in results])
+            self.conn.executemany("INSERT OR REPLACE INTO sweep_alerts VALUES (?, ?, ?)", [(job_id, int(uid), json.dumps(report, ensure_ascii=False)) for uid, report in results if report])
+
+    def record_result(self, job_id, user_id, report):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO sweep_processed VALUES (?, ?)", (job_id, int(user_id)))
+            if report: self.conn.execute("INSERT OR REPLACE INTO sweep_alerts VALUES (?, ?, ?)", (job_id, int(user_id), json.dumps(report, ensure_ascii=False)))
+
+    def alerts(self, job_id):
+        with self.lock:
+            rows = self.conn.execute("SELECT report FROM sweep_alerts WHERE job_id = ? ORDER BY rowid", (job_id,)).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def all_alerts(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT report FROM sweep_alerts ORDER BY rowid").fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def mark_status(self, job_id, status):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE sweep_jobs SET status = ?, updated_at = ? WHERE job_id = ?", (status, time.time(), job_id))
+
+def get_sweep_store():
+    return SweepStore(CACHE_DB_PATH)
+
+SWEEP_STORE = LazyStore(get_sweep_store)
+
+# ================= 預警社群成員名冊 =================
+class RosterStore:
+    """預警社群成員名冊的本機副本，供「名冊反查」模式直接比對候選人而不必逐人查詢群組"""
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS roster_roles (group_id INTEGER, role_id INTEGER, member_count INTEGER, fetched_at REAL, PRIMARY KEY (group_id, role_id))")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS roster_members (group_id INTEGER, role_id INTEGER, user_id INTEGER, PRIMARY KEY (group_id, role_id, user_id))")
+
+    def role_state(self, group_id):
+        """回傳 {role_id: (成員數, 抓取時間)}"""
+        with self.lock:
+            rows = self.conn.execute("SELECT role_id, member_count, fetched_at FROM roster_roles WHERE group_id = ?", (int(group_id),)).fetchall()
+        return {r[0]: (r[1], r[2]) for r in rows}
+
+    def replace_role(self, group_id, role_id, member_count, user_ids):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM roster_members WHERE group_id = ? AND role_id = ?", (int(group_id), role_id))
+            self.conn.executemany("INSERT OR IGNORE INTO roster_members VALUES (?, ?, ?)", [(int(group_id), role_id, int(u)) for u in user_ids])
+            self.conn.execute("INSERT OR REPLACE INTO roster_roles VALUES (?, ?, ?, ?)", (int(group_id), role_id, member_count, time.time()))
+
+    def member_ids(self, group_ids):
+        group_ids = [int(g) for g in group_ids]
+        if not group_ids: return set()
+        with self.lock:
+            rows = self.conn.execute(f"SELECT user_id FROM roster_members WHERE group_id IN ({','.join('?' * len(group_ids))})", group_ids).fetchall()
+        return {r[0] for r in rows}
+
+    def member_roles(self, group_ids):
+        """回傳 {user ID: "群組:階層,..."}；增量監控以此簽章判斷誰在預警社群中的職位有變動"""
+        group_ids = [int(g) for g in group_ids]
+        if not group_ids: return {}
+        with self.lock:
+            rows = self.conn.execute(f"SELECT user_id, group_id, role_id FROM roster_members WHERE group_id IN ({','.join('?' * len(group_ids))}) ORDER BY user_id, group_id, role_id", group_ids).fetchall()
+        sigs = {}
+        for uid, gid, rid in rows: sigs[uid] = f"{sigs[uid]},{gid}:{rid}" if uid in sigs else f"{gid}:{rid}"
+        return sigs
+
+def get_roster_store():
+    return RosterStore(CACHE_DB_PATH)
+
+ROSTER_STORE = LazyStore(get_roster_store)
+
+class GameHistoryStore:
+    """遊戲監控的本機時間序列：每次輪詢一筆彙總，伺服器層級只記錄開啟 / 關閉事件
+
+    各伺服器的人數變動幾乎每次輪詢都會發生 (數千台伺服器 × 每 30 秒 × 保留 7 天會累積上千萬列)，
+    只保留在彙總的總人數裡，不逐台寫入。
+    """
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS game_samples (place_id INTEGER, ts REAL, playing INTEGER, servers INTEGER, capacity INTEGER, avg_ping REAL, avg_fps REAL, opened INTEGER, closed INTEGER, complete INTEGER, PRIMARY KEY (place_id, ts))")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS game_server_events (place_id INTEGER, ts REAL, server_id TEXT, event TEXT, playing INTEGER, delta INTEGER)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS game_server_events_ts ON game_server_events (place_id, ts)")
+
+    def record(self, place_id, ts, summary, diff):
+        place_id = int(place_id)
+        events = [(place_id, ts, sid, "open", playing, playing) for sid, playing in diff["opened"]]
+        events += [(place_id, ts, sid, "close", 0, -playing) for sid, playing in diff["closed"]]
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO game_samples VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (place_id, ts, summary["playing"], summary["servers"], summary["capacity"], summary["avg_ping"], summary["avg_fps"], len(diff["opened"]), len(diff["closed"]), int(summary["complete"])))
+            self.conn.executemany("INSERT INTO game_server_events VALUES (?, ?, ?, ?, ?, ?)", events)
+            cutoff = ts - GAME_HISTORY_RETENTION
+            self.conn.execute("DELETE FROM game_samples WHERE place_id = ? AND ts < ?", (place_id, cutoff))
+            self.conn.execute("DELETE FROM game_server_events WHERE place_id = ? AND ts < ?", (place_id, cutoff))
+
+    def samples(self, place_id, since=0):
+        with self.lock:
+            return self.conn.execute("SELECT ts, playing, servers, capacity, avg_ping, avg_fps, opened, closed, complete FROM game_samples WHERE place_id = ? AND ts >= ? ORDER BY ts", (int(place_id), since)).fetchall()
+
+    def server_events(self, place_id, limit=200):
+        with self.lock:
+            return self.conn.execute("SELECT ts, server_id, event, playing, delta FROM game_server_events WHERE place_id = ? ORDER BY ts DESC, rowid DESC LIMIT ?", (int(place_id), limit)).fetchall()
+
+def get_game_history_store():
+    return GameHistoryStore(CACHE_DB_PATH)
+
+GAME_HISTORY = LazyStore(get_game_history_store)
+
+def headshot_key(url):
+    """頭像 URL 的比對鍵：CDN 主機 (t0~t7 / tr) 會變動，只取路徑部分"""
+    return urlparse(url).path if url else None
+
+class WatchlistStore:
+    """歷次掃描命中者的頭像索引 (頭像鍵 -> {user ID: 玩家})，供 playerToken 頭像比對；記憶體內保留一份字典供 O(1) 查詢
+
+    同一套裝扮的頭像 URL 相同，一個頭像鍵可能對應多位命中者 (比對結果只是候選人，不代表確認身分)；
+    每位玩家只保留目前的頭像鍵。
+    """
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS watch_avatars (image_key TEXT, user_id INTEGER, user_name TEXT, relation TEXT, updated_at REAL, PRIMARY KEY (image_key, user_id))")
+            # 舊版以頭像鍵為主鍵 (同頭像的玩家會互相覆蓋)，搬移後刪除
+            if self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'watch_headshots'").fetchone():
+                self.conn.execute("INSERT OR IGNORE INTO watch_avatars SELECT image_key, user_id, user_name, relation, updated_at FROM watch_headshots")
+                self.conn.execute("DROP TABLE watch_headshots")
+            rows = self.conn.execute("SELECT image_key, user_id, user_name, relation FROM watch_avatars").fetchall()
+        self.by_key, self.by_user = {}, {}
+        for key, uid, name, relation in rows:
+            self.by_key.setdefault(key, {})[uid] = {"user_id": uid, "user_name": name, "relation": relation}
+            self.by_user[uid] = key
+
+    def add_alerts(self, alerts):
+        """增量寫入命中者頭像；玩家換頭像時只移除該玩家自己的舊配對"""
+        rows, stale = [], []
+        with self.lock:
+            for a in alerts:
+                key, uid = headshot_key(a.get("avatar_url")), int(a["user_id"])
+                if not key or key == headshot_key(DEFAULT_AVATAR_URL): continue
+                entry = {"user_id": uid, "user_name": a["user_name"], "relation": a.get("relation")}
+                if self.by_key.get(key, {}).get(uid) == entry: continue
+                old = self.by_user.get(uid)
+                if old and old != key:
+                    self.by_key[old].pop(uid, None)
+                    if not self.by_key[old]: del self.by_key[old]
+                    stale.append((old, uid))
+                self.by_key.setdefault(key, {})[uid], self.by_user[uid] = entry, key
+                rows.append((key, uid, entry["user_name"], entry["relation"], time.time()))
+            if rows:
+                with self.conn:
+                    self.conn.executemany("DELETE FROM watch_avatars WHERE image_key = ? AND user_id = ?", stale)
+                    self.conn.executemany("INSERT OR REPLACE INTO watch_avatars VALUES (?, ?, ?, ?, ?)", rows)
+
+    def match(self, image_url):
+        """回傳頭像相符的候選命中者清單 (沒有時為空清單)"""
+        return list(self.by_key.get(headshot_key(image_url), {}).values())
+
+    def __len__(self):
+        return len(self.by_user)
+
+def get_watchlist_store():
+    store = WatchlistStore(CACHE_DB_PATH)
+    # 首次啟用時以已保存的大範圍掃描命中結果建立索引
+    if not len(store):
+        store.add_alerts(SWEEP_STORE.all_alerts())
+    return store
+
+WATCHLIST = LazyStore(get_watchlist_store)
+
+# ================= 歷次命中紀錄 =================
+ALERT_MATCH_TYPES = {"core_groups": "core", "ally_groups": "ally", "ally_only_groups": "ally_only", "scanned_ally_groups": "scanned_ally"}
+ALERT_COLUMNS = ("scan_id", "scanned_at", "user_id", "user_name", "relation", "match_type", "group_id", "group_name", "role_name", "rank")
+
+class AlertStore:
+    """把每份預警報告攤平成 (玩家, 群組, 職位, 階級, 關聯, 掃描, 時間) 的長表保存，可跨掃描查詢與匯出而不必重掃"""
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS alert_scans (scan_id TEXT PRIMARY KEY, kind TEXT, title TEXT, started_at REAL)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS alert_memberships (scan_id TEXT, scanned_at REAL, user_id INTEGER, user_name TEXT, relation TEXT, match_type TEXT, group_id INTEGER, group_name TEXT, role_name TEXT, rank INTEGER)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS alert_memberships_rank ON alert_memberships (match_type, rank, scanned_at)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS alert_memberships_user ON alert_memberships (user_id, scanned_at)")
+
+    @staticmethod
+    def flatten(scan_id, ts, report):
+        return [(scan_id, ts, int(report["user_id"]), report["user_name"], report.get("relation"), match_type, int(g["group_id"]), g["group_name"], g["role_name"], int(g["rank_num"]))
+                for key, match_type in ALERT_MATCH_TYPES.items() for g in report.get(key) or []]
+
+    def record(self, scan_id, kind, title, reports):
+        now = time.time()
+        rows = [row for r in reports if r for row in self.flatten(scan_id, now, r)]
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO alert_scans VALUES (?, ?, ?, ?)", (scan_id, kind, title, now))
+            self.conn.executemany(f"INSERT INTO alert_memberships VALUES ({','.join('?' * len(ALERT_COLUMNS))})", rows)
+
+    def query(self, min_rank=None, since=None, group_ids=None, match_types=("core",), user_id=None):
+        """回傳符合條件的命中列 (欄位見 ALERT_COLUMNS)，由新到舊排序"""
+        where, params = [], []
+        if match_types:
+            where.append(f"match_type IN ({','.join('?' * len(match_types))})"); params += list(match_types)
+        if min_rank is not None: where.append("rank >= ?"); params.append(int(min_rank))
+        if since is not None: where.append("scanned_at >= ?"); params.append(since)
+        if group_ids:
+            where.append(f"group_id IN ({','.join('?' * len(group_ids))})"); params += [int(g) for g in group_ids]
+        if user_id is not None: where.append("user_id = ?"); params.append(int(user_id))
+        sql = f"SELECT {', '.join(ALERT_COLUMNS)} FROM alert_memberships" + (f" WHERE {' AND '.join(where)}" if where else "") + " ORDER BY scanned_at DESC"
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def known_user_ids(self):
+        """曾在任何掃描中命中過的玩家 ID (排程時優先檢查)"""
+        with self.lock:
+            return {r[0] for r in self.conn.execute("SELECT DISTINCT user_id FROM alert_memberships")}
+
+    @staticmethod
+    def summarize_users(rows):
+        """把命中列彙整成每位玩家一列：最高階級、命中群組、最後出現時間與出現於幾次掃描"""
+        users = {}
+        for scan_id, ts, uid, name, _, _, gid, gname, role, rank in rows:
+            u = users.setdefault(uid, {"user_id": uid, "user_name": name, "max_rank": rank, "groups": {}, "last_seen": ts, "scans": set()})
+            u["max_rank"] = max(u["max_rank"], rank)
+            u["last_seen"] = max(u["last_seen"], ts)
+            u["groups"].setdefault(gid, f"{gname} / {role} (Lv.{rank})")
+            u["scans"].add(scan_id)
+        return [{**u, "groups": list(u["groups"].values()), "scans": len(u["scans"])} for u in sorted(users.values(), key=lambda u: (-u["max_rank"], -u["last_seen"]))]
+
+def export_alert_rows(rows, fmt):
+    """把命中列匯出成 CSV 或 Parquet 位元組 (Parquet 需要 pandas + pyarrow)"""
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(ALERT_COLUMNS)
+        writer.writerows(rows)
+        return buf.getvalue().encode("utf-8-sig")
+    try:
+        import pandas as pd
+        buf = io.BytesIO()
+        pd.DataFrame(rows, columns=ALERT_COLUMNS).to_parquet(buf, index=False)
+        return buf.getvalue()
+    except ImportError as e:
+        raise RuntimeError(f"匯出 Parquet 需要安裝 pandas 與 pyarrow ({e})")
+
+def parquet_export_available():
+    """是否已安裝 Parquet 匯出所需套件 (只檢查不匯入，供介面決定是否顯示匯出按鈕)"""
+    from importlib.util import find_spec
+    return bool(find_spec("pandas") and (find_spec("pyarrow") or find_spec("fastparquet")))
+
+def get_alert_store():
+    return AlertStore(CACHE_DB_PATH)
+
+ALERT_STORE = LazyStore(get_alert_store)
+
+# ================= 增量監控快照 =================
+class MonitorStore:
+    """增量監控目標的最後已知狀態：群組各階層成員 / 玩家社交圈、每位成員在預警社群的職位簽章與群組，以及歷次變動事件"""
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS monitor_targets (target_key TEXT PRIMARY KEY, kind TEXT, target_id INTEGER, title TEXT, config TEXT, created_at REAL, last_run REAL)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS monitor_roles (target_key TEXT, role_id INTEGER, member_count INTEGER, fetched_at REAL, PRIMARY KEY (target_key, role_id))")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS monitor_members (target_key TEXT, user_id INTEGER, user_name TEXT, role_id INTEGER, relation TEXT, PRIMARY KEY (target_key, user_id))")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS monitor_states (target_key TEXT, user_id INTEGER, sig TEXT, groups TEXT, checked_at REAL, PRIMARY KEY (target_key, user_id))")
+            # 舊版沒有記錄查詢時間，補上欄位後視為從未查過 (下一輪重查一次)
+            if "checked_at" not in [r[1] for r in self.conn.execute("PRAGMA table_info(monitor_states)")]:
+                self.conn.execute("ALTER TABLE monitor_states ADD COLUMN checked_at REAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS monitor_changes (target_key TEXT, ts REAL, user_id INTEGER, user_name TEXT, change TEXT, group_id INTEGER, group_name TEXT, detail TEXT)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS monitor_changes_ts ON monitor_changes (target_key, ts)")
+
+    @staticmethod
+    def target_key(kind, target_id, warning_group_ids, ally_only=False):
+        raw = f"{kind}|{target_id}|{sorted(warning_group_ids)}" + ("|ally_only" if ally_only else "")
+        return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+    def add_target(self, kind, target_id, title, warning_group_ids, ally_only=False):
+        key = self.target_key(kind, target_id, warning_group_ids, ally_only)
+        config = json.dumps({"warning_ids": sorted(int(g) for g in warning_group_ids), "ally_only": ally_only})
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO monitor_targets VALUES (?, ?, ?, ?, ?, ?, NULL)", (key, kind, int(target_id), title, config, time.time()))
+        return key
+
+    def remove_target(self, key):
+        with self.lock, self.conn:
+            for table in ("monitor_targets", "monitor_roles", "monitor_members", "monitor_states", "monitor_changes"):
+                self.conn.execute(f"DELETE FROM {table} WHERE target_key = ?", (key,))
+
+    def targets(self, keys=None):
+        with self.lock:
+            rows = self.conn.execute("SELECT target_key, kind, target_id, title, config, created_at, last_run FROM monitor_targets ORDER BY created_at").fetchall()
+        return [{"key": r[0], "kind": r[1], "target_id": r[2], "title": r[3], "config": json.loads(r[4]), "created_at": r[5], "last_run": r[6]} for r in rows if keys is None or r[0] in keys]
+
+    def role_state(self, key):
+        with self.lock:
+            rows = self.conn.execute("SELECT role_id, member_count, fetched_at FROM monitor_roles WHERE target_key = ?", (key,)).fetchall()
+        return {r[0]: (r[1], r[2]) for r in rows}
+
+    def members(self, key):
+        """回傳 {user ID: (名稱, 階層 ID, 關聯)}"""
+        with self.lock:
+            rows = self.conn.execute("SELECT user_id, user_name, role_id, relation FROM monitor_members WHERE target_key = ?", (key,)).fetchall()
+        return {r[0]: (r[1], r[2], r[3]) for r in rows}
+
+    def states(self, key):
+        """回傳 {user ID: (預警名冊職位簽章, {群組 ID: [名稱, 職位, 階級, 命中類型]}, 上次查詢時間)}；沒有紀錄者視為 ("", {}, 0)"""
+        with self.lock:
+            rows = self.conn.execute("SELECT user_id, sig, groups, checked_at FROM monitor_states WHERE target_key = ?", (key,)).fetchall()
+        return {r[0]: (r[1], {int(g): v for g, v in json.loads(r[2]).items()}, r[3] or 0) for r in rows}
+
+    def save_run(self, key, members, roles, states, departed, events):
+        """一次寫入本輪結果：完整成員快照、有重抓的階層、有變動的成員狀態與變動事件"""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM monitor_members WHERE target_key = ?", (key,))
+            self.conn.executemany("INSERT INTO monitor_members VALUES (?, ?, ?, ?, ?)", [(key, uid, m["name"], m.get("role_id"), m["rel"]) for uid, m in members.items()])
+            self.conn.executemany("INSERT OR REPLACE INTO monitor_roles VALUES (?, ?, ?, ?)", [(key, rid, count, fetched_at) for rid, (count, fetched_at) in roles.items()])
+            self.conn.executemany("DELETE FROM monitor_states WHERE target_key = ? AND user_id = ?", [(key, uid) for uid in departed])
+            self.conn.executemany("DELETE FROM monitor_states WHERE target_key = ? AND user_id = ?", [(key, uid) for uid, (sig, groups) in states.items() if not sig and not groups])
+            self.conn.executemany("INSERT OR REPLACE INTO monitor_states VALUES (?, ?, ?, ?, ?)", [(key, uid, sig, json.dumps(groups, ensure_ascii=False), now) for uid, (sig, groups) in states.items() if sig or groups])
+            self.conn.executemany("INSERT INTO monitor_changes VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [(key, e["ts"], e["user_id"], e["user_name"], e["change"], e.get("group_id"), e.get("group_name"), e["detail"]) for e in events])
+            self.conn.execute("UPDATE monitor_targets SET last_run = ? WHERE target_key = ?", (now, key))
+
+    def changes(self, key=None, limit=500):
+        sql = "SELECT c.ts, t.title, c.user_id, c.user_name, c.change, c.group_id, c.group_name, c.detail FROM monitor_changes c JOIN monitor_targets t USING (target_key)"
+        with self.lock:
+            return self.conn.execute(sql + (" WHERE c.target_key = ?" if key else "") + " ORDER BY c.ts DESC, c.rowid DESC LIMIT ?", ((key, limit) if key else (limit,))).fetchall()
+
+def get_monitor_store():
+    return MonitorStore(CACHE_DB_PATH)
+
+MONITOR_STORE = LazyStore(get_monitor_store)
+
+# ================= 分片掃描佇列 =================
+class ShardQueue:
+    """分片掃描的工作佇列 (SQLite 檔案即佇列後端，可由同一台主機上的多個行程共用；不支援網路磁碟)
+
+    一個分片是「某階層從某個游標開始的 SHARD_PAGES 頁成員」；worker 抓完分片的成員頁後立即把下一段游標排成新分片，
+    其他 worker 即可平行接手。分片以租約派發並由心跳延長，worker 當機時租約過期後自動重新派發；
+    每位成員的檢查結果寫入 shard_results (同一人只保留一筆)，已檢查者在重新派發時直接略過。
+    """
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS shard_sweeps (sweep_id TEXT PRIMARY KEY, group_id INTEGER, config TEXT, created_at REAL)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS shard_tasks (sweep_id TEXT, role_id INTEGER, cursor TEXT, rank INTEGER, status TEXT, worker TEXT, token TEXT, lease_until REAL, attempts INTEGER, updated_at REAL, PRIMARY KEY (sweep_id, role_id, cursor))")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS shard_results (sweep_id TEXT, user_id INTEGER, report TEXT, worker TEXT, PRIMARY KEY (sweep_id, user_id))")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS shard_workers (worker_id TEXT PRIMARY KEY, sweep_id TEXT, host TEXT, pid INTEGER, last_seen REAL, shards_done INTEGER, members_done INTEGER)")
+
+    def open_sweep(self, sweep_id, group_id, roles, warning_group_ids, ally_only=False):
+        """建立分片掃描 (每個階層一個起始分片)；已存在時沿用原本的佇列與結果，並讓先前失敗的分片重新排隊"""
+        config = json.dumps({"roles": roles, "warning_ids": sorted(int(g) for g in warning_group_ids), "ally_only": ally_only}, ensure_ascii=False)
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO shard_sweeps VALUES (?, ?, ?, ?)", (sweep_id, int(group_id), config, now))
+            self.conn.executemany("INSERT OR IGNORE INTO shard_tasks VALUES (?, ?, '', ?, 'queued', NULL, NULL, 0, 0, ?)", [(sweep_id, r["id"], r.get("rank", 0), now) for r in roles if r.get("memberCount")])
+            # 續掃時 (按「繼續」) 重新給失敗的分片完整的租用次數
+            self.conn.execute("UPDATE shard_tasks SET status = 'queued', attempts = 0, lease_until = NULL, updated_at = ? WHERE sweep_id = ? AND status = 'failed'", (now, sweep_id))
+
+    def reset_sweep(self, sweep_id):
+        with self.lock, self.conn:
+            for table in ("shard_sweeps", "shard_tasks", "shard_results"):
+                self.conn.execute(f"DELETE FROM {table} WHERE sweep_id = ?", (sweep_id,))
+
+    def sweep(self, sweep_id):
+        with self.lock:
+            row = self.conn.execute("SELECT group_id, config FROM shard_sweeps WHERE sweep_id = ?", (sweep_id,)).fetchone()
+        return {"sweep_id": sweep_id, "group_id": row[0], **json.loads(row[1])} if row else None
+
+    def enqueue(self, sweep_id, role, cursor):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO shard_tasks VALUES (?, ?, ?, ?, 'queued', NULL, NULL, 0, 0, ?)", (sweep_id, role["id"], cursor, role.get("rank", 0), time.time()))
+
+    def lease(self, worker_id, sweep_id=None):
+        """租用一個待處理 (或租約已過期) 的分片，階級高的階層優先；沒有可租用的分片時回傳 None"""
+        token, now = uuid.uuid4().hex, time.time()
+        where = "(status = 'queued' OR (status = 'leased' AND lease_until < ?)) AND attempts < ?" + (" AND sweep_id = ?" if sweep_id else "")
+        params = [now, SHARD_MAX_ATTEMPTS] + ([sweep_id] if sweep_id else [])
+        with self.lock, self.conn:
+            # 單一 UPDATE 在 SQLite 寫入鎖內完成，多個行程同時租用也不會拿到同一個分片
+            self.conn.execute(f"UPDATE shard_tasks SET status = 'leased', worker = ?, token = ?, lease_until = ?, attempts = attempts + 1, updated_at = ? WHERE rowid = (SELECT rowid FROM shard_tasks WHERE {where} ORDER BY rank DESC, updated_at LIMIT 1)",
+                              [worker_id, token, now + SHARD_LEASE_SECONDS, now, *params])
+            row = self.conn.execute("SELECT sweep_id, role_id, cursor, attempts FROM shard_tasks WHERE token = ?", (token,)).fetchone()
+            self._expire(now)
+        return {"sweep_id": row[0], "role_id": row[1], "cursor": row[2], "attempts": row[3], "token": token} if row else None
+
+    def _expire(self, now):
+        # 租用次數用盡仍未完成的分片標記為失敗
+        self.conn.execute("UPDATE shard_tasks SET status = 'failed' WHERE attempts >= ? AND (status = 'queued' OR (status = 'leased' AND lease_until < ?))", (SHARD_MAX_ATTEMPTS, now))
+
+    def heartbeat(self, worker_id, sweep_id, shard=None):
+        """更新 worker 狀態並延長 shard 的租約；回傳 False 代表租約已被其他 worker 接手，應停止處理此分片"""
+        now = time.time()
+        with self.lock, self.conn:
+            renewed = self.conn.execute("UPDATE shard_tasks SET lease_until = ? WHERE token = ? AND status = 'leased'", (now + SHARD_LEASE_SECONDS, shard["token"])).rowcount if shard else 0
+            self.conn.execute("INSERT INTO shard_workers VALUES (?, ?, ?, ?, ?, 0, 0) ON CONFLICT (worker_id) DO UPDATE SET sweep_id = excluded.sweep_id, last_seen = excluded.last_seen",
+                              (worker_id, sweep_id, socket.gethostname(), os.getpid(), now))
+        return bool(renewed)
+
+    def complete(self, shard, worker_id, members_done):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE shard_tasks SET status = 'done', lease_until = NULL, updated_at = ? WHERE token = ?", (time.time(), shard["token"]))
+            self.conn.execute("UPDATE shard_workers SET shards_done = shards_done + 1, members_done = members_done + ? WHERE worker_id = ?", (members_done, worker_id))
+
+    def release(self, shard, failed=False):
+        """交還分片讓它稍後重新派發；failed 為處理失敗 (例如成員頁抓取失敗) 時才計入租用次數，主動停止時退回這次租用"""
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE shard_tasks SET status = 'queued', lease_until = NULL, attempts = attempts - ?, updated_at = ? WHERE token = ? AND status = 'leased'", (0 if failed else 1, time.time(), shard["token"]))
+
+    def processed_ids(self, sweep_id, user_ids):
+        user_ids, seen = [int(u) for u in user_ids], set()
+        with self.lock:
+            # 分批查詢，避免超過 SQLite 參數數量上限
+            for i in range(0, len(user_ids), 500):
+                chunk = user_ids[i:i + 500]
+                seen.update(r[0] for r in self.conn.execute(f"SELECT user_id FROM shard_results WHERE sweep_id = ? AND user_id IN ({','.join('?' * len(chunk))})", [sweep_id, *chunk]))
+        return seen
+
+    def record_results(self, sweep_id, worker_id, results):
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO shard_results VALUES (?, ?, ?, ?)", [(sweep_id, int(uid), json.dumps(report, ensure_ascii=False) if report else None, worker_id) for uid, report in results])
+
+    def results_since(self, sweep_id, after_rowid=0, limit=5000):
+        """回傳 [(rowid, user ID, 預警報告或 None)]，供協調者增量合併"""
+        with self.lock:
+            rows = self.conn.execute("SELECT rowid, user_id, report FROM shard_results WHERE sweep_id = ? AND rowid > ? ORDER BY rowid LIMIT ?", (sweep_id, after_rowid, limit)).fetchall()
+        return [(r[0], r[1], json.loads(r[2]) if r[2] else None) for r in rows]
+
+    def stats(self, sweep_id):
+        """回傳 {"queued", "leased", "done", "failed", "processed", "alerts", "workers": [...]}"""
+        now = time.time()
+        with self.lock:
+            # 租約已過期的分片視為待處理
+            counts = dict(self.conn.execute("SELECT CASE WHEN status = 'leased' AND lease_until < ? THEN 'queued' ELSE status END AS s, COUNT(*) FROM shard_tasks WHERE sweep_id = ? GROUP BY s", (now, sweep_id)).fetchall())
+            processed, alerts = self.conn.execute("SELECT COUNT(*), COUNT(report) FROM shard_results WHERE sweep_id = ?", (sweep_id,)).fetchone()
+            workers = self.conn.execute("SELECT worker_id, host, pid, last_seen, shards_done, members_done FROM shard_workers WHERE sweep_id = ? AND last_seen > ? ORDER BY worker_id", (sweep_id, now - SHARD_LEASE_SECONDS)).fetchall()
+        return {**{k: counts.get(k, 0) for k in ("queued", "leased", "done", "failed")}, "processed": processed, "alerts": alerts,
+                "workers": [dict(zip(("worker_id", "host", "pid", "last_seen", "shards_done", "members_done"), w)) for w in workers]}
+
+    def finished(self, sweep_id):
+        """沒有待處理或處理中的分片 (租用次數用盡者已標記為失敗)"""
+        with self.lock, self.conn:
+            self._expire(time.time())
+            return self.conn.execute("SELECT 1 FROM shard_tasks WHERE sweep_id = ? AND status IN ('queued', 'leased') LIMIT 1", (sweep_id,)).fetchone() is None
+
+def get_shard_queue():
+    return ShardQueue(SHARD_DB_PATH)
+
+SHARD_QUEUE = LazyStore(get_shard_queue)
+
+# ================= 命中結果欄式索引 =================
+class AlertTable:
+    """命中結果的欄式索引：只追加、可增量同步；篩選只讀欄位資料，完整報告僅在繪製可見列時取用"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reports, self.user_ids, self.names, self.core_ids, self.max_ranks = [], [], [], [], []
+        self.group_names = {}  # 核心社群 ID -> 名稱 (篩選選項)
+        self.derived = {}      # 由呼叫端函數計算、增量補齊的欄位 (例如格式化字串)
+        self.aggregates = {}   # 名稱 -> (計算時的列數, 彙總結果)；有新命中加入才重新計算
+
+    def __len__(self):
+        return len(self.reports)
+
+    def sync(self, alerts):
+        """把 alerts (只會追加的清單) 中尚未收錄的報告加入索引"""
+        with self.lock:
+            for report in alerts[len(self.reports):]:
+                cores = report.get("core_groups") or []
+                self.reports.append(report)
+                self.user_ids.append(str(report["user_id"]))
+                self.names.append(str(report["user_name"]).lower())
+                self.core_ids.append(frozenset(g["group_id"] for g in cores))
+                self.max_ranks.append(max((int(g["rank_num"]) for g in cores + (report.get("ally_only_groups") or [])), default=0))
+                for g in cores: self.group_names.setdefault(g["group_id"], g["group_name"])
+        return self
+
+    def query(self, group_ids=None, min_rank=0, text="", by_rank=False):
+        """回傳符合條件的列索引 (group_ids 為核心社群任一命中；text 比對名稱或 ID 前綴)"""
+        with self.lock:
+            rows = range(len(self.reports))
+            if group_ids:
+                group_ids = set(group_ids)
+                rows = [i for i in rows if self.core_ids[i] & group_ids]
+            if min_rank: rows = [i for i in rows if self.max_ranks[i] >= min_rank]
+            text = text.strip().lower()
+            if text: rows = [i for i in rows if text in self.names[i] or self.user_ids[i].startswith(text)]
+            if by_rank: rows = sorted(rows, key=lambda i: -self.max_ranks[i])
+            return list(rows)
+
+    def column(self, name, fn):
+        """取得衍生欄位 fn(report)，只計算新加入的列"""
+        with self.lock:
+            col = self.derived.setdefault(name, [])
+            col.extend(fn(r) for r in self.reports[len(col):])
+            return col[:]
+
+    def aggregate(self, name, fn):
+        """取得整體彙總 fn(reports) (例如總結報告的表格)；列數沒變時直接回傳上次的結果"""
+        with self.lock:
+            rows, cached = len(self.reports), self.aggregates.get(name)
+            if cached and cached[0] == rows: return cached[1]
+            reports = self.reports[:]
+        value = fn(reports)
+        with self.lock: self.aggregates[name] = (rows, value)
+        return value
+
+# ================= 背景工作執行器 =================
+class ScanJob:
+    """一個在背景執行的掃描工作：進度、部分命中結果與各分頁自訂資料，供 UI 輪詢讀取"""
+    def __init__(self, job_id, kind, title, key=None):
+        self.id, self.kind, self.title, self.key = job_id, kind, title, key
+        self.status = "queued"
+        self.stage = "排隊中..."
+        self.error = None
+        self.done, self.total = 0, None
+        self.alerts, self.data = [], {}
+        self.results = AlertTable()  # alerts 的欄式索引，由結果畫面增量同步
+        self.created_at = time.time()
+        self.progress_started = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def start_progress(self, total, stage="交叉比對中..."):
+        self.total, self.done, self.stage = total, 0, stage
+        self.progress_started = time.time()
+
+    def advance(self, alert=None):
+        self.done += 1
+        if alert:
+            self.alerts.append(alert)
+            ALERT_STORE.record(self.id, self.kind, self.title, [alert])
+
+    def eta(self):
+        """依目前完成速度估算剩餘秒數 (尚無進度時回傳 None)"""
+        if not self.total or not self.done or not self.progress_started: return None
+        elapsed = time.time() - self.progress_started
+        return int(elapsed / self.done * max(self.total - self.done, 0))
+
+    def fail(self, message):
+        self.status, self.error = "failed", message
+
+    def snapshot(self):
+        """輪詢用的狀態摘要 (不含命中報告內容)"""
+        return {"id": self.id, "kind": self.kind, "title": self.title, "status": self.status, "stage": self.stage, "done": self.done, "total": self.total, "eta": self.eta(), "alerts": len(self.alerts), "error": self.error}
+
+class JobRunner:
+    """伺服器行程內共用的背景工作池；所有工作共用同一組 API 限速器
+
+    持續輪詢的監控 (dedicated=True) 各自使用獨立執行緒，不佔用 JOB_WORKERS 個掃描名額。
+    """
+    def __init__(self, max_workers, history):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scan-job")
+        self.history = history
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, kind, title, fn, *args, key=None, dedicated=False):
+        """送出工作並回傳工作 ID；相同 key 的工作仍在執行時直接共用該工作"""
+        with self.lock:
+            if key:
+                for job in self.jobs.values():
+                    if job.key == key and job.active: return job.id
+            job = ScanJob(uuid.uuid4().hex[:12], kind, title, key)
+            self.jobs[job.id] = job
+            finished = [j for j in self.jobs.values() if not j.active]
+            for old in sorted(finished, key=lambda j: j.created_at)[:max(0, len(self.jobs) - self.history)]:
+                del self.jobs[old.id]
+        if dedicated: threading.Thread(target=self._run, args=(job, fn, args), daemon=True, name=f"poller-{job.id}").start()
+        else: self.pool.submit(self._run, job, fn, args)
+        return job.id
+
+    def _run(self, job, fn, args):
+        job.status = "running"
+        try:
+            # 每個工作在全新的 context 中執行，前一個工作設定的請求計數器不會殘留在共用執行緒上
+            contextvars.Context().run(fn, job, *args)
+            if job.status == "running": job.status = "cancelled" if job.cancelled else "done"
+        except Exception as e:
+            job.fail(f"{type(e).__name__}: {e}")
+        job.finished_at = time.time()
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def list_jobs(self):
+        with self.lock:
+            return sorted(self.jobs.values(), key=lambda j: j.created_at, reverse=True)
+
+def get_job_runner():
+    return JobRunner(JOB_WORKERS, JOB_HISTORY)
+
+JOB_RUNNER = get_job_runner()
+
+# === API 抓取與工具函數 ===
+
+def get_short_name(full_name):
+    match = re.search(r'\[(.*?)\]', full_name)
+    if match: return match.group(1)
+    return full_name
+
+def resolve_user_input(user_input):
+    user_input = str(user_input).strip()
+    url_username_to_id = "https://users.roblox.com/v1/usernames/users"
+    payload = {"usernames": [user_input], "excludeBannedUsers": False}
+    try:
+        response = roblox_request("POST", url_username_to_id, json=payload)
+        if response is not None and response.status_code == 200:
+            data = response.json().get("data", [])
+            if len(data) > 0: return str(data[0]["id"]), data[0]["name"]
+    except: pass 
+    if user_input.isdigit():
+        url_verify_id = f"https://users.roblox.com/v1/users/{user_input}"
+        try:
+            res = roblox_get(url_verify_id)
+            if res is not None and res.status_code == 200: return str(res.json()["id"]), res.json()["name"]
+        except: pass
+    return None, None
+
+def resolve_user_inputs(user_inputs):
+    """批次解析多個玩家名稱或 ID (回傳 {輸入: (user ID, 名稱)}，無法解析者不列入)
+
+    名稱每 USERNAME_BATCH_SIZE 個一次 POST 查詢；名稱查不到的純數字輸入再當作 ID，以 POST /v1/users 批次驗證。
+    """
+    inputs = list(dict.fromkeys(str(u).strip() for u in user_inputs if str(u).strip()))
+    resolved = {}
+    for i in range(0, len(inputs), USERNAME_BATCH_SIZE):
+        payload = {"usernames": inputs[i:i + USERNAME_BATCH_SIZE], "excludeBannedUsers": False}
+        try:
+            res = roblox_request("POST", "https://users.roblox.com/v1/usernames/users", json=payload)
+            if res is None or res.status_code != 200: continue
+            for item in res.json().get("data", []):
+                resolved[item["requestedUsername"].lower()] = (str(item["id"]), item["name"])
+        except Exception: pass
+    found = {u: resolved[u.lower()] for u in inputs if u.lower() in resolved}
+    ids = [u for u in inputs if u not in found and u.isdigit()]
+    profiles = get_user_profiles(ids) if ids else {}
+    found.update({u: (u, profiles[int(u)]["name"]) for u in ids if int(u) in profiles})
+    return {u: found[u] for u in inputs if u in found}
+
+def get_user_thumbnail(user_id):
+    return get_user_thumbnails([user_id]).get(int(user_id), DEFAULT_AVATAR_URL)
+
+def get_user_thumbnails(user_ids):
+    """批次獲取玩家頭像，每次最多 THUMBNAIL_BATCH_SIZE 人 (回傳 {user_id: imageUrl})"""
+    ids = list(dict.fromkeys(int(u) for u in user_ids))
+    thumbs = {}
+    for i in range(0, len(ids), THUMBNAIL_BATCH_SIZE):
+        chunk = ids[i:i + THUMBNAIL_BATCH_SIZE]
+        url = f"https://thumbnails.roblox.com/v1/users/avatar-headshot?userIds={','.join(map(str, chunk))}&size={HEADSHOT_PARAMS['size']}&format={HEADSHOT_PARAMS['format']}&isCircular={str(HEADSHOT_PARAMS['isCircular']).lower()}"
+        try:
+            res = roblox_get(url, timeout=5).json()
+            for item in res.get("data", []):
+                if item.get("imageUrl"): thumbs[item["targetId"]] = item["imageUrl"]
+        except Exception: pass
+    return thumbs
+
+def resolve_alert_avatars(alerts):
+    """為尚未有頭像的預警報告批次補上 avatar_url"""
+    missing = [a["user_id"] for a in alerts if not a.get("avatar_url")]
+    if not missing: return alerts
+    thumbs = get_user_thumbnails(missing)
+    for a in alerts:
+        if not a.get("avatar_url"): a["avatar_url"] = thumbs.get(int(a["user_id"]), DEFAULT_AVATAR_URL)
+    return alerts
+
+def get_user_profiles(user_ids):
+    """批次獲取玩家名稱與顯示名稱，優先讀取快取 (回傳 {user_id: {"name", "displayName"}})"""
+    ids = list(dict.fromkeys(int(u) for u in user_ids))
+    found, stale = CACHE.get_many("profiles", ids)
+    if stale: CACHE.revalidate("profiles", stale, _fetch_user_profiles)
+    found.update({str(k): v for k, v in _fetch_user_profiles([u for u in ids if str(u) not in found]).items()})
+    return {u: found[str(u)] for u in ids if str(u) in found}
+
+def _fetch_user_profiles(user_ids):
+    """透過 POST /v1/users 每次查詢 PROFILE_BATCH_SIZE 人，並寫入快取"""
+    ids, profiles = [int(u) for u in user_ids], {}
+    for i in range(0, len(ids), PROFILE_BATCH_SIZE):
+        payload = {"userIds": ids[i:i + PROFILE_BATCH_SIZE], "excludeBannedUsers": False}
+        try:
+            res = roblox_request("POST", "https://users.roblox.com/v1/users", json=payload, timeout=5)
+            if res is None or res.status_code != 200: continue
+            for item in res.json().get("data", []):
+                profiles[item["id"]] = {"name": item.get("name"), "displayName": item.get("displayName")}
+        except Exception: pass
+    if profiles: CACHE.set_many("profiles", profiles)
+    return profiles
+
+def get_user_detail(user_id):
+    """獲取單一玩家完整資料 (簡介、建立日期、封鎖狀態)，並順便寫入名稱快取"""
+    try:
+        res = roblox_get(f"https://users.roblox.com/v1/users/{user_id}", timeout=5)
+        if res is not None and res.status_code == 200:
+            detail = res.json()
+            CACHE.set_many("profiles", {detail["id"]: {"name": detail.get("name"), "displayName": detail.get("displayName")}})
+            return detail
+    except Exception: pass
+    return {}
+
+def enrich_alert_names(alerts):
+    """將預警報告的 user_name 批次改寫為「顯示名稱 (@帳號名稱)」"""
+    profiles = get_user_profiles([a["user_id"] for a in alerts])
+    for a in alerts:
+        profile = profiles.get(int(a["user_id"]))
+        if profile: a["user_name"] = f"{profile.get('displayName', '')} (@{profile.get('name') or a['user_name']})"
+    return alerts
+
+def get_user_groups(user_id):
+    items = CACHE.get_or_fetch("user_groups", user_id, lambda: _fetch_user_groups(user_id))
+    return {gid: info for gid, info in items} if items else {}
+
+def _fetch_user_groups(user_id):
+    url = f"https://groups.roblox.com/v1/users/{user_id}/groups/roles"
+    try:
+        response = roblox_get(url)
+        if response is not None and response.status_code == 200:
+            data = response.json().get("data", [])
+            # 以 [group_id, info] 清單保存，避免 JSON 把整數 key 轉成字串
+            return [[item["group"]["id"], {"name": item["group"]["name"], "role": item["role"]["name"], "rank": item["role"]["rank"]}] for item in data]
+    except Exception: pass
+    return None
+
+def get_group_allies(group_id):
+    items = CACHE.get_or_fetch("group_allies", group_id, lambda: _fetch_group_allies(group_id))
+    return {gid: name for gid, name in items} if items else {}
+
+def _fetch_group_allies(group_id):
+    allies = []
+    start_row = 0
+    while True:
+        url = f"https://groups.roblox.com/v1/groups/{group_id}/relationships/allies?maxRows=100&startRowIndex={start_row}"
+        try:
+            response = roblox_get(url)
+            if response is None or response.status_code != 200: return None
+            data = response.json()
+            allies.extend([grp["id"], grp["name"]] for grp in data.get("relatedGroups", []))
+            next_row = data.get("nextRowIndex")
+            if not next_row: break
+            start_row = next_row
+        except Exception: return None
+    return allies
+
+def _iter_user_pages(url_base):
+    """依 nextPageCursor 逐頁產出好友 / 關注 / 粉絲的原始資料；某頁抓取失敗時產出 None 後結束"""
+    cursor = ""
+    while cursor is not None:
+        url = url_base + (f"&cursor={cursor}" if cursor else "")
+        try:
+            res = roblox_get(url)
+            if res is None or res.status_code != 200: yield None; return
+            json_data = res.json()
+        except Exception:
+            yield None; return
+        yield json_data.get("data", [])
+        cursor = json_data.get("nextPageCursor")
+
+def _paginate_users(url_base, limit=None):
+    """逐頁抓取好友 / 關注 / 粉絲清單 (回傳 (清單, 是否完整抓完))"""
+    users = []
+    for page in _iter_user_pages(url_base):
+        if page is None: return users, False
+        users.extend([{"id": u["id"], "name": u["name"]} for u in page])
+        if limit and len(users) >= limit: break
+    return (users[:limit] if limit else users), True
+
+# 【修正重點】加入 cursor 循環，確保好友不論人數多寡都能掃描完畢
+def get_user_friends(user_id):
+    def fetch():
+        friends, complete = _paginate_users(f"https://friends.roblox.com/v1/users/{user_id}/friends?limit=100")
+        return friends if complete else None
+    return CACHE.get_or_fetch("friends", user_id, fetch) or []
+
+def get_user_followers(user_id, limit=None):
+    return _paginate_users(f"https://friends.roblox.com/v1/users/{user_id}/followers?limit=100", limit)[0]
+
+def get_user_followings(user_id, limit=None):
+    return _paginate_users(f"https://friends.roblox.com/v1/users/{user_id}/followings?limit=100", limit)[0]
+
+def get_group_roles(group_id):
+    return CACHE.get_or_fetch("group_roles", group_id, lambda: _fetch_group_roles(group_id)) or []
+
+def _fetch_group_roles(group_id):
+    url = f"https://groups.roblox.com/v1/groups/{group_id}/roles"
+    try:
+        res = roblox_get(url)
+        if res is not None and res.status_code == 200: return res.json().get("roles", [])
+    except Exception: pass
+    return None
+def get_game_details(place_id):
+    """獲取遊戲基本資訊 (Universe ID, 名稱, 總人數)"""
+    # 步驟 1: 獲取 Universe ID
+    u_url = f"https://apis.roblox.com/universes/v1/places/{place_id}/universe"
+    try:
+        u_res = roblox_get(u_url).json()
+        u_id = u_res.get("universeId")
+        if not u_id: return None
+        
+        # 步驟 2: 獲取詳細遊戲數據
+        g_url = f"https://games.roblox.com/v1/games?universeIds={u_id}"
+        g_res = roblox_get(g_url).json()
+        if g_res.get("data") and len(g_res["data"]) > 0:
+            data = g_res["data"][0]
+            # 手動補入 universeId，防止後續讀取時發生 KeyError
+            data['universeId'] = u_id 
+            return data
+    except Exception: pass
+    return None
+def get_game_servers(place_id, max_pages=GAME_SERVER_MAX_PAGES):
+    """沿 nextPageCursor 翻完特定遊戲的公開伺服器清單，回傳 (伺服器清單, 是否完整)"""
+    servers, cursor = {}, ""
+    for _ in range(max_pages):
+        url = f"https://games.roblox.com/v1/games/{place_id}/servers/Public?limit={GAME_SERVER_PAGE_SIZE}&cursor={cursor}"
+        try:
+            res = roblox_get(url)
+            # 重試後仍被限流或其他錯誤時視為不完整，避免把沒抓到的伺服器誤判為關閉
+            if res is None or res.status_code != 200: return list(servers.values()), False
+            res = res.json()
+        except Exception:
+            return list(servers.values()), False
+        # 翻頁期間伺服器可能換頁位置，以 ID 去重
+        for s in res.get("data", []): servers[s["id"]] = s
+        cursor = res.get("nextPageCursor")
+        if not cursor: return list(servers.values()), True
+    return list(servers.values()), False
+
+def summarize_game_servers(servers, complete):
+    """單次快照的彙總數據 (人數、容量、平均延遲與 FPS)"""
+    pings = [s["ping"] for s in servers if s.get("ping") is not None]
+    fps = [s["fps"] for s in servers if s.get("fps") is not None]
+    return {
+        "playing": sum(s.get("playing", 0) for s in servers), "servers": len(servers),
+        "capacity": sum(s.get("maxPlayers", 0) for s in servers),
+        "avg_ping": sum(pings) / len(pings) if pings else None, "avg_fps": sum(fps) / len(fps) if fps else None,
+        "complete": complete,
+    }
+
+def diff_game_servers(prev, cur):
+    """比較前後兩次快照 ({伺服器 ID: 人數})：新開、關閉與人數變動的伺服器"""
+    return {
+        "opened": [(sid, n) for sid, n in cur.items() if sid not in prev],
+        "closed": [(sid, n) for sid, n in prev.items() if sid not in cur],
+        "changed": [(sid, n, n - prev[sid]) for sid, n in cur.items() if sid in prev and n != prev[sid]],
+    }
+
+def resolve_player_tokens(tokens, max_workers=SCAN_WORKERS):
+    """透過 thumbnails 批次端點把伺服器的 playerTokens 換成頭像 URL (回傳 {token: imageUrl}，尚未產生的頭像不回傳)"""
+    tokens = list(dict.fromkeys(tokens))
+    chunks = [tokens[i:i + THUMBNAIL_BATCH_SIZE] for i in range(0, len(tokens), THUMBNAIL_BATCH_SIZE)]
+
+    def fetch(chunk):
+        payload = [{"requestId": t, "token": t, "type": "AvatarHeadshot", **HEADSHOT_PARAMS} for t in chunk]
+        try:
+            res = roblox_request("POST", "https://thumbnails.roblox.com/v1/batch", json=payload, timeout=10)
+            if res is None or res.status_code != 200: return {}
+            return {item["requestId"]: item["imageUrl"] for item in res.json().get("data", []) if item.get("state") == "Completed" and item.get("imageUrl")}
+        except Exception: return {}
+
+    resolved = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for part in pool.map(fetch, chunks): resolved.update(part)
+    return resolved
+
+def get_game_thumbnail(universe_id):
+    """獲取遊戲封面圖"""
+    url = f"https://thumbnails.roblox.com/v1/games/icons?universeIds={universe_id}&returnPolicy=PlaceHolder&size=150x150&format=Png&isCircular=false"
+    try:
+        res = roblox_get(url).json()
+        if res.get("data"): return res["data"][0].get("imageUrl")
+    except: pass
+    return DEFAULT_AVATAR_URL
+
+def iter_role_member_pages(group_id, roles, start_cursors=None):
+    """逐頁產出 (階層, 成員清單, 下一頁游標)；某頁抓取失敗時產出 (階層, None, 目前游標) 後結束"""
+    for role in roles:
+        cursor = (start_cursors or {}).get(role["id"], "")
+        while cursor is not None:
+            page, next_cursor = fetch_role_members_page(group_id, role, cursor)
+            yield role, page, next_cursor
+            if page is None: return
+            cursor = next_cursor
+
+def fetch_role_members_page(group_id, role, cursor=""):
+    """抓取單一階層的一頁成員 (回傳 (成員清單, 下一頁游標))；失敗時成員清單為 None"""
+    role_id, role_name, role_rank = role["id"], role["name"], role.get("rank", 0)
+    url = f"https://groups.roblox.com/v1/groups/{group_id}/roles/{role_id}/users?sortOrder=Desc&limit=100" + (f"&cursor={cursor}" if cursor else "")
+    try:
+        res = roblox_get(url)
+        if res is None or res.status_code != 200: return None, cursor
+        data = res.json()
+        members = []
+        for item in data.get("data", []):
+            uid = item.get("userId") or item.get("user", {}).get("userId")
+            uname = item.get("username") or item.get("user", {}).get("username")
+            if uid and uname: members.append({"id": uid, "name": uname, "rank_name": role_name, "rank_num": role_rank})
+        return members, data.get("nextPageCursor")
+    except Exception: return None, cursor
+
+def _stale_roster_roles(group_id, roles):
+    """找出名冊需要重新抓取的階層：從未抓過、超過 ROSTER_TTL，或成員數已變動"""
+    state, now = ROSTER_STORE.role_state(group_id), time.time()
+    stale = []
+    for role in roles:
+        if not role.get("memberCount"): continue
+        saved = state.get(role["id"])
+        if not saved or saved[0] != role["memberCount"] or now - saved[1] > ROSTER_TTL: stale.append(role)
+    return stale
+
+def plan_scan_strategy(candidate_count, warning_group_ids, ally_only=False):
+    """比較兩種比對方式的 API 成本，回傳 ("roster" 或 "per_user", 名冊需抓取的頁數)
+
+    逐人查詢每位候選人需要一次 get_user_groups；名冊反查則只需把預警社群中過期的階層重新分頁抓一次。
+    超過 ROSTER_MAX_MEMBERS 的大型社群，或需要同盟比對 (ally_only) 時，一律逐人查詢。
+    """
+    if ally_only or not candidate_count: return "per_user", 0
+    pages = 0
+    for gid in warning_group_ids:
+        roles = get_group_roles(gid)
+        if not roles or sum(r.get("memberCount", 0) for r in roles) > ROSTER_MAX_MEMBERS: return "per_user", 0
+        pages += sum(-(-r["memberCount"] // 100) for r in _stale_roster_roles(gid, roles)) + 1
+    return ("roster" if pages < candidate_count else "per_user"), pages
+
+def load_warning_roster(warning_group_ids):
+    """增量同步預警社群名冊 (只重抓有變動或過期的階層) 後回傳所有成員 ID；任一社群同步失敗時回傳 None"""
+    # 多個掃描同時開始時只由一個執行緒同步名冊，其他掃描等待並共用結果
+    return SINGLE_FLIGHT.do(("roster", tuple(sorted(warning_group_ids))), lambda: _sync_warning_roster(warning_group_ids), "roster")
+
+def _sync_warning_roster(warning_group_ids):
+    for gid in warning_group_ids:
+        roles = _fetch_group_roles(gid)
+        if roles is None: return None
+        CACHE.set_many("group_roles", {gid: roles})
+        for role in _stale_roster_roles(gid, roles):
+            user_ids = []
+            for _, page, _ in iter_role_member_pages(gid, [role]):
+                if page is None: return None
+                user_ids.extend(m["id"] for m in page)
+            ROSTER_STORE.replace_role(gid, role["id"], role["memberCount"], user_ids)
+    return ROSTER_STORE.member_ids(warning_group_ids)
+
+class WarningIndex:
+    """每次掃描建立一次的預警索引：核心社群集合、同盟社群 -> 所屬預警核心社群、目標社群 (A) 的同盟集合
+
+    roster 為預警社群全體成員 ID (名冊反查模式)；設定後不在名冊中的人員不必查詢即可判定未命中。
+    """
+    def __init__(self, core_ids, ally_to_cores, scanned_allies, ally_only=False, roster=None):
+        self.core_ids = frozenset(core_ids)
+        self.ally_to_cores = ally_to_cores
+        self.scanned_allies = frozenset(scanned_allies)
+        self.ally_only = ally_only
+        self.roster = roster
+
+def build_warning_index(warning_group_ids, scanned_group_id=None, ally_only=False):
+    """查詢每個預警核心社群的同盟並反轉成 {同盟 ID: {核心 ID, ...}}；ally_only 時也標記只加入同盟者"""
+    ally_to_cores = {}
+    for core_id in warning_group_ids:
+        for ally_id in get_group_allies(core_id):
+            ally_to_cores.setdefault(ally_id, set()).add(core_id)
+    scanned_allies = get_group_allies(scanned_group_id).keys() if scanned_group_id else ()
+    return WarningIndex(warning_group_ids, {k: frozenset(v) for k, v in ally_to_cores.items()}, scanned_allies, ally_only)
+
+def fetch_alert_data(user_id, user_name, relation_type, warning_group_ids, scanned_group_id=None, index=None):
+    index = index or build_warning_index(warning_group_ids, scanned_group_id)
+    user_groups = get_user_groups(user_id)
+    report = build_alert_report(user_id, user_name, relation_type, user_groups, index)
+    if not report: return None
+    WATCHLIST.add_alerts(resolve_alert_avatars([report]))
+    return report
+
+def _badge_data(group_id, g_info):
+    return {"group_id": group_id, "group_name": get_short_name(g_info['name']), "role_name": g_info['role'], "rank_num": g_info['rank']}
+
+def build_alert_report(user_id, user_name, relation_type, user_groups, index):
+    """依已取得的玩家群組資料與預警索引組裝預警報告 (未命中回傳 None；頭像由 resolve_alert_avatars 批次補齊)"""
+    core_hits = [gid for gid in user_groups if gid in index.core_ids]
+    ally_hits = {gid: index.ally_to_cores[gid] for gid in user_groups if gid in index.ally_to_cores}
+    # 只加入同盟、卻不在其任何預警核心社群中的情況
+    ally_only_hits = {gid: cores for gid, cores in ally_hits.items() if not cores.intersection(core_hits)} if index.ally_only else {}
+    if not core_hits and not ally_only_hits: return None
+    report = {"user_name": user_name, "user_id": user_id, "relation": relation_type, "avatar_url": None, "core_groups": [], "ally_groups": [], "ally_only_groups": [], "scanned_ally_groups": [], "grouped_matches": []}
+    for gid in core_hits:
+        core_data = _badge_data(gid, user_groups[gid])
+        report["core_groups"].append(core_data)
+        current_cluster = {"core": core_data, "allies": []}
+        for ally_id, cores in ally_hits.items():
+            if gid in cores:
+                ally_data = _badge_data(ally_id, user_groups[ally_id])
+                report["ally_groups"].append(ally_data); current_cluster["allies"].append(ally_data)
+        report["grouped_matches"].append(current_cluster)
+    for ally_id, cores in ally_only_hits.items():
+        report["ally_only_groups"].append({**_badge_data(ally_id, user_groups[ally_id]), "core_ids": sorted(cores)})
+    report["scanned_ally_groups"] = [_badge_data(gid, user_groups[gid]) for gid in user_groups if gid in index.scanned_allies]
+    return report
+
+def prefetch(iterable, depth):
+    """在背景執行緒預先消耗 iterable (最多領先 depth 個元素)，讓分頁抓取與後續檢查重疊進行"""
+    items, stop, sentinel, error = queue.Queue(maxsize=depth), threading.Event(), object(), []
+
+    def put(item):
+        while not stop.is_set():
+            try: items.put(item, timeout=0.5); return True
+            except queue.Full: continue
+        return False
+
+    def run():
+        try:
+            for item in iterable:
+                if not put(item): return
+        except Exception as e: error.append(e)
+        put(sentinel)
+
+    threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True).start()
+    try:
+        while (item := items.get()) is not sentinel: yield item
+        if error: raise error[0]
+    finally:
+        stop.set()
+
+def scan_people_concurrently(people, index, max_workers=SCAN_WORKERS, enrich_names=False):
+    """並行查詢多名人員的群組，依完成順序逐一產出 (人員, 預警報告或 None)
+
+    people 可以是惰性產生器：最多只有 SCAN_MAX_IN_FLIGHT 人同時排隊，記憶體用量不隨名單長度增長。
+    命中者會暫存起來，累積滿一批或超過 ALERT_FLUSH_INTERVAL 秒後再一次補齊頭像
+    (及 enrich_names 時的顯示名稱) 送出。
+    """
+    people, in_flight, skipped = iter(people), {}, []
+    pending, last_flush = [], time.monotonic()
+
+    def fill():
+        for person in itertools.islice(people, SCAN_MAX_IN_FLIGHT - len(in_flight)):
+            # 名冊反查：不在預警社群名冊中的人員直接判定未命中，只有命中者才查詢職位與同盟細節
+            if index.roster is not None and int(person["id"]) not in index.roster: skipped.append(person)
+            else: in_flight[pool.submit(contextvars.copy_context().run, get_user_groups, person["id"])] = person
+
+    def flush():
+        reports = [report for _, report in pending]
+        resolve_alert_avatars(reports)
+        if enrich_names: enrich_alert_names(reports)
+        WATCHLIST.add_alerts(reports)
+        batch = pending[:]
+        pending.clear()
+        return batch
+
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        fill()
+        while in_flight or skipped:
+            for person in skipped: yield person, None
+            skipped.clear()
+            if not in_flight:
+                fill(); continue
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                person = in_flight.pop(fut)
+                report = build_alert_report(person["id"], person["name"], person["rel"], fut.result(), index)
+                if report: pending.append((person, report))
+                else: yield person, None
+            if pending and (len(pending) >= THUMBNAIL_BATCH_SIZE or time.monotonic() - last_flush >= ALERT_FLUSH_INTERVAL):
+                yield from flush()
+                last_flush = time.monotonic()
+            fill()
+        yield from flush()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def run_group_sweep(job_id, group_id, roles, index, known=frozenset()):
+    """可續掃的群組大範圍掃描；產出 (人員, 預警報告或 None)
+
+    成員分頁在背景預先抓取並串流進並行檢查，第一批結果不必等整份名冊抓完。
+    階級高的階層先掃，並在 SCAN_PRIORITY_WINDOW 人的緩衝區內依 scan_priority 重排 (known 為曾命中者)。
+    每檢查完一人即寫入檢查點，某一頁的成員全數檢查完 (且之前各頁也完成) 才推進該階層游標；
+    已檢查過的人員直接略過，某頁抓取失敗時保留游標，下次從該頁續掃。
+    """
+    SWEEP_STORE.open_job(job_id, group_id, roles)
+    cursors, todo_roles = {}, []
+    for role in sorted(roles, key=lambda r: -r.get("rank", 0)):
+        cursor, done = SWEEP_STORE.role_cursor(job_id, role["id"])
+        if not done: cursors[role["id"]] = cursor; todo_roles.append(role)
+
+    pages, failed = {}, []  # 頁序號 -> [階層 ID, 下一頁游標, 尚未檢查人數]
+
+    def people():
+        for seq, (role, members, next_cursor) in enumerate(iter_role_member_pages(group_id, todo_roles, cursors)):
+            if members is None: failed.append(role["id"]); return
+            seen = SWEEP_STORE.processed_ids(job_id, [m["id"] for m in members])
+            todo = [m for m in members if m["id"] not in seen]
+            pages[seq] = [role["id"], next_cursor, len(todo)]
+            for m in todo: yield {"id": m["id"], "name": m["name"], "rel": f"成員 [{m['rank_name']}]", "rank_num": m["rank_num"], "page": seq}
+
+    next_commit = 0
+    def commit_finished_pages():
+        nonlocal next_commit
+        while next_commit in pages and pages[next_commit][2] == 0:
+            role_id, next_cursor, _ = pages.pop(next_commit)
+            SWEEP_STORE.save_cursor(job_id, role_id, next_cursor, next_cursor is None)
+            next_commit += 1
+
+    ordered = prioritized(prefetch(people(), MEMBER_PREFETCH), lambda p: scan_priority(p, known))
+    for person, alert in scan_people_concurrently(ordered, index):
+        SWEEP_STORE.record_result(job_id, person["id"], alert)
+        pages[person["page"]][2] -= 1
+        commit_finished_pages()
+        yield person, alert
+    commit_finished_pages()
+    SWEEP_STORE.mark_status(job_id, "paused" if failed else "done")
+
+class IdSpool:
+    """只保存玩家 ID 的緊湊容器 (int64 array，每人 8 bytes)
+
+    累積超過 chunk 個 ID 時排序後寫入暫存檔 (一段排序好的 run)；迭代時以多路合併依 ID 排序產出 (可能重複)。
+    """
+    def __init__(self, chunk=ID_SPILL_CHUNK):
+        self.chunk, self.buffer, self.runs, self.count = chunk, array("q"), [], 0
+
+    def extend(self, ids):
+        before = len(self.buffer)
+        self.buffer.extend(ids)
+        self.count += len(self.buffer) - before
+        if len(self.buffer) >= self.chunk: self._spill()
+
+    def _spill(self):
+        f = tempfile.TemporaryFile()
+        array("q", sorted(self.buffer)).tofile(f)
+        self.runs.append((f, len(self.buffer)))
+        self.buffer = array("q")
+
+    @staticmethod
+    def _read_run(f, n, block=65536):
+        f.seek(0)
+        while n > 0:
+            chunk = array("q")
+            chunk.fromfile(f, min(block, n))
+            n -= len(chunk)
+            yield from chunk
+
+    def __iter__(self):
+        return heapq.merge(*(self._read_run(f, n) for f, n in self.runs), sorted(self.buffer))
+
+    def close(self):
+        for f, _ in self.runs: f.close()
+        self.runs, self.buffer = [], array("q")
+
+def merge_relation_ids(spools):
+    """把多個 (IdSpool, 關聯位元) 排序合併去重，逐一產出 (ID, 關聯位元遮罩)；不必為每個人建立字典或集合"""
+    merged = heapq.merge(*(zip(spool, itertools.repeat(bit)) for spool, bit in spools))
+    for uid, group in itertools.groupby(merged, key=lambda x: x[0]):
+        mask = 0
+        for _, bit in group: mask |= bit
+        yield uid, mask
+
+def scan_priority(person, known, degree=0):
+    """候選人的排序鍵 (越小越先檢查)：曾經命中過、在社交圈中關聯越多 (例如同時是好友與粉絲)、群組階級越高、帳號越新 (ID 越大)"""
+    return (int(person["id"]) not in known, -degree, -person.get("rank_num", 0), -int(person["id"]))
+
+def prioritized(people, key, window=SCAN_PRIORITY_WINDOW):
+    """在最多 window 人的緩衝區內依 key 重排後產出，惰性名單仍可串流處理"""
+    heap, seq = [], itertools.count()
+    for person in people:
+        heapq.heappush(heap, (key(person), next(seq), person))
+        if len(heap) >= window: yield heapq.heappop(heap)[2]
+    while heap: yield heapq.heappop(heap)[2]
+
+def known_alert_user_ids():
+    return ALERT_STORE.known_user_ids() | WATCHLIST.by_user.keys()
+
+class ScanBudget:
+    """掃描的提前停止條件 (未設定者不限制)：命中人數、API 請求數、執行分鐘數
+
+    請求數只計算本工作 (及其衍生的抓取執行緒) 發出的請求，不受其他同時執行的工作或重設指標影響；
+    start() 必須在工作執行緒中、發出第一個請求之前呼叫。
+    """
+    def __init__(self, max_hits=None, max_calls=None, max_minutes=None):
+        self.max_hits, self.max_calls, self.max_minutes = max_hits or None, max_calls or None, max_minutes or None
+        self.started, self.counter = time.monotonic(), RequestCounter()
+
+    def __bool__(self):
+        return bool(self.max_hits or self.max_calls or self.max_minutes)
+
+    def start(self):
+        self.started, self.counter = time.monotonic(), RequestCounter()
+        JOB_REQUEST_COUNTER.set(self.counter)
+
+    def calls(self):
+        return self.counter.count
+
+    def calls_left(self):
+        """剩餘可用的請求數 (未設定 max_calls 時回傳 None)"""
+        return None if not self.max_calls else max(0, self.max_calls - self.calls())
+
+    def exhausted(self, hits):
+        """回傳停止原因 (尚未達到任何上限時回傳 None)"""
+        if self.max_hits and hits >= self.max_hits: return f"已達命中上限 {self.max_hits} 人"
+        if self.max_calls and self.calls() >= self.max_calls: return f"已達 API 請求上限 {self.max_calls} 次"
+        if self.max_minutes and time.monotonic() - self.started >= self.max_minutes * 60: return f"已達時間上限 {self.max_minutes:g} 分鐘"
+        return None
+
+class SocialCrawl:
+    """多層社交圈的廣度優先爬取：全域去重 (重複出現時合併關聯標籤而不重掃)，並以 API 請求預算限制擴散範圍"""
+    def __init__(self, root_id, root_name, limit=None, budget=None):
+        self.root_id = int(root_id)
+        self.limit, self.budget, self.spent = limit, budget, 0
+        self.nodes = {self.root_id: {"id": self.root_id, "name": root_name, "labels": [], "rel": "目標玩家本體", "hop": 0}}
+        self.degree = {}  # user ID -> 在已爬取的圖中被多少條關係指到
+        self.alerts = {}  # user ID -> 預警報告 (合併標籤時同步更新 relation)
+
+    def remaining(self):
+        return None if self.budget is None else max(0, self.budget - self.spent)
+
+    def _discover(self, user, label, hop, found):
+        uid = int(user["id"])
+        if uid == self.root_id: return
+        self.degree[uid] = self.degree.get(uid, 0) + 1
+        node = self.nodes.get(uid)
+        if node is None:
+            node = self.nodes[uid] = {"id": uid, "name": user["name"], "labels": [label], "rel": label, "hop": hop}
+            found.append(node)
+        elif label not in node["labels"]:
+            node["labels"].append(label)
+            node["rel"] = " / ".join(node["labels"])
+            if uid in self.alerts: self.alerts[uid]["relation"] = node["rel"]
+
+    def _page_allowance(self, stop=None):
+        """還能抓取的分頁數 (爬取預算與 ScanBudget 剩餘請求數取較小者；皆未設定時為 None)"""
+        caps = [c for c in (self.remaining(), stop.calls_left() if stop else None) if c is not None]
+        return min(caps) if caps else None
+
+    def _user_limit(self, stop=None):
+        pages = self._page_allowance(stop)
+        caps = [c for c in (self.limit, None if pages is None else pages * 100) if c is not None]
+        return min(caps) if caps else None
+
+    def expand(self, parents, hop, stop=None):
+        """展開 parents 的社交關係 (第 1 層含好友 / 關注 / 粉絲，之後只沿好友擴散)，回傳新發現的人員
+
+        關注 / 粉絲清單依剩餘預算限制抓取頁數，粉絲眾多的單一玩家也不會超出預算 (好友上限只有數頁，完整抓取並快取)。
+        """
+        found = []
+        for parent in parents:
+            if self._page_allowance(stop) == 0: break
+            relations = [(lambda: get_user_friends(parent["id"]), "目標的好友" if hop == 1 else f"第 {hop} 層：{parent['name']} 的好友")]
+            if hop == 1:
+                relations += [(lambda: get_user_followings(parent["id"], limit=self._user_limit(stop)), "目標關注的人"), (lambda: get_user_followers(parent["id"], limit=self._user_limit(stop)), "目標的粉絲")]
+            for fetch, label in relations:
+                if self._page_allowance(stop) == 0: break
+                users = fetch()
+                self.spent += max(1, -(-len(users) // 100))
+                for user in users: self._discover(user, label, hop, found)
+        return found
+
+    def take(self, nodes, known=frozenset()):
+        """依命中可能性排序本層人員 (見 scan_priority)，依預算截取後預先扣除每人一次的查詢成本"""
+        nodes = sorted(nodes, key=lambda n: scan_priority(n, known, self.degree.get(n["id"], 0)))
+        if self.budget is not None: nodes = nodes[:self.remaining()]
+        self.spent += len(nodes)
+        return nodes
+
+    def expansion_order(self, nodes):
+        """下一層的擴散順序：已命中預警者優先，其次是在圖中關聯度高的人員"""
+        return sorted(nodes, key=lambda n: (n["id"] not in self.alerts, -self.degree.get(n["id"], 0)))
+
+    def record(self, person, alert):
+        if alert: self.alerts[int(person["id"])] = alert
+
+# === 背景工作內容 (不可呼叫任何 st.* 函數) ===
+
+SCAN_STRATEGY_LABELS = {"roster": "名冊反查 (僅命中者查詢職位細節)", "per_user": "逐人查詢群組"}
+
+def apply_scan_strategy(job, index, candidate_count, warning_group_ids):
+    """依候選人數決定使用名冊反查或逐人查詢，必要時先增量同步預警社群名冊"""
+    strategy, _ = plan_scan_strategy(candidate_count, warning_group_ids, index.ally_only)
+    if strategy == "roster":
+        job.stage = "正在同步預警社群成員名冊..."
+        index.roster = load_warning_roster(warning_group_ids)
+        if index.roster is None: strategy = "per_user"
+    job.data["strategy"] = strategy
+
+def job_scan_user(job, user_input, warning_group_ids, limit, ally_only=False, depth=1, budget=None, stop=None):
+    """Tab 1：掃描目標玩家本體及其好友 / 關注 / 粉絲 (depth > 1 時再沿好友關係多層擴散；stop 為 ScanBudget 提前停止條件)"""
+    if stop: stop.start()
+    job.stage = "正在解析目標玩家..."
+    uid, uname = resolve_user_input(user_input)
+    if not uid: return job.fail("無法解析目標玩家。")
+    # 【新增顯示】在畫面上方顯示總好友數
+    try:
+        f_count = roblox_get(f"https://friends.roblox.com/v1/users/{uid}/friends/count").json().get("count", 0)
+    except:
+        f_count = "未知"
+    job.data.update(target_id=uid, target_name=uname, friend_count=f_count)
+    job.title = f"{uname} 深度掃描"
+
+    job.stage = "正在掃描目標玩家本體..."
+    index = build_warning_index(warning_group_ids, ally_only=ally_only)
+    job.data["target_alert"] = fetch_alert_data(uid, uname, "目標玩家本體", warning_group_ids, index=index)
+    if job.data["target_alert"]: ALERT_STORE.record(job.id, job.kind, job.title, [job.data["target_alert"]])
+
+    job.stage = "正在獲取社交圈完整資料..."
+    if limit is None and depth == 1: return scan_full_social_circle(job, uid, index, warning_group_ids, stop)
+    # depth > 1 時沿好友關係往外擴散，以 budget 限制總請求數；同一人只掃描一次，多重關係合併顯示
+    crawl = SocialCrawl(uid, uname, limit, budget if depth > 1 else None)
+    level = crawl.expand([crawl.nodes[crawl.root_id]], 1, stop)
+    apply_scan_strategy(job, index, len(level), warning_group_ids)
+    known = known_alert_user_ids()
+    job.start_progress(0)
+    for hop in range(1, depth + 1):
+        if hop > 1:
+            job.stage = f"正在展開第 {hop} 層社交圈..."
+            level = crawl.expand(crawl.expansion_order(level), hop, stop)
+        level = crawl.take(level, known)
+        job.total += len(level)
+        job.stage = "交叉比對中..." if hop == 1 else f"第 {hop} 層交叉比對中..."
+        for person, alert in scan_people_concurrently(level, index, enrich_names=True):
+            if job.cancelled: return
+            crawl.record(person, alert)
+            job.advance(alert)
+            if stop and (reason := stop.exhausted(len(job.alerts))):
+                job.data["stopped"] = reason
+                break
+        if crawl.remaining() == 0 or "stopped" in job.data: break
+    job.data["crawl_spent"] = crawl.spent
+
+SOCIAL_RELATIONS = (("friends", "目標的好友", 1), ("followings", "目標關注的人", 2), ("followers", "目標的粉絲", 4))
+
+def scan_full_social_circle(job, uid, index, warning_group_ids, stop=None):
+    """解除人數限制的第 1 層掃描：好友 / 關注 / 粉絲只保存 ID (IdSpool)，排序合併去重後串流檢查，名稱只為命中者批次補齊"""
+    spools = []
+    try:
+        for path, label, bit in SOCIAL_RELATIONS:
+            spool = IdSpool()
+            spools.append((spool, bit))
+            # 請求預算用完時不再翻頁 (包含下一種關係的第一頁)，只掃描已讀到的部分
+            if stop and stop.calls_left() == 0:
+                job.data["stopped"] = stop.exhausted(0); break
+            for page in _iter_user_pages(f"https://friends.roblox.com/v1/users/{uid}/{path}?limit=100"):
+                if job.cancelled: break
+                if stop and stop.calls_left() == 0:
+                    job.data["stopped"] = stop.exhausted(0); break
+                # 翻頁失敗時只掃描已讀到的部分，並記錄哪些關係名單不完整
+                if page is None:
+                    job.data.setdefault("incomplete", []).append(label); break
+                spool.extend(int(u["id"]) for u in page if int(u["id"]) != int(uid))
+                job.stage = f"正在讀取{label} (已讀取 {spool.count:,} 人)..."
+        if job.cancelled: return
+        job.stage = "正在合併去重社交圈名單..."
+        total = sum(1 for _ in merge_relation_ids(spools))
+        apply_scan_strategy(job, index, total, warning_group_ids)
+        known = known_alert_user_ids()
+        labels = {mask: " / ".join(label for _, label, bit in SOCIAL_RELATIONS if mask & bit) for mask in range(1, 8)}
+        people = ({"id": u, "name": str(u), "rel": labels[mask], "degree": bin(mask).count("1")} for u, mask in merge_relation_ids(spools))
+        job.start_progress(total)
+        for person, alert in scan_people_concurrently(prioritized(people, lambda p: scan_priority(p, known, p["degree"])), index, enrich_names=True):
+            if job.cancelled: return
+            job.advance(alert)
+            if stop and (reason := stop.exhausted(len(job.alerts))):
+                job.data["stopped"] = reason
+                break
+    finally:
+        for spool, _ in spools: spool.close()
+
+def job_group_sweep(job, sweep_id, group_id, roles, warning_group_ids, total_est, ally_only=False, stop=None):
+    """Tab 2：可續掃的群組大範圍掃描 (stop 為 ScanBudget 提前停止條件，命中數只計本次新增；停止後進度保存可續掃)"""
+    if stop: stop.start()
+    job.data["sweep_id"] = sweep_id
+    job.alerts.extend(SWEEP_STORE.alerts(sweep_id))
+    resumed_hits = len(job.alerts)
+    processed = (SWEEP_STORE.summary(sweep_id) or {}).get("processed", 0)
+    index = build_warning_index(warning_group_ids, int(group_id), ally_only)
+    apply_scan_strategy(job, index, total_est - processed, warning_group_ids)
+    job.start_progress(total_est)
+    job.done = processed
+    for person, alert in run_group_sweep(sweep_id, group_id, roles, index, known_alert_user_ids()):
+        if job.cancelled:
+            SWEEP_STORE.mark_status(sweep_id, "paused")
+            break
+        job.advance(alert)
+        job.total = max(job.total, job.done)
+        if stop and (reason := stop.exhausted(len(job.alerts) - resumed_hits)):
+            job.data["stopped"] = reason
+            SWEEP_STORE.mark_status(sweep_id, "paused")
+            break
+
+# === 分片掃描 (協調者與 worker，可分散在同一台主機的多個行程) ===
+
+def build_shard_index(sweep):
+    """worker 端依分片掃描設定建立預警索引 (可使用名冊反查時先同步本機名冊)"""
+    warning_group_ids = frozenset(sweep["warning_ids"])
+    index = build_warning_index(warning_group_ids, sweep["group_id"], sweep["ally_only"])
+    strategy, _ = plan_scan_strategy(sum(r.get("memberCount", 0) for r in sweep["roles"]), warning_group_ids, sweep["ally_only"])
+    if strategy == "roster": index.roster = load_warning_roster(warning_group_ids)
+    return index
+
+def process_shard(shard, sweep, index, worker_id, stop):
+    """處理一個分片：抓取 SHARD_PAGES 頁成員並立即排入下一段游標的分片，檢查尚未處理過的成員後寫入結果
+
+    處理期間由背景執行緒定期心跳延長租約；租約被其他 worker 接手時停止，停止時把分片交還佇列。
+    """
+    role = next(r for r in sweep["roles"] if r["id"] == shard["role_id"])
+    members, cursor = [], shard["cursor"]
+    for _ in range(SHARD_PAGES):
+        page, cursor = fetch_role_members_page(sweep["group_id"], role, cursor)
+        if page is None: return SHARD_QUEUE.release(shard, failed=True)
+        members += page
+        if not cursor: break
+    if cursor: SHARD_QUEUE.enqueue(shard["sweep_id"], role, cursor)
+    seen = SHARD_QUEUE.processed_ids(shard["sweep_id"], [m["id"] for m in members])
+    todo = [{"id": m["id"], "name": m["name"], "rel": f"成員 [{m['rank_name']}]", "rank_num": m["rank_num"]} for m in members if m["id"] not in seen]
+
+    finished, lost = threading.Event(), threading.Event()
+    def keep_alive():
+        while not finished.wait(SHARD_HEARTBEAT):
+            if not SHARD_QUEUE.heartbeat(worker_id, shard["sweep_id"], shard): return lost.set()
+    threading.Thread(target=keep_alive, daemon=True).start()
+    batch = []
+    try:
+        for person, alert in scan_people_concurrently(todo, index):
+            batch.append((person["id"], alert))
+            if len(batch) >= 100:
+                SHARD_QUEUE.record_results(shard["sweep_id"], worker_id, batch)
+                batch = []
+            if lost.is_set() or stop.is_set(): break
+        SHARD_QUEUE.record_results(shard["sweep_id"], worker_id, batch)
+    finally:
+        finished.set()
+    if lost.is_set(): return
+    if stop.is_set(): return SHARD_QUEUE.release(shard)
+    SHARD_QUEUE.complete(shard, worker_id, len(todo))
+
+def run_shard_worker(worker_id=None, sweep_id=None, stop=None):
+    """分片 worker：持續租用並處理分片直到 stop；指定 sweep_id 時只處理該掃描，且在它沒有剩餘分片後結束"""
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    stop = stop or threading.Event()
+    indexes = {}
+    while not stop.is_set():
+        shard = SHARD_QUEUE.lease(worker_id, sweep_id)
+        if shard is None:
+            if sweep_id and SHARD_QUEUE.finished(sweep_id): return
+            SHARD_QUEUE.heartbeat(worker_id, sweep_id)
+            stop.wait(SHARD_POLL_INTERVAL)
+            continue
+        sweep = SHARD_QUEUE.sweep(shard["sweep_id"])
+        if shard["sweep_id"] not in indexes: indexes[shard["sweep_id"]] = build_shard_index(sweep)
+        SHARD_QUEUE.heartbeat(worker_id, shard["sweep_id"], shard)
+        process_shard(shard, sweep, indexes[shard["sweep_id"]], worker_id, stop)
+
+def job_sharded_sweep(job, sweep_id, group_id, roles, warning_group_ids, total_est, ally_only=False, local_workers=1):
+    """Tab 2 分片模式的協調者：建立分片佇列、在本行程啟動 local_workers 個 worker，並把所有 worker (含其他行程) 的結果合併進同一份掃描紀錄"""
+    job.data.update(sweep_id=sweep_id, sharded=True)
+    SHARD_QUEUE.open_sweep(sweep_id, group_id, roles, warning_group_ids, ally_only)
+    SWEEP_STORE.open_job(sweep_id, group_id, roles)
+    SWEEP_STORE.mark_status(sweep_id, "running")
+    job.alerts.extend(SWEEP_STORE.alerts(sweep_id))
+    alerted = {int(a["user_id"]) for a in job.alerts}
+    job.start_progress(total_est, "分片掃描中...")
+    stop = threading.Event()
+    for i in range(local_workers):
+        threading.Thread(target=run_shard_worker, args=(f"{socket.gethostname()}-{job.id}-{i}", sweep_id, stop), daemon=True).start()
+    watermark, finished = 0, False
+    try:
+        while True:
+            # 先判斷是否完成再合併，確保最後寫入的結果也會被合併
+            finished = SHARD_QUEUE.finished(sweep_id)
+            while (rows := SHARD_QUEUE.results_since(sweep_id, watermark)):
+                watermark = rows[-1][0]
+                SWEEP_STORE.record_results(sweep_id, [(uid, report) for _, uid, report in rows])
+                for _, uid, report in rows:
+                    if report and uid not in alerted:
+                        alerted.add(uid)
+                        job.advance(report)
+            stats = SHARD_QUEUE.stats(sweep_id)
+            job.done = SWEEP_STORE.summary(sweep_id)["processed"]
+            job.total = max(job.total, job.done)
+            job.data["shards"] = stats
+            job.stage = f"分片掃描中：{stats['done']} 個分片完成、{stats['leased']} 個處理中、{stats['queued']} 個待處理 ({len(stats['workers'])} 個 worker)"
+            if finished or job.cancel_event.wait(SHARD_POLL_INTERVAL): break
+    finally:
+        stop.set()
+    SWEEP_STORE.mark_status(sweep_id, "done" if finished and not job.data["shards"]["failed"] else "paused")
+
+def lookup_user_profile(user_id):
+    """批次查詢的單人工作：帳號資料、好友數與群組 (三者互不相依，由呼叫端並行執行多人)"""
+    detail = get_user_detail(user_id)
+    try:
+        friend_count = roblox_get(f"https://friends.roblox.com/v1/users/{user_id}/friends/count").json().get("count")
+    except Exception:
+        friend_count = None
+    groups = get_user_groups(user_id)
+    return detail, friend_count, groups
+
+def job_bulk_lookup(job, user_inputs, warning_group_ids, ally_only=False):
+    """Tab 3 批次查詢：批次解析名稱後並行查詢每位玩家的帳號資料、好友數與群組，並與預警名單比對"""
+    user_inputs = list(dict.fromkeys(u.strip() for u in user_inputs if u.strip()))[:BULK_LOOKUP_MAX]
+    job.stage = f"正在批次解析 {len(user_inputs)} 個玩家名稱 / ID..."
+    resolved = resolve_user_inputs(user_inputs)
+    job.data["unresolved"] = [u for u in user_inputs if u not in resolved]
+    users = list(dict.fromkeys(resolved.values()))
+    index = build_warning_index(warning_group_ids, ally_only=ally_only)
+    job.stage = "正在批次讀取頭像..."
+    thumbs = get_user_thumbnails([uid for uid, _ in users])
+    job.data["rows"] = []
+    job.start_progress(len(users), "並行查詢玩家資料中...")
+    pool = ThreadPoolExecutor(max_workers=SCAN_WORKERS)
+    try:
+        futures = {pool.submit(lookup_user_profile, uid): (uid, name) for uid, name in users}
+        for fut in futures:
+            if job.cancelled: return
+            (uid, name), (detail, friend_count, groups) = futures[fut], fut.result()
+            alert = build_alert_report(int(uid), name, "批次查詢", groups, index)
+            if alert:
+                alert["avatar_url"] = thumbs.get(int(uid), DEFAULT_AVATAR_URL)
+                WATCHLIST.add_alerts([alert])
+            hits = alert["core_groups"] + alert["ally_only_groups"] if alert else []
+            job.data["rows"].append({
+                "user_id": int(uid), "user_name": name, "display_name": detail.get("displayName"), "avatar_url": thumbs.get(int(uid), DEFAULT_AVATAR_URL),
+                "created": (detail.get("created") or "").split("T")[0] or None, "banned": detail.get("isBanned"), "friends": friend_count, "groups": len(groups),
+                "warning_hits": len(hits), "max_warning_rank": max((g["rank_num"] for g in hits), default=None),
+                "warning_groups": " | ".join(f"{g['group_name']} / {g['role_name']} (Lv.{g['rank_num']})" for g in hits),
+            })
+            job.advance(alert)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def match_watchlist_presence(servers, token_urls):
+    """把各伺服器 playerTokens 的頭像與命中者頭像索引比對；token_urls 為跨輪詢沿用的 {token: imageUrl}，只解析新出現的 token"""
+    tokens = {t: s for s in servers for t in s.get("playerTokens") or []}
+    token_urls.update(resolve_player_tokens([t for t in tokens if t not in token_urls]))
+    # 已離開的玩家 token 不再需要
+    for t in [t for t in token_urls if t not in tokens]: del token_urls[t]
+    hits = []
+    for t, server in tokens.items():
+        candidates = WATCHLIST.match(token_urls.get(t))
+        if candidates: hits.append({"candidates": candidates, "server_id": server["id"], "playing": server.get("playing", 0), "max_players": server.get("maxPlayers", 0)})
+    return hits, len(tokens), len(token_urls)
+
+def job_game_monitor(job, place_id, interval=0, watch=False):
+    """Tab 4：讀取遊戲資訊與完整公開伺服器清單；interval > 0 時持續輪詢直到停止，並把差異寫入時間序列 (watch 時比對預警名單玩家所在伺服器)"""
+    job.stage = "正在讀取遊戲伺服器雲端數據..."
+    game_info = get_game_details(place_id)
+    # 檢查資料是否完整
+    if not game_info or 'universeId' not in game_info:
+        return job.fail("無法獲取該遊戲資訊或 Universe ID。請確認 ID 是否正確。")
+    job.data.update(place_id=place_id, game_info=game_info, game_thumb=get_game_thumbnail(game_info['universeId']), interval=interval, samples=0)
+    prev, token_urls, first_seen = None, {}, {}
+    while not job.cancelled:
+        job.stage = "正在翻頁讀取所有公開伺服器..."
+        servers, complete = get_game_servers(place_id)
+        ts = time.time()
+        cur = {s["id"]: s.get("playing", 0) for s in servers}
+        # 清單不完整時無法判斷未出現的伺服器是否已關閉，只比較有讀到的部分
+        diff = diff_game_servers({k: v for k, v in prev.items() if complete or k in cur} if prev is not None else cur, cur)
+        summary = summarize_game_servers(servers, complete)
+        GAME_HISTORY.record(place_id, ts, summary, diff)
+        if watch:
+            job.stage = f"正在比對 {len(WATCHLIST)} 位命中者頭像..."
+            hits, token_count, resolved = match_watchlist_presence(servers, token_urls)
+            for h in hits: h["first_seen"] = first_seen.setdefault((h["server_id"], frozenset(c["user_id"] for c in h["candidates"])), ts)
+            job.data.update(watch_hits=hits, watch_tokens=token_count, watch_resolved=resolved, watch_index=len(WATCHLIST))
+        # samples 最後才遞增，讀取端看到新取樣時其他欄位已更新完畢
+        job.data.update(servers=sorted(servers, key=lambda s: -s.get("playing", 0)), summary=summary, last_diff=diff, last_sample=ts, first_sample=prev is None)
+        job.data["samples"] += 1
+        # 清單不完整時保留上次讀到、這次沒讀到的伺服器，待下次完整快照再判斷是否關閉
+        prev = cur if complete or prev is None else {**prev, **cur}
+        if not interval: return
+        job.stage = "等待下一次輪詢..."
+        job.data["next_poll"] = ts + interval
+        if job.cancel_event.wait(interval): return
+        if (info := get_game_details(place_id)): job.data["game_info"] = info
+
+# === 增量監控 (只重查有變動的成員，輸出變動事件) ===
+
+MONITOR_CHANGE_LABELS = {
+    "joined": "🚨 加入預警社群", "left": "🚪 退出預警社群", "promoted": "⬆️ 晉升", "demoted": "⬇️ 降職",
+    "new_member": "🆕 預警對象新加入目標", "departed": "👋 預警對象離開目標", "role_change": "🔄 目標群組職位變動",
+}
+
+def fetch_monitor_members(target, old):
+    """讀取監控目標目前的成員，回傳 ({user ID: 人員}, {有重抓的階層 ID: (人數, 時間)}, {階層 ID: 階層})；抓取失敗時回傳 None
+
+    群組目標的階層人數與上次相同時只讀最新一頁 (依加入順序由新到舊)，沒有陌生人就沿用上次名單；
+    人數有變動或超過 MONITOR_FULL_REFRESH 才完整重抓該階層。
+    """
+    if target["kind"] == "user":
+        uid, members = target["target_id"], {}
+        friends, complete = _paginate_users(f"https://friends.roblox.com/v1/users/{uid}/friends?limit=100")
+        if not complete: return None
+        CACHE.set_many("friends", {uid: friends})
+        relations = [(friends, "目標的好友"), (get_user_followings(uid, limit=MONITOR_SOCIAL_LIMIT), "目標關注的人"), (get_user_followers(uid, limit=MONITOR_SOCIAL_LIMIT), "目標的粉絲")]
+        for users, label in relations:
+            for u in users:
+                m = members.setdefault(int(u["id"]), {"id": int(u["id"]), "name": u["name"], "rel": label})
+                if label not in m["rel"]: m["rel"] += f" / {label}"
+        members[uid] = {"id": uid, "name": target["title"], "rel": "目標玩家本體"}
+        return members, {}, {}
+
+    gid = target["target_id"]
+    roles = _fetch_group_roles(gid)
+    if roles is None: return None
+    CACHE.set_many("group_roles", {gid: roles})
+    state, now = MONITOR_STORE.role_state(target["key"]), time.time()
+    members, refreshed = {}, {}
+    for role in roles:
+        if not role.get("memberCount"): continue
+        known = {uid: (name, rel) for uid, (name, rid, rel) in old.items() if rid == role["id"]}
+        saved = state.get(role["id"])
+        if saved and saved[0] == role["memberCount"] and now - saved[1] < MONITOR_FULL_REFRESH:
+            page, _ = fetch_role_members_page(gid, role)
+            if page is not None and all(m["id"] in known for m in page):
+                members.update({uid: {"id": uid, "name": name, "rel": rel, "role_id": role["id"]} for uid, (name, rel) in known.items()})
+                continue
+        for _, page, _ in iter_role_member_pages(gid, [role]):
+            if page is None: return None
+            members.update({m["id"]: {"id": m["id"], "name": m["name"], "rel": f"成員 [{m['rank_name']}]", "role_id": role["id"]} for m in page})
+        refreshed[role["id"]] = (role["memberCount"], now)
+    return members, refreshed, {r["id"]: r for r in roles}
+
+def alert_group_states(report):
+    """把預警報告壓成 {群組 ID: [名稱, 職位, 階級, 命中類型]}，作為下次比對的基準"""
+    if not report: return {}
+    return {g["group_id"]: [g["group_name"], g["role_name"], g["rank_num"], match_type]
+            for key, match_type in ALERT_MATCH_TYPES.items() if key != "scanned_ally_groups" for g in report.get(key) or []}
+
+def diff_alert_groups(person, old, new, ts):
+    """比較成員前後兩次的預警群組，產生加入 / 退出 / 晉升 / 降職事件"""
+    events = []
+    def event(change, gid, g, detail):
+        events.append({"ts": ts, "user_id": int(person["id"]), "user_name": person["name"], "change": change, "group_id": gid, "group_name": g[0], "detail": detail})
+    for gid, g in new.items():
+        before = old.get(gid)
+        if before is None: event("joined", gid, g, f"{person['name']} 加入 {g[0]} ({g[1]} Lv.{g[2]})")
+        elif before[2] != g[2]:
+            up = g[2] > before[2]
+            event("promoted" if up else "demoted", gid, g, f"{person['name']} 在 {g[0]} {'晉升為' if up else '降為'} {g[1]} (Lv.{before[2]} → Lv.{g[2]})")
+    for gid, g in old.items():
+        if gid not in new: event("left", gid, g, f"{person['name']} 退出 {g[0]} (原為 {g[1]} Lv.{g[2]})")
+    return events
+
+def monitor_target(job, target):
+    """對單一監控目標執行一輪增量檢查，回傳本輪的變動事件 (首次執行只建立基準，不產生事件；工作被停止時回傳 None)
+
+    可使用名冊反查時，只重查新成員、預警社群職位簽章有變動的人，以及上次查詢已超過群組快取 TTL 的名冊成員
+    (同盟群組的加入 / 退出不會改變簽章)；否則 (需要同盟比對或預警社群過大) 逐人重查全部成員。
+    """
+    key, cfg = target["key"], target["config"]
+    warning_group_ids, baseline = frozenset(cfg["warning_ids"]), target["last_run"] is None
+    job.stage = f"{target['title']}：正在讀取目前成員..."
+    old = MONITOR_STORE.members(key)
+    fetched = fetch_monitor_members(target, old)
+    if fetched is None:
+        job.data["failed"].append(target["title"])
+        return []
+    members, refreshed, roles = fetched
+    states = MONITOR_STORE.states(key)
+    index = build_warning_index(warning_group_ids, target["target_id"] if target["kind"] == "group" else None, cfg["ally_only"])
+    strategy, _ = plan_scan_strategy(len(members), warning_group_ids, cfg["ally_only"])
+    if strategy == "roster":
+        job.stage = f"{target['title']}：正在同步預警社群成員名冊..."
+        index.roster = load_warning_roster(warning_group_ids)
+    if index.roster is not None:
+        sigs, expired = ROSTER_STORE.member_roles(warning_group_ids), time.time() - CACHE_TTLS["user_groups"]
+        def due(uid):
+            sig, _, checked_at = states.get(uid, ("", {}, 0))
+            return uid not in old or sigs.get(uid, "") != sig or (uid in sigs and checked_at < expired)
+        todo = [uid for uid in members if due(uid)]
+    else:
+        sigs, todo = {}, list(members)
+    # 要重查的人一律讓群組快取失效，避免過期資料掩蓋變動
+    CACHE.delete_many("user_groups", [uid for uid in todo if index.roster is None or uid in index.roster])
+    job.data["strategy"] = "roster" if index.roster is not None else "per_user"
+    job.total += len(todo)
+
+    ts, events, new_states = time.time(), [], {}
+    job.stage = f"{target['title']}：重查 {len(todo)}/{len(members)} 位成員..."
+    for person, alert in scan_people_concurrently((members[uid] for uid in todo), index, enrich_names=target["kind"] == "user"):
+        if job.cancelled: return None
+        uid, groups = int(person["id"]), alert_group_states(alert)
+        new_states[uid] = (sigs.get(uid, ""), groups)
+        if baseline: changed = []
+        elif uid in old: changed = diff_alert_groups(person, states.get(uid, ("", {}))[1], groups, ts)
+        # 新加入目標的預警對象合併成一筆事件，不逐一列為「加入預警社群」
+        elif groups: changed = [{"ts": ts, "user_id": uid, "user_name": person["name"], "change": "new_member", "group_id": None, "group_name": None,
+                                 "detail": f"{person['name']} 新加入目標 ({person['rel']})：" + "、".join(f"{g[0]} {g[1]} Lv.{g[2]}" for g in groups.values())}]
+        else: changed = []
+        events += changed
+        job.advance(alert if baseline or changed else None)
+
+    departed = [uid for uid in old if uid not in members]
+    if not baseline:
+        for uid in departed:
+            name, _, rel = old[uid]
+            groups = states.get(uid, ("", {}))[1]
+            if groups: events.append({"ts": ts, "user_id": uid, "user_name": name, "change": "departed", "group_id": None, "group_name": None, "detail": f"{name} 已不在目標中 (原為 {rel})"})
+        for uid, m in members.items():
+            prev_role = old[uid][1] if uid in old else None
+            if target["kind"] == "group" and prev_role is not None and prev_role != m["role_id"]:
+                before, after = roles.get(prev_role, {}), roles.get(m["role_id"], {})
+                events.append({"ts": ts, "user_id": uid, "user_name": m["name"], "change": "role_change", "group_id": target["target_id"], "group_name": target["title"],
+                               "detail": f"{m['name']} 在目標群組由 {before.get('name', prev_role)} (Lv.{before.get('rank', '?')}) 改為 {after.get('name')} (Lv.{after.get('rank')})"})
+    MONITOR_STORE.save_run(key, members, refreshed, new_states, departed, events)
+    return events
+
+def job_incremental_monitor(job, target_keys=None, interval=0):
+    """增量監控：依序檢查各監控目標並累積變動事件；interval > 0 時持續排程直到停止"""
+    job.data.update(changes=[], runs=0, failed=[])
+    while not job.cancelled:
+        targets = MONITOR_STORE.targets(target_keys)
+        if not targets: return job.fail("尚未加入任何監控目標。")
+        job.start_progress(0, "增量檢查中...")
+        job.data.update(failed=[], targets=len(targets))
+        for target in targets:
+            if job.cancelled: return
+            events = monitor_target(job, target)
+            if events is None: return
+            job.data["changes"].extend({**e, "target": target["title"]} for e in events)
+        job.data["last_run"] = time.time()
+        # runs 最後才遞增，讀取端看到新一輪時 changes 已更新完畢
+        job.data["runs"] += 1
+        if not interval: return
+        job.stage = "等待下一次增量檢查..."
+        job.data["next_run"] = time.time() + interval
+        if job.cancel_event.wait(interval): return
@@ -1,11 +1,19 @@
 import streamlit as st
-import requests
 import time
-import pandas as pd
+import json
 import re
-
-# ================= 配置區 =================
-REQUEST_DELAY = 0.5  
+import pandas as pd
+from roblox_core import (
+    ALERT_COLUMNS, ALERT_MATCH_TYPES, ALERT_STORE, BULK_LOOKUP_MAX, CRAWL_DEFAULT_BUDGET, CRAWL_MAX_DEPTH, DEFAULT_AVATAR_URL, GAME_HISTORY, GAME_MONITOR_INTERVAL, JOB_RUNNER, METRICS,
+    MONITOR_CHANGE_LABELS, MONITOR_DEFAULT_INTERVAL, MONITOR_STORE, SCAN_STRATEGY_LABELS, SHARD_DB_PATH, SHARD_QUEUE, SWEEP_STORE, ScanBudget, SweepStore,
+    export_alert_rows, get_group_roles, get_user_detail, get_user_groups, get_user_thumbnail, job_bulk_lookup, job_game_monitor, job_group_sweep, job_incremental_monitor,
+    job_scan_user, job_sharded_sweep, parquet_export_available, resolve_alert_avatars, resolve_user_input, roblox_get,
+)
+
+# ================= 介面配置 =================
+JOB_POLL_INTERVAL = 1.0     # 頁面輪詢背景工作進度的秒數
+RESULTS_PAGE_SIZE = 20      # 命中結果每頁顯示的卡片數
+JOB_STATUS_ICONS = {"queued": "🕒", "running": "🔄", "done": "✅", "failed": "❌", "cancelled": "⏹️"}
 # ==========================================
 
 # 網頁基礎設定 (寬螢幕模式)
@@ -22,8 +30,10 @@ st.markdown("""
 # ================= 暫存狀態初始化 =================
 if 'group_roles_cache' not in st.session_state:
     st.session_state.group_roles_cache = {}
-if 'group_allies_cache' not in st.session_state:
-    st.session_state.group_allies_cache = {}
+if 'active_jobs' not in st.session_state:
+    st.session_state.active_jobs = {}  # 分頁 -> 背景工作 ID
+if 'celebrated_jobs' not in st.session_state:
+    st.session_state.celebrated_jobs = set()
 
 # ================= 側邊欄：預警名單設定 =================
 with st.sidebar:
@@ -39,198 +49,52 @@ with st.sidebar:
             if gid.isdigit():
                 WARNING_GROUP_IDS.add(int(gid))
 
+    FLAG_ALLY_ONLY = st.checkbox("⚠️ 同時標記僅加入預警社群同盟者", help="未加入核心預警社群、但加入其同盟社群的人員也會列為預警對象")
+
     st.divider()
     st.metric("已載入預警社群數", f"{len(WARNING_GROUP_IDS)} 個")
 
-# === API 抓取與工具函數 ===
-
-def get_short_name(full_name):
-    match = re.search(r'\[(.*?)\]', full_name)
-    if match: return match.group(1)
-    return full_name
-
-def resolve_user_input(user_input):
-    user_input = str(user_input).strip()
-    url_username_to_id = "https://users.roblox.com/v1/usernames/users"
-    payload = {"usernames": [user_input], "excludeBannedUsers": False}
-    try:
-        response = requests.post(url_username_to_id, json=payload)
-        if response.status_code == 200:
-            data = response.json().get("data", [])
-            if len(data) > 0: return str(data[0]["id"]), data[0]["name"]
-    except: pass 
-    if user_input.isdigit():
-        url_verify_id = f"https://users.roblox.com/v1/users/{user_input}"
-        try:
-            res = requests.get(url_verify_id)
-            if res.status_code == 200: return str(res.json()["id"]), res.json()["name"]
-        except: pass
-    return None, None
-
-def get_user_thumbnail(user_id):
-    default_img = "https://tr.rbxcdn.com/38c6edcb50633730ff4cf39ac8859840/150/150/AvatarHeadshot/Png"
-    url = f"https://thumbnails.roblox.com/v1/users/avatar-headshot?userIds={user_id}&size=150x150&format=Png&isCircular=true"
-    try:
-        res = requests.get(url, timeout=5).json()
-        if res.get("data") and len(res["data"]) > 0:
-            img_url = res["data"][0].get("imageUrl")
-            if img_url: return img_url
-    except Exception: pass
-    return default_img
-
-def get_user_groups(user_id):
-    url = f"https://groups.roblox.com/v1/users/{user_id}/groups/roles"
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json().get("data", [])
-            return {item["group"]["id"]: {"name": item["group"]["name"], "role": item["role"]["name"], "rank": item["role"]["rank"]} for item in data}
-        elif response.status_code == 429:
-            time.sleep(5) 
-            return get_user_groups(user_id)
-    except Exception: pass
-    return {}
-
-def get_group_allies(group_id):
-    if group_id in st.session_state.group_allies_cache:
-        return st.session_state.group_allies_cache[group_id]
-    allies = {}
-    start_row = 0
-    while True:
-        url = f"https://groups.roblox.com/v1/groups/{group_id}/relationships/allies?maxRows=100&startRowIndex={start_row}"
-        try:
-            response = requests.get(url)
-            if response.status_code == 200:
-                data = response.json()
-                for grp in data.get("relatedGroups", []): allies[grp["id"]] = grp["name"]
-                next_row = data.get("nextRowIndex")
-                if not next_row: break
-                start_row = next_row
-                time.sleep(REQUEST_DELAY)
-            elif response.status_code == 429: time.sleep(5)
-            else: break
-        except Exception: break
-    st.session_state.group_allies_cache[group_id] = allies
-    return allies
-
-# 【修正重點】加入 cursor 循環，確保好友不論人數多寡都能掃描完畢
-def get_user_friends(user_id):
-    friends, cursor = [], ""
-    while cursor is not None:
-        url = f"https://friends.roblox.com/v1/users/{user_id}/friends?limit=100" + (f"&cursor={cursor}" if cursor else "")
-        try:
-            res = requests.get(url)
-            if res.status_code == 200:
-                json_data = res.json()
-                friends.extend([{"id": u["id"], "name": u["name"]} for u in json_data.get("data", [])])
-                cursor = json_data.get("nextPageCursor")
-                time.sleep(REQUEST_DELAY)
-            elif res.status_code == 429:
-                time.sleep(5)
-            else:
-                break
-        except Exception:
-            break
-    return friends
-
-def get_user_followers(user_id, limit=None):
-    followers, cursor = [], ""
-    while cursor is not None:
-        if limit and len(followers) >= limit: break
-        url = f"https://friends.roblox.com/v1/users/{user_id}/followers?limit=100" + (f"&cursor={cursor}" if cursor else "")
-        try:
-            res = requests.get(url)
-            if res.status_code == 200:
-                json_data = res.json()
-                followers.extend([{"id": u["id"], "name": u["name"]} for u in json_data.get("data", [])])
-                cursor = json_data.get("nextPageCursor")
-                time.sleep(REQUEST_DELAY)
-            elif res.status_code == 429: time.sleep(5)
-            else: break
-        except Exception: break
-    return followers[:limit] if limit else followers
-
-def get_user_followings(user_id, limit=None):
-    followings, cursor = [], ""
-    while cursor is not None:
-        if limit and len(followings) >= limit: break
-        url = f"https://friends.roblox.com/v1/users/{user_id}/followings?limit=100" + (f"&cursor={cursor}" if cursor else "")
-        try:
-            res = requests.get(url)
-            if res.status_code == 200:
-                json_data = res.json()
-                followings.extend([{"id": u["id"], "name": u["name"]} for u in json_data.get("data", [])])
-                cursor = json_data.get("nextPageCursor")
-                time.sleep(REQUEST_DELAY)
-            elif res.status_code == 429: time.sleep(5)
-            else: break
-        except Exception: break
-    return followings[:limit] if limit else followings
-
-def get_group_roles(group_id):
-    url = f"https://groups.roblox.com/v1/groups/{group_id}/roles"
-    try:
-        res = requests.get(url)
-        if res.status_code == 200: return res.json().get("roles", [])
-        elif res.status_code == 429: time.sleep(5); return get_group_roles(group_id)
-    except Exception: pass
-    return []
-def get_game_details(place_id):
-    """獲取遊戲基本資訊 (Universe ID, 名稱, 總人數)"""
-    # 步驟 1: 獲取 Universe ID
-    u_url = f"https://apis.roblox.com/universes/v1/places/{place_id}/universe"
-    try:
-        u_res = requests.get(u_url).json()
-        u_id = u_res.get("universeId")
-        if not u_id: return None
-        
-        # 步驟 2: 獲取詳細遊戲數據
-        g_url = f"https://games.roblox.com/v1/games?universeIds={u_id}"
-        g_res = requests.get(g_url).json()
-        if g_res.get("data") and len(g_res["data"]) > 0:
-            data = g_res["data"][0]
-            # 手動補入 universeId，防止後續讀取時發生 KeyError
-            data['universeId'] = u_id 
-            return data
-    except Exception: pass
-    return None
-def get_game_servers(place_id, limit=20):
-    """獲取特定遊戲的公開伺服器清單"""
-    url = f"https://games.roblox.com/v1/games/{place_id}/servers/Public?limit={limit}"
-    try:
-        res = requests.get(url).json()
-        return res.get("data", [])
-    except: pass
-    return []
-
-def get_game_thumbnail(universe_id):
-    """獲取遊戲封面圖"""
-    url = f"https://thumbnails.roblox.com/v1/games/icons?universeIds={universe_id}&returnPolicy=PlaceHolder&size=150x150&format=Png&isCircular=false"
-    try:
-        res = requests.get(url).json()
-        if res.get("data"): return res["data"][0].get("imageUrl")
-    except: pass
-    return "https://tr.rbxcdn.com/38c6edcb50633730ff4cf39ac8859840/150/150/AvatarHeadshot/Png"
-def get_members_of_roles(group_id, selected_roles):
-    members = []
-    for role in selected_roles:
-        role_id, role_name, role_rank, cursor = role["id"], role["name"], role.get("rank", 0), ""
-        while cursor is not None:
-            url = f"https://groups.roblox.com/v1/groups/{group_id}/roles/{role_id}/users?sortOrder=Desc&limit=100" + (f"&cursor={cursor}" if cursor else "")
-            try:
-                res = requests.get(url)
-                if res.status_code == 200:
-                    data = res.json()
-                    for item in data.get("data", []):
-                        uid = item.get("userId") or item.get("user", {}).get("userId")
-                        uname = item.get("username") or item.get("user", {}).get("username")
-                        if uid and uname: members.append({"id": uid, "name": uname, "rank_name": role_name, "rank_num": role_rank})
-                    cursor = data.get("nextPageCursor")
-                    time.sleep(REQUEST_DELAY)
-                elif res.status_code == 429: time.sleep(5)
-                else: break
-            except Exception: break
-    return members
+    all_jobs = JOB_RUNNER.list_jobs()
+    with st.expander(f"🧵 背景工作 ({sum(j.active for j in all_jobs)} 執行中)"):
+        if not all_jobs: st.caption("目前沒有背景工作。")
+        for j in all_jobs[:10]:
+            progress = f"{j.done}/{j.total}" if j.total else j.stage
+            st.caption(f"{JOB_STATUS_ICONS.get(j.status, '')} {j.title} — {progress}")
+
+    # 診斷面板：區分時間花在網路、限速等待 / 退避，或畫面繪製上
+    with st.expander("📊 診斷面板"):
+        host_rows = []
+        for host in METRICS.label_values("roblox_request_seconds", "host"):
+            hist = METRICS.histogram("roblox_request_seconds", host=host)
+            p50, p95 = METRICS.quantile("roblox_request_seconds", 0.5, host=host), METRICS.quantile("roblox_request_seconds", 0.95, host=host)
+            host_rows.append({
+                "主機": host.split(".")[0], "請求": hist["count"], "429": METRICS.counter("roblox_requests_total", host=host, status=429),
+                "重試": METRICS.counter("roblox_retries_total", host=host), "平均 ms": round(hist["sum"] / hist["count"] * 1000),
+                "p50": METRICS.format_quantile(p50), "p95": METRICS.format_quantile(p95),
+                "等待 s": round(METRICS.counter("roblox_sleep_seconds_total", host=host), 1),
+            })
+        if host_rows: st.dataframe(pd.DataFrame(host_rows), hide_index=True, use_container_width=True)
+        else: st.caption("尚未發出任何 API 請求。")
+
+        network = sum(METRICS.histogram("roblox_request_seconds", host=h)["sum"] for h in METRICS.label_values("roblox_request_seconds", "host"))
+        d1, d2 = st.columns(2)
+        d1.metric("🌐 網路時間", f"{network:.1f} s")
+        d2.metric("💤 等待時間", f"{METRICS.counter('roblox_sleep_seconds_total'):.1f} s", help=f"限速 {METRICS.counter('roblox_sleep_seconds_total', reason='rate_limit'):.1f}s / 退避 {METRICS.counter('roblox_sleep_seconds_total', reason='backoff'):.1f}s (以各執行緒加總)")
+
+        cache_lines = []
+        for kind in METRICS.label_values("cache_lookups_total", "kind"):
+            served, total = METRICS.counter("cache_lookups_total", kind=kind) - METRICS.counter("cache_lookups_total", kind=kind, result="miss"), METRICS.counter("cache_lookups_total", kind=kind)
+            if total: cache_lines.append(f"{kind} {served / total:.0%} ({served}/{total})")
+        if cache_lines: st.caption("🗄️ 快取命中率：" + "、".join(cache_lines))
+        flight_lines = [f"{kind} {METRICS.counter('singleflight_calls_total', kind=kind, result='coalesced')}/{METRICS.counter('singleflight_calls_total', kind=kind)}" for kind in METRICS.label_values("singleflight_calls_total", "kind")]
+        if flight_lines: st.caption("🔗 合併重複請求 (共用進行中的抓取 / 全部抓取)：" + "、".join(flight_lines))
+        render = METRICS.histogram("ui_render_seconds")
+        if render: st.caption(f"🖼️ 畫面繪製：{render['count']} 次，共 {render['sum']:.2f} s")
+
+        e1, e2 = st.columns(2)
+        e1.download_button("Prometheus", METRICS.to_prometheus(), file_name="roblox_monitor_metrics.prom", mime="text/plain", use_container_width=True)
+        e2.download_button("JSON", json.dumps(METRICS.snapshot(), ensure_ascii=False, indent=2), file_name="roblox_monitor_metrics.json", mime="application/json", use_container_width=True)
+        if st.button("🧹 重設指標", use_container_width=True): METRICS.reset()
 
 # === UI 排版與視覺化資料處理函數 ===
 
@@ -262,77 +126,355 @@ def format_df_string(g_data, group_type):
     type_icon = "🏴" if group_type == "core" else ("⚠️" if group_type == "ally" else "🎯")
     return f"{type_icon} {g_data['group_name']} (ID: {g_data['group_id']}) - {icon} {g_data['role_name']} (Lv.{g_data['rank_num']})"
 
-def fetch_alert_data(user_id, user_name, relation_type, warning_group_ids, scanned_group_id=None):
-    user_groups = get_user_groups(user_id)
-    time.sleep(REQUEST_DELAY)
-    matched_ids = set(user_groups.keys()).intersection(warning_group_ids)
-    if not matched_ids: return None
-    report = {"user_name": user_name, "user_id": user_id, "relation": relation_type, "avatar_url": get_user_thumbnail(user_id), "core_groups": [], "ally_groups": [], "scanned_ally_groups": [], "grouped_matches": []}
-    for gid in matched_ids:
-        g_info = user_groups[gid]
-        core_data = {"group_id": gid, "group_name": get_short_name(g_info['name']), "role_name": g_info['role'], "rank_num": g_info['rank']}
-        report["core_groups"].append(core_data)
-        current_cluster = {"core": core_data, "allies": []}
-        allies = get_group_allies(gid)
-        if allies:
-            matched_allies = set(user_groups.keys()).intersection(set(allies.keys()))
-            for ally_id in matched_allies:
-                ally_info = user_groups[ally_id]
-                ally_data = {"group_id": ally_id, "group_name": get_short_name(ally_info['name']), "role_name": ally_info['role'], "rank_num": ally_info['rank']}
-                report["ally_groups"].append(ally_data); current_cluster["allies"].append(ally_data)
-        report["grouped_matches"].append(current_cluster)
-    if scanned_group_id:
-        target_allies = get_group_allies(scanned_group_id)
-        if target_allies:
-            matched_target_allies = set(user_groups.keys()).intersection(set(target_allies.keys()))
-            for ally_id in matched_target_allies:
-                ally_info = user_groups[ally_id]
-                report["scanned_ally_groups"].append({"group_id": ally_id, "group_name": get_short_name(ally_info['name']), "role_name": ally_info['role'], "rank_num": ally_info['rank']})
-    return report
-
+def stop_condition_inputs(key):
+    """提前停止條件輸入區 (0 表示不限制)；回傳 ScanBudget，未設定任何上限時回傳 None"""
+    with st.expander("⏱️ 提前停止條件 (依命中可能性優先掃描，達到任一上限即停止)"):
+        s1, s2, s3 = st.columns(3)
+        max_hits = s1.number_input("命中人數上限", min_value=0, value=0, key=f"stop_hits_{key}")
+        max_calls = s2.number_input("API 請求上限", min_value=0, value=0, step=500, key=f"stop_calls_{key}")
+        max_minutes = s3.number_input("執行分鐘上限", min_value=0.0, value=0.0, step=5.0, key=f"stop_minutes_{key}")
+    stop = ScanBudget(int(max_hits), int(max_calls), float(max_minutes))
+    return stop if stop else None
+
+def alert_card_html(alert_data):
+    """組出單張預警卡片的完整 HTML (每張卡片只產生一個元素，只在該卡片要顯示時才呼叫)"""
+    parts = []
+    if alert_data.get("scanned_ally_groups"):
+        scanned_ally_html = "".join([format_badge_html(a, "scanned_ally") for a in alert_data["scanned_ally_groups"]])
+        parts.append(f"<div style='margin-bottom: 12px; padding-bottom: 8px; border-bottom: 1px dashed #ccc;'><span style='color: #666; font-size: 13px; font-weight: bold;'>🎯 來自目標社群 (A) 之相關同盟：</span><br>{scanned_ally_html}</div>")
+
+    parts.append("<span style='color: #d9534f; font-size: 13px; font-weight: bold;'>⚠️ 命中預警黑名單 (B) 及其同盟：</span>")
+
+    if alert_data.get("ally_only_groups"):
+        ally_only_html = "".join([format_badge_html(a, "ally") for a in alert_data["ally_only_groups"]])
+        parts.append(f"<div style='margin-bottom:8px;padding:5px 0 5px 8px;border-left:3px dashed #FF8C00;border-radius:0 5px 5px 0;'><span style='color: #666; font-size: 12px;'>僅加入預警社群之同盟 (未加入核心社群)：</span><br>{ally_only_html}</div>")
+
+    for cluster in alert_data.get("grouped_matches", []):
+        core_html = format_badge_html(cluster["core"], "core")
+        ally_html_content = ""
+        if cluster["allies"]:
+            ally_badges = "".join([format_badge_html(a, "ally") for a in cluster["allies"]])
+            ally_html_content = f"<div style='margin-top:4px;margin-left:20px;display:flex;align-items:center;'><span style='color:#ccc;margin-right:5px;'>└─ </span>{ally_badges}</div>"
+        parts.append(
+            f"<div style='margin-bottom:8px;padding-left:8px;border-left:3px solid #d9534f;"
+            f"background-color:rgba(255,0,0,0.03);padding:5px 0 5px 8px;border-radius:0 5px 5px 0;'>"
+            f"<div>{core_html}</div>{ally_html_content}</div>"
+        )
+
+    safe_avatar = alert_data.get("avatar_url") or DEFAULT_AVATAR_URL
+    return (
+        f"<div style='display:flex;gap:16px;border:1px solid rgba(49,51,63,0.2);border-radius:0.5rem;padding:16px;margin-bottom:12px;'>"
+        f"<img src='{safe_avatar}' style='width:90px;height:90px;border-radius:50%;flex-shrink:0;'>"
+        f"<div style='flex:1;min-width:0;'>"
+        f"<h4 style='margin:0 0 4px 0;padding:0;'>🚨 {alert_data['user_name']} <code>ID: {alert_data['user_id']}</code></h4>"
+        f"<div style='color:#888;font-size:14px;margin-bottom:8px;'>身分關聯: <b>{alert_data['relation']}</b></div>"
+        f"{''.join(parts)}</div></div>"
+    )
+
+@METRICS.timed("ui_render_seconds", component="alert_card")
 def draw_alert_card(alert_data):
-    with st.container(border=True):
-        col1, col2 = st.columns([1, 6])
-        with col1:
-            safe_avatar = alert_data.get("avatar_url") or "https://tr.rbxcdn.com/38c6edcb50633730ff4cf39ac8859840/150/150/AvatarHeadshot/Png"
-            st.image(safe_avatar, use_container_width=True)
-        with col2:
-            st.markdown(f"#### 🚨 {alert_data['user_name']} <code>ID: {alert_data['user_id']}</code>", unsafe_allow_html=True) 
-            st.caption(f"身分關聯: **{alert_data['relation']}**")
-            
-            if alert_data.get("scanned_ally_groups"):
-                scanned_ally_html = "".join([format_badge_html(a, "scanned_ally") for a in alert_data["scanned_ally_groups"]])
-                st.markdown(f"<div style='margin-bottom: 12px; padding-bottom: 8px; border-bottom: 1px dashed #ccc;'><span style='color: #666; font-size: 13px; font-weight: bold;'>🎯 來自目標社群 (A) 之相關同盟：</span><br>{scanned_ally_html}</div>", unsafe_allow_html=True)
-            
-            st.markdown("<span style='color: #d9534f; font-size: 13px; font-weight: bold;'>⚠️ 命中預警黑名單 (B) 及其同盟：</span>", unsafe_allow_html=True)
-            
-            if "grouped_matches" in alert_data:
-                for cluster in alert_data["grouped_matches"]:
-                    core_html = format_badge_html(cluster["core"], "core")
-                    ally_html_content = ""
-                    if cluster["allies"]:
-                        ally_badges = "".join([format_badge_html(a, "ally") for a in cluster["allies"]])
-                        ally_html_content = f"<div style='margin-top:4px;margin-left:20px;display:flex;align-items:center;'><span style='color:#ccc;margin-right:5px;'>└─ </span>{ally_badges}</div>"
-                    
-                    st.markdown(
-                        f"<div style='margin-bottom:8px;padding-left:8px;border-left:3px solid #d9534f;"
-                        f"background-color:rgba(255,0,0,0.03);padding:5px 0 5px 8px;border-radius:0 5px 5px 0;'>"
-                        f"<div>{core_html}</div>{ally_html_content}</div>", 
-                        unsafe_allow_html=True
-                    )
-
-def draw_summary_dashboard(alerted_list, total_scanned, title="掃描總結"):
+    st.markdown(alert_card_html(alert_data), unsafe_allow_html=True)
+
+def draw_alert_results(job):
+    """命中結果分頁檢視：篩選與排序只讀 job.results 的欄位資料，只有目前頁面的卡片會產生 HTML"""
+    table = job.results.sync(job.alerts)
+    if not len(table): return
+    f1, f2, f3, f4 = st.columns([3, 2, 2, 2])
+    groups = dict(table.group_names)
+    group_filter = f1.multiselect("🏴 核心社群", list(groups), format_func=lambda g: f"{groups[g]} ({g})", key=f"flt_group_{job.id}")
+    min_rank = f2.number_input("最低階級 (Lv)", min_value=0, max_value=255, value=0, key=f"flt_rank_{job.id}")
+    text = f3.text_input("🔎 名稱 / ID", key=f"flt_text_{job.id}")
+    by_rank = f4.selectbox("排序", ["發現順序", "階級高→低"], key=f"flt_order_{job.id}") == "階級高→低"
+    rows = table.query(group_filter, min_rank, text, by_rank)
+
+    pages = max(1, -(-len(rows) // RESULTS_PAGE_SIZE))
+    page_key = f"flt_page_{job.id}"
+    # 篩選後頁數變少時，把頁碼拉回範圍內
+    if st.session_state.setdefault(page_key, 1) > pages: st.session_state[page_key] = pages
+    page = st.number_input(f"頁數 (共 {pages} 頁，符合 {len(rows)} / {len(table)} 筆)", min_value=1, max_value=pages, key=page_key)
+    for i in rows[(page - 1) * RESULTS_PAGE_SIZE: page * RESULTS_PAGE_SIZE]: draw_alert_card(table.reports[i])
+
+@METRICS.timed("ui_render_seconds", component="summary_dashboard")
+def draw_summary_dashboard(table, total_scanned, title="掃描總結", extra=()):
+    """總結報告；表格由 AlertTable 彙總快取 (每個工作只在有新命中時重建)，重跑頁面不會重新組出整張 DataFrame"""
     st.divider()
     st.markdown(f"### 📊 {title} 報告")
     col1, col2, col3 = st.columns(3)
     col1.metric("🔍 總掃描人數", f"{total_scanned} 人")
-    flagged_count = len(alerted_list)
+    flagged_count = len(table) + len(extra)
     safe_ratio = ((total_scanned - flagged_count) / total_scanned * 100) if total_scanned > 0 else 0
     col2.metric("🚨 觸發預警人數", f"{flagged_count} 人", delta=f"-{flagged_count} 威脅" if flagged_count > 0 else "0 威脅", delta_color="inverse")
     col3.metric("🛡️ 安全比例", f"{safe_ratio:.1f} %")
     if flagged_count > 0:
-        df_data = [{"頭像": m["avatar_url"], "名稱": m["user_name"], "關聯": m["relation"], "預警核心": "\n".join([format_df_string(g, "core") for g in m["core_groups"]]), "預警附屬": "\n".join([format_df_string(a, "ally") for a in m["ally_groups"]]) if m.get("ally_groups") else "無", "玩家 ID": str(m["user_id"])} for m in alerted_list]
-        st.dataframe(pd.DataFrame(df_data), column_config={"頭像": st.column_config.ImageColumn("大頭貼"), "玩家 ID": st.column_config.TextColumn("ID")}, hide_index=True, use_container_width=True)
+        core_text = lambda m: "\n".join([format_df_string(g, "core") for g in m["core_groups"]]) or "無"
+        ally_text = lambda m: "\n".join([format_df_string(a, "ally") for a in m["ally_groups"] + m.get("ally_only_groups", [])]) or "無"
+        def build(rows):
+            reports = list(extra) + rows
+            resolve_alert_avatars([m for m in reports if not m.get("avatar_url")])
+            return pd.DataFrame({
+                "頭像": [m["avatar_url"] for m in reports], "名稱": [m["user_name"] for m in reports], "關聯": [m["relation"] for m in reports],
+                "預警核心": [core_text(m) for m in extra] + table.column("core_text", core_text)[:len(rows)],
+                "預警附屬": [ally_text(m) for m in extra] + table.column("ally_text", ally_text)[:len(rows)],
+                "玩家 ID": [str(m["user_id"]) for m in reports],
+            })
+        df = table.aggregate("summary", build)
+        st.dataframe(df, column_config={"頭像": st.column_config.ImageColumn("大頭貼"), "玩家 ID": st.column_config.TextColumn("ID")}, hide_index=True, use_container_width=True)
+
+def draw_job_panel(job_id, draw_fn):
+    """以 fragment 定期重繪背景工作狀態；工作結束時觸發整頁重跑以停止輪詢"""
+    job = JOB_RUNNER.get(job_id)
+    if not job: return
+    polling = job.active
+
+    @st.fragment(run_every=JOB_POLL_INTERVAL if polling else None)
+    def panel():
+        current = JOB_RUNNER.get(job_id)
+        if not current: return
+        draw_fn(current)
+        if polling and not current.active: st.rerun()
+
+    panel()
+
+def draw_job_progress(job):
+    """顯示背景工作的進度條、預計剩餘時間與停止按鈕"""
+    if job.total:
+        st.progress(min(1.0, job.done / job.total))
+        eta = job.eta()
+        eta_text = f"預計剩餘時間：{eta//60}分{eta%60}秒 " if eta is not None else ""
+        st.caption(f"⏳ {job.stage} {eta_text}({job.done}/{job.total})")
+    else:
+        st.caption(f"⏳ {job.stage}")
+    if st.button("⏹️ 停止掃描", key=f"stop_{job.id}"): job.cancel()
+
+def celebrate_job(job):
+    # 每個工作完成時只放一次氣球
+    if job.status == "done" and job.id not in st.session_state.celebrated_jobs:
+        st.session_state.celebrated_jobs.add(job.id)
+        st.balloons()
+
+def draw_user_scan_job(job):
+    d = job.data
+    if job.status == "failed": return st.error(f"❌ {job.error}")
+    if "target_id" not in d: return st.caption(f"⏳ {job.stage}")
+    st.success(f"✅ 鎖定目標：{d['target_name']} (ID: {d['target_id']}) | 👥 好友總數：{d['friend_count']}")
+
+    # --- 第一部分：掃描目標玩家本體 ---
+    st.markdown("### 🎯 目標玩家本體掃描")
+    with st.container(border=True):
+        if "target_alert" not in d: st.caption(f"⏳ {job.stage}")
+        elif d["target_alert"]: draw_alert_card(d["target_alert"])
+        else: st.info("💡 該目標玩家本體未命中預警名單。")
+
+    st.divider() 
+
+    # --- 第二部分：掃描社交圈 ---
+    st.markdown("### 👥 社交圈關聯掃描 (好友/關注/粉絲)")
+    if job.total is not None:
+        crawl_text = f" | 🕸️ 已使用請求預算 {d['crawl_spent']}" if "crawl_spent" in d else ""
+        st.caption(f"✅ 資料獲取完成 (共 {job.total} 位關聯人員) | 🧭 比對策略：{SCAN_STRATEGY_LABELS[job.data['strategy']]}{crawl_text}")
+    if job.active: draw_job_progress(job)
+    draw_alert_results(job)
+    if job.active: return
+
+    if "stopped" in d: st.info(f"⏱️ 已提前停止：{d['stopped']} (已檢查 {job.done}/{job.total} 人，命中可能性高者優先)")
+    if "incomplete" in d: st.warning(f"⚠️ {'、'.join(d['incomplete'])}名單翻頁失敗，只掃描了已讀取的部分，結果可能不完整。")
+    if job.total == 0: st.write("此玩家無公開社交圈資料。")
+    elif not job.alerts: st.write("✨ 社交圈掃描完成，未發現預警對象。")
+    if job.status == "cancelled": st.warning(f"⏹️ 掃描已停止，僅完成 {job.done}/{job.total} 人。")
+    draw_summary_dashboard(job.results, job.done + 1, f"{d['target_name']} 深度掃描", [d["target_alert"]] if d.get("target_alert") else [])
+    celebrate_job(job)
+
+def draw_group_sweep_job(job):
+    if job.status == "failed": return st.error(f"❌ {job.error}")
+    if "strategy" in job.data: st.caption(f"🧭 比對策略：{SCAN_STRATEGY_LABELS[job.data['strategy']]}")
+    if (shards := job.data.get("shards")):
+        failed_text = f" / ❌ {shards['failed']} 失敗" if shards["failed"] else ""
+        st.caption(f"🧩 分片：{shards['done']} 完成 / {shards['leased']} 處理中 / {shards['queued']} 待處理{failed_text} | 👷 {len(shards['workers'])} 個 worker")
+        if job.active and shards["workers"]:
+            workers = pd.DataFrame(shards["workers"])
+            workers["last_seen"] = pd.to_datetime(workers["last_seen"], unit="s")
+            st.dataframe(workers, hide_index=True, use_container_width=True)
+    if job.active: draw_job_progress(job)
+    draw_alert_results(job)
+    if job.active: return
+
+    final_job = SWEEP_STORE.summary(job.data["sweep_id"]) or {"status": "paused", "processed": job.done}
+    draw_summary_dashboard(job.results.sync(job.alerts), final_job["processed"], "群組深度排查")
+    if final_job["status"] == "done": celebrate_job(job)
+    elif "stopped" in job.data: st.info(f"⏱️ 已提前停止：{job.data['stopped']}。進度已保存，按「繼續」即可掃描剩餘成員。")
+    elif job.status == "cancelled": st.info("⏸️ 掃描已暫停，進度已保存，按「繼續」即可從中斷處續掃。")
+    else: st.warning("⚠️ 部分成員頁面暫時無法取得，進度已保存，請稍後按「繼續」完成剩餘掃描。")
+
+def draw_game_monitor_job(job):
+    if job.status == "failed": return st.error(f"❌ {job.error}")
+    if "servers" not in job.data: return st.info(f"🕵️ {job.stage}")
+    target_place_id, game_info, game_thumb = job.data["place_id"], job.data["game_info"], job.data["game_thumb"]
+    u_id = game_info['universeId']
+
+    st.markdown(f"### 🚀 監控目標：{game_info.get('name', '未知遊戲')}")
+
+    with st.container(border=True):
+        info_c1, info_c2 = st.columns([1, 3])
+        with info_c1:
+            st.image(game_thumb, use_container_width=True, caption=f"Universe ID: {u_id}")
+        with info_c2:
+            # 顯示 Display Name 與 ID 於同一行
+            st.markdown(f"""
+                <div style='display: flex; align-items: baseline; gap: 12px; margin-bottom: 15px;'>
+                    <h2 style='margin: 0; font-weight: 800;'>{game_info.get('name', '未知')}</h2>
+                    <span style='color: #888; font-size: 1.1em;'>ID: {target_place_id}</span>
+                </div>
+            """, unsafe_allow_html=True)
+            
+            m1, m2, m3 = st.columns(3)
+            # 使用 get 確保即便 API 欄位缺失也不會報錯
+            m1.metric("🔥 當前總人數", f"{game_info.get('playing', 0):,} 人")
+            m2.metric("⭐ 收藏總數", f"{game_info.get('favoritedCount', 0):,} 次")
+            m3.metric("📌 根場景 ID", game_info.get('rootPlaceId', 'N/A'))
+
+            if game_info.get('description'):
+                with st.expander("📝 查看遊戲詳細介紹"):
+                    st.write(game_info['description'])
+    st.divider()
+    
+    summary, diff = job.data["summary"], job.data["last_diff"]
+    if job.active:
+        next_in = max(0, int(job.data.get("next_poll", 0) - time.time()))
+        st.caption(f"📡 持續監控中：已取樣 {job.data['samples']} 次 | {job.stage} (約 {next_in} 秒後更新)")
+        if st.button("⏹️ 停止監控", key=f"stop_{job.id}"): job.cancel()
+    s1, s2, s3, s4 = st.columns(4)
+    s1.metric("🖥️ 公開伺服器數", f"{summary['servers']:,}", delta=None if job.data["first_sample"] else len(diff["opened"]) - len(diff["closed"]))
+    s2.metric("👥 公開伺服器人數", f"{summary['playing']:,} / {summary['capacity']:,}")
+    s3.metric("📶 平均延遲", f"{summary['avg_ping']:.0f} ms" if summary["avg_ping"] is not None else "N/A")
+    s4.metric("🎞️ 平均 FPS", f"{summary['avg_fps']:.1f}" if summary["avg_fps"] is not None else "N/A")
+    if not summary["complete"]: st.warning("⚠️ 伺服器清單翻頁未完成 (達到頁數上限或請求失敗)，本次快照僅含部分伺服器。")
+    if not job.data["first_sample"]:
+        st.caption(f"🔄 與上次快照相比：新開 {len(diff['opened'])} 台、關閉 {len(diff['closed'])} 台、人數變動 {len(diff['changed'])} 台")
+
+    # 趨勢圖表只讀本機時間序列，不會重新呼叫 API
+    samples = GAME_HISTORY.samples(target_place_id)
+    if len(samples) > 1:
+        hist = pd.DataFrame(samples, columns=["ts", "playing", "servers", "capacity", "avg_ping", "avg_fps", "opened", "closed", "complete"])
+        hist.index = pd.to_datetime(hist.pop("ts"), unit="s")
+        st.markdown("#### 📈 監控歷史趨勢")
+        h1, h2 = st.columns(2)
+        with h1: st.line_chart(hist[["playing"]].rename(columns={"playing": "公開伺服器人數"}), height=220)
+        with h2: st.line_chart(hist[["servers"]].rename(columns={"servers": "伺服器數"}), height=220)
+        h3, h4 = st.columns(2)
+        with h3: st.line_chart(hist[["avg_ping"]].rename(columns={"avg_ping": "平均延遲 (ms)"}), height=220)
+        with h4: st.line_chart(hist[["avg_fps"]].rename(columns={"avg_fps": "平均 FPS"}), height=220)
+        events = GAME_HISTORY.server_events(target_place_id)
+        if events:
+            with st.expander(f"🧾 最近伺服器異動紀錄 ({len(events)} 筆)"):
+                ev = pd.DataFrame(events, columns=["時間", "伺服器 ID", "事件", "人數", "變動"])
+                ev["時間"] = pd.to_datetime(ev["時間"], unit="s")
+                ev["事件"] = ev["事件"].map({"open": "🟢 新開", "close": "🔴 關閉"})
+                st.dataframe(ev, hide_index=True, use_container_width=True)
+
+    if "watch_hits" in job.data:
+        st.markdown("#### 👁️ 預警名單玩家所在伺服器")
+        st.caption(f"已比對 {job.data['watch_resolved']:,}/{job.data['watch_tokens']:,} 位玩家頭像 | 命中者頭像索引：{job.data['watch_index']:,} 人")
+        if job.data["watch_hits"]:
+            # 頭像相同不代表同一人 (同一套裝扮的頭像 URL 相同)，只列為候選
+            st.dataframe(pd.DataFrame([{
+                "比對": f"頭像相符 ({len(h['candidates'])} 位候選)", "候選玩家": " / ".join(c["user_name"] for c in h["candidates"]),
+                "ID": " / ".join(str(c["user_id"]) for c in h["candidates"]), "命中關聯": " / ".join(dict.fromkeys(str(c["relation"]) for c in h["candidates"])),
+                "伺服器 ID": h["server_id"][:15] + "...", "伺服器人數": f"{h['playing']} / {h['max_players']}",
+                "首次發現": pd.to_datetime(h["first_seen"], unit="s"),
+                "操作": f"roblox://experiences/start?placeId={target_place_id}&gameInstanceId={h['server_id']}",
+            } for h in job.data["watch_hits"]]), column_config={"操作": st.column_config.LinkColumn("🔗 快速加入伺服器", display_text="點擊加入")}, hide_index=True, use_container_width=True)
+        elif not job.data["watch_index"]: st.info("ℹ️ 尚無命中者頭像索引，請先在其他分頁執行掃描。")
+        else: st.success("✅ 公開伺服器中未發現預警名單玩家。")
+
+    # 伺服器詳情列表
+    st.markdown(f"#### 🌐 公開伺服器即時狀況 (共 {summary['servers']:,} 台)")
+    servers = job.data["servers"]
+    
+    if servers:
+        server_data = []
+        for s in servers:
+            # 建立快速進入連結
+            join_link = f"roblox://experiences/start?placeId={target_place_id}&gameInstanceId={s['id']}"
+            server_data.append({
+                "伺服器 ID": s['id'][:15] + "...",
+                "當前人數": f"{s.get('playing', 0)} / {s.get('maxPlayers', 0)}",
+                "延遲 (Ping)": f"{s.get('ping', 'N/A')} ms",
+                "FPS 表現": f"{s['fps']:.1f}" if s.get("fps") is not None else "N/A",
+                "操作": join_link
+            })
+        
+        st.dataframe(
+            pd.DataFrame(server_data),
+            column_config={
+                "操作": st.column_config.LinkColumn("🔗 快速加入伺服器", display_text="點擊加入")
+            },
+            hide_index=True,
+            use_container_width=True
+        )
+    else:
+        st.info("ℹ️ 此遊戲目前無公開伺服器資訊或暫無人遊玩。")
+
+def draw_bulk_lookup_job(job):
+    if job.status == "failed": return st.error(f"❌ {job.error}")
+    if job.active: draw_job_progress(job)
+    rows = job.data.get("rows", [])
+    if job.data.get("unresolved"): st.warning(f"⚠️ 無法解析 {len(job.data['unresolved'])} 筆：{', '.join(job.data['unresolved'][:50])}")
+    if not rows: return
+    hits = sum(r["warning_hits"] > 0 for r in rows)
+    c1, c2, c3 = st.columns(3)
+    c1.metric("已查詢玩家", f"{len(rows)} / {job.total}")
+    c2.metric("🚨 命中預警名單", f"{hits} 人")
+    c3.metric("🔴 已封鎖帳號", f"{sum(bool(r['banned']) for r in rows)} 人")
+    # 命中者排在前面並以紅底標示，其餘欄位可點欄名排序
+    df = pd.DataFrame(sorted(rows, key=lambda r: (-r["warning_hits"], -(r["max_warning_rank"] or 0))))
+    df = df.rename(columns={"avatar_url": "頭像", "user_name": "帳號名稱", "display_name": "顯示名稱", "user_id": "玩家 ID", "created": "加入日期", "banned": "已封鎖",
+                            "friends": "好友數", "groups": "群組數", "warning_hits": "命中數", "max_warning_rank": "最高預警 Rank", "warning_groups": "命中群組 / 職位"})
+    df = df[["頭像", "顯示名稱", "帳號名稱", "玩家 ID", "命中數", "最高預警 Rank", "命中群組 / 職位", "好友數", "群組數", "加入日期", "已封鎖"]]
+    df["玩家 ID"] = df["玩家 ID"].astype(str)
+    styled = df.style.apply(lambda r: ["background-color: rgba(255, 75, 75, 0.18)" if r["命中數"] else ""] * len(r), axis=1)
+    st.dataframe(styled, column_config={"頭像": st.column_config.ImageColumn("大頭貼")}, hide_index=True, use_container_width=True)
+    if not job.active:
+        st.download_button("⬇️ 匯出 CSV", df.drop(columns=["頭像"]).to_csv(index=False).encode("utf-8-sig"), file_name="roblox_bulk_lookup.csv", mime="text/csv", key=f"bulk_csv_{job.id}")
+
+def draw_alert_query(rows, users):
+    c1, c2 = st.columns(2)
+    c1.metric("符合條件的玩家", len(users))
+    c2.metric("命中紀錄筆數", len(rows))
+    if not users: return st.info("ℹ️ 目前沒有符合條件的命中紀錄。")
+    st.dataframe(pd.DataFrame([{**u, "groups": " | ".join(u["groups"]), "last_seen": pd.to_datetime(u["last_seen"], unit="s")} for u in users]), use_container_width=True, hide_index=True)
+    with st.expander(f"📄 原始命中紀錄 ({len(rows)} 筆)"):
+        df_rows = pd.DataFrame(rows, columns=ALERT_COLUMNS)
+        df_rows["scanned_at"] = pd.to_datetime(df_rows["scanned_at"], unit="s")
+        st.dataframe(df_rows, use_container_width=True, hide_index=True)
+    # 匯出內容在按下下載時才產生
+    e_col1, e_col2 = st.columns(2)
+    e_col1.download_button("⬇️ 匯出 CSV", lambda: export_alert_rows(rows, "csv"), file_name="roblox_alerts.csv", mime="text/csv", use_container_width=True)
+    if parquet_export_available(): e_col2.download_button("⬇️ 匯出 Parquet", lambda: export_alert_rows(rows, "parquet"), file_name="roblox_alerts.parquet", mime="application/octet-stream", use_container_width=True)
+    else: e_col2.caption("⚠️ 匯出 Parquet 需要安裝 pandas 與 pyarrow")
+
+def monitor_changes_df(rows):
+    df = pd.DataFrame(rows, columns=["時間", "監控目標", "玩家 ID", "玩家", "變動", "群組 ID", "群組", "說明"])
+    df["時間"] = pd.to_datetime(df["時間"], unit="s")
+    df["變動"] = df["變動"].map(MONITOR_CHANGE_LABELS)
+    df["玩家 ID"] = df["玩家 ID"].astype(str)
+    return df
+
+def draw_incremental_monitor_job(job):
+    if job.status == "failed": return st.error(f"❌ {job.error}")
+    d = job.data
+    if job.active and job.stage.startswith("等待"):
+        next_in = max(0, int(d.get("next_run", 0) - time.time()))
+        st.caption(f"🔁 定期增量監控中：已完成 {d['runs']} 輪 (約 {next_in // 60} 分鐘後下一輪)")
+        if st.button("⏹️ 停止監控", key=f"stop_{job.id}"): job.cancel()
+    elif job.active: draw_job_progress(job)
+    if "strategy" in d: st.caption(f"🧭 比對策略：{SCAN_STRATEGY_LABELS[d['strategy']]} | 本輪重查 {job.done} 人")
+    if d.get("failed"): st.warning(f"⚠️ 以下目標本輪無法取得成員資料，下次再試：{'、'.join(d['failed'])}")
+    changes = d.get("changes", [])
+    if changes:
+        st.markdown(f"#### 🧾 本次工作偵測到的變動 ({len(changes)} 筆)")
+        st.dataframe(monitor_changes_df([(e["ts"], e["target"], e["user_id"], e["user_name"], e["change"], e["group_id"], e["group_name"], e["detail"]) for e in changes]), hide_index=True, use_container_width=True)
+    elif not job.active and d.get("runs"): st.success("✅ 增量檢查完成，未偵測到變動 (首次加入的目標只會建立比對基準)。")
+    draw_alert_results(job)
 
 # ================= Streamlit 網頁主程式 =================
 st.title("👁️‍🗨️ Roblox 深度情報交叉比對系統")
@@ -341,7 +483,7 @@ if not WARNING_GROUP_IDS:
     st.error("👈 請先在左側邊欄輸入有效的「高風險社群 ID」！")
 else:
     # 更新導覽標籤
-    tab1, tab2, tab3, tab4 = st.tabs(["👤 單一目標深度掃描", "🛡️ 群組大範圍降維掃描", "🔍 玩家帳號深度查詢", "🎮 遊戲即時監控"])
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["👤 單一目標深度掃描", "🛡️ 群組大範圍降維掃描", "🔍 玩家帳號深度查詢", "🎮 遊戲即時監控", "📚 歷史命中查詢", "🔁 增量監控"])
 
     # ---------------- Tab 1: 單一目標掃描 ----------------
     with tab1:
@@ -353,94 +495,22 @@ else:
             st.markdown("<br>", unsafe_allow_html=True)
             scan_all = st.checkbox("⚠️ 解除人數限制 (全數掃描追蹤名單)")
             limit = None if scan_all else 100
+        d1, d2 = st.columns(2)
+        with d1:
+            crawl_depth = st.number_input("🕸️ 社交圈擴散層數", min_value=1, max_value=CRAWL_MAX_DEPTH, value=1, help="2 以上會沿好友關係往外擴散 (好友的好友)，命中者與關聯度高者優先擴散")
+        with d2:
+            crawl_budget = st.number_input("API 請求預算 (多層擴散時)", min_value=100, value=CRAWL_DEFAULT_BUDGET, step=500, disabled=crawl_depth == 1)
+        tab1_stop = stop_condition_inputs("tab1")
             
         if st.button("啟動掃描程序", type="primary", key="btn_p"):
             if not user_input:
                 st.error("❌ 請輸入玩家名稱或 ID")
             else:
-                uid, uname = resolve_user_input(user_input)
-                if not uid: 
-                    st.error("❌ 無法解析目標玩家。")
-                else:
-                    # 【新增顯示】在畫面上方顯示總好友數
-                    f_count_api = f"https://friends.roblox.com/v1/users/{uid}/friends/count"
-                    try:
-                        f_count = requests.get(f_count_api).json().get("count", 0)
-                    except:
-                        f_count = "未知"
-                    st.success(f"✅ 鎖定目標：{uname} (ID: {uid}) | 👥 好友總數：{f_count}")
-                    
-                    alerted_list = []
-
-                    # --- 第一部分：掃描目標玩家本體 ---
-                    st.markdown("### 🎯 目標玩家本體掃描")
-                    with st.container(border=True):
-                        main_alert = fetch_alert_data(uid, uname, "目標玩家本體", WARNING_GROUP_IDS)
-                        if main_alert:
-                            alerted_list.append(main_alert)
-                            draw_alert_card(main_alert)
-                        else:
-                            st.info("💡 該目標玩家本體未命中預警名單。")
-
-                    st.divider() 
-
-                    # --- 第二部分：掃描社交圈 ---
-                    st.markdown("### 👥 社交圈關聯掃描 (好友/關注/粉絲)")
-                    
-                    scan_queue = []
-                    with st.status("正在獲取社交圈完整資料...", expanded=True) as status:
-                        # 掃描全部好友
-                        friends = get_user_friends(uid)
-                        for f in friends:
-                            if str(f["id"]) != str(uid): scan_queue.append({"id": f["id"], "name": f["name"], "rel": "目標的好友"})
-                        
-                        followings = get_user_followings(uid, limit=limit)
-                        for f in followings:
-                            if str(f["id"]) != str(uid): scan_queue.append({"id": f["id"], "name": f["name"], "rel": "目標關注的人"})
-                            
-                        followers = get_user_followers(uid, limit=limit)
-                        for f in followers:
-                            if str(f["id"]) != str(uid): scan_queue.append({"id": f["id"], "name": f["name"], "rel": "目標的粉絲"})
-                        
-                        status.update(label=f"✅ 資料獲取完成 (共 {len(scan_queue)} 位關聯人員)", state="complete", expanded=False)
-                    
-                    total_to_scan = len(scan_queue)
-                    if total_to_scan > 0:
-                        progress_placeholder = st.empty()
-                        found_in_social = 0
-                        start_time = time.time()
-                        
-                        with progress_placeholder.container():
-                            p_bar = st.progress(0)
-                            p_text = st.empty()
-                        
-                        for i, person in enumerate(scan_queue):
-                            elapsed = time.time() - start_time
-                            eta = int((elapsed / (i + 1)) * (total_to_scan - (i + 1)))
-                            p_bar.progress((i + 1) / total_to_scan)
-                            p_text.caption(f"⏳ 交叉比對中... 預計剩餘時間：{eta//60}分{eta%60}秒 ({i+1}/{total_to_scan})")
-                            
-                            alert = fetch_alert_data(person["id"], person["name"], person["rel"], WARNING_GROUP_IDS)
-                            if alert:
-                                try:
-                                    u_api = f"https://users.roblox.com/v1/users/{person['id']}"
-                                    u_data = requests.get(u_api, timeout=5).json()
-                                    real_name = u_data.get("name", person["name"])
-                                    disp_name = u_data.get("displayName", "")
-                                    alert["user_name"] = f"{disp_name} (@{real_name})"
-                                except:
-                                    alert["user_name"] = person["name"]
-
-                                alerted_list.append(alert)
-                                found_in_social += 1
-                                draw_alert_card(alert)
-                        
-                        progress_placeholder.empty()
-                        if found_in_social == 0: st.write("✨ 社交圈掃描完成，未發現預警對象。")
-                    else: st.write("此玩家無公開社交圈資料。")
-
-                    draw_summary_dashboard(alerted_list, total_to_scan + 1, f"{uname} 深度掃描")
-                    st.balloons()
+                # 掃描在背景執行，切換分頁或操作其他元件都不會中斷
+                st.session_state.active_jobs["tab1"] = JOB_RUNNER.submit("user", f"{user_input} 深度掃描", job_scan_user, user_input, frozenset(WARNING_GROUP_IDS), limit, FLAG_ALLY_ONLY, int(crawl_depth), int(crawl_budget), tab1_stop)
+
+        if st.session_state.active_jobs.get("tab1"):
+            draw_job_panel(st.session_state.active_jobs["tab1"], draw_user_scan_job)
 
     # ---------------- Tab 2: 大型群組掃描 (略，同原程式) ----------------
     with tab2:
@@ -471,18 +541,38 @@ else:
             total_est = sum(r.get("memberCount", 0) for r in selected_roles)
             st.info(f"💡 預計排查區間包含 {len(selected_roles)} 個階層，約 {total_est} 名人員。")
 
-            if st.button("2. 執行大範圍掃描", type="primary"):
-                with st.spinner("正在執行深度比對..."):
-                    mems = get_members_of_roles(target_group_id, selected_roles)
-                    if mems:
-                        alerted_m, bar, status = [], st.progress(0), st.empty()
-                        for i, m in enumerate(mems):
-                            bar.progress((i+1)/len(mems))
-                            status.text(f"檢查中 {i+1}/{len(mems)}: {m['name']}")
-                            a = fetch_alert_data(m["id"], m["name"], f"成員 [{m['rank_name']}]", WARNING_GROUP_IDS, int(target_group_id))
-                            if a: draw_alert_card(a); alerted_m.append(a)
-                        draw_summary_dashboard(alerted_m, len(mems), "群組深度排查")
-                        st.balloons()
+            # 同一群組、階層區間與預警名單的掃描進度會保存在本機，可隨時中斷後續掃
+            sweep_id = SweepStore.job_id(target_group_id, selected_roles, WARNING_GROUP_IDS, FLAG_ALLY_ONLY)
+            saved_job = SWEEP_STORE.summary(sweep_id)
+            if saved_job:
+                job_label = "已完成" if saved_job["status"] == "done" else "未完成"
+                st.caption(f"💾 已保存的{job_label}掃描進度：已檢查 {saved_job['processed']} 人，命中 {saved_job['alerts']} 筆預警。")
+
+            tab2_sharded = st.checkbox("🧩 分片模式 (多個 worker 平行掃描，適合超大型群組)", key="tab2_sharded")
+            if tab2_sharded:
+                tab2_workers = st.number_input("本機 worker 數量：", min_value=1, max_value=8, value=2, key="tab2_local_workers")
+                st.caption(f"同一台主機上的其他行程可加入掃描 (佇列檔案不可放在網路磁碟、不支援跨主機)：`ROBLOX_SHARD_DB={SHARD_DB_PATH} python roblox_cli.py shard-worker --sweep {sweep_id}`")
+            else: tab2_stop = stop_condition_inputs("tab2")
+            sweep_key = ("sweep", sweep_id)
+            running = next((j for j in JOB_RUNNER.list_jobs() if j.key == sweep_key and j.active), None)
+            b1, b2 = st.columns(2)
+            run_sweep = b1.button("2. 執行大範圍掃描" if not saved_job else "▶️ 繼續 / 檢視掃描結果", type="primary", disabled=bool(running), use_container_width=True)
+            if b2.button("🔄 清除進度並重新掃描", disabled=not saved_job or bool(running), use_container_width=True):
+                SWEEP_STORE.reset_job(sweep_id)
+                SHARD_QUEUE.reset_sweep(sweep_id)
+                run_sweep = True
+
+            if run_sweep and tab2_sharded:
+                st.session_state.active_jobs["tab2"] = JOB_RUNNER.submit("group", f"群組 {target_group_id} 分片排查", job_sharded_sweep, sweep_id, target_group_id, selected_roles, frozenset(WARNING_GROUP_IDS), total_est, FLAG_ALLY_ONLY, int(tab2_workers), key=sweep_key)
+            elif run_sweep:
+                # 多位分析師對同一群組發起相同掃描時會共用同一個背景工作；停止後進度仍保存可續掃
+                st.session_state.active_jobs["tab2"] = JOB_RUNNER.submit("group", f"群組 {target_group_id} 深度排查", job_group_sweep, sweep_id, target_group_id, selected_roles, frozenset(WARNING_GROUP_IDS), total_est, FLAG_ALLY_ONLY, tab2_stop, key=sweep_key)
+            elif running:
+                st.session_state.active_jobs["tab2"] = running.id
+
+            tab2_job = JOB_RUNNER.get(st.session_state.active_jobs.get("tab2"))
+            if tab2_job and tab2_job.data.get("sweep_id", sweep_id) == sweep_id:
+                draw_job_panel(tab2_job.id, draw_group_sweep_job)
     # ---------------- Tab 3: 玩家個資深度查詢 (排版優化版) ----------------
     # ---------------- Tab 3: 玩家個資深度查詢 (資訊層次優化版) ----------------
     with tab3:
@@ -508,8 +598,8 @@ else:
                     else:
                         try:
                             # 資料獲取
-                            detail_res = requests.get(f"https://users.roblox.com/v1/users/{target_uid}").json()
-                            friend_count = requests.get(f"https://friends.roblox.com/v1/users/{target_uid}/friends/count").json().get("count", "未知")
+                            detail_res = get_user_detail(target_uid)
+                            friend_count = roblox_get(f"https://friends.roblox.com/v1/users/{target_uid}/friends/count").json().get("count", "未知")
                             avatar_url = get_user_thumbnail(target_uid)
                             profile_url = f"https://www.roblox.com/users/{target_uid}/profile"
                             
@@ -601,6 +691,18 @@ else:
                                 
                         except Exception as e:
                             st.error(f"❌ 檢索失敗：{str(e)}")
+
+        st.divider()
+        st.markdown("#### 📋 批次查詢 (一次貼上多個名稱 / ID)")
+        with st.container(border=True):
+            bulk_input = st.text_area("每行一個玩家名稱或 ID (也可用逗號 / 空白分隔)：", key="bulk_lookup_input", height=150)
+            bulk_names = [n for n in re.split(r"[\s,，]+", bulk_input) if n]
+            b_col1, b_col2 = st.columns([3, 1])
+            b_col1.caption(f"已輸入 {len(bulk_names)} 筆 (單次上限 {BULK_LOOKUP_MAX} 筆)")
+            if b_col2.button("📋 批次檢索", use_container_width=True, disabled=not bulk_names):
+                st.session_state.active_jobs["tab3_bulk"] = JOB_RUNNER.submit("lookup", f"批次查詢 {len(bulk_names)} 位玩家", job_bulk_lookup, bulk_names, frozenset(WARNING_GROUP_IDS), FLAG_ALLY_ONLY)
+        if st.session_state.active_jobs.get("tab3_bulk"):
+            draw_job_panel(st.session_state.active_jobs["tab3_bulk"], draw_bulk_lookup_job)
     # ---------------- Tab 4: 遊戲即時監控 ----------------
     with tab4:
         st.subheader("🎮 特定遊戲體驗 (Experience) 即時數據")
@@ -614,70 +716,101 @@ else:
             with t_col2:
                 st.markdown("<br>", unsafe_allow_html=True)
                 btn_game_scan = st.button("📡 啟動即時監控", type="primary", use_container_width=True)
+            m_col1, m_col2 = st.columns([1, 3])
+            with m_col1:
+                continuous = st.checkbox("🔁 持續監控", help="定期重新翻頁讀取所有伺服器，並記錄開關服與人數變化歷史")
+                watch_presence = st.checkbox("👁️ 偵測預警名單玩家", help="以伺服器的 playerTokens 頭像比對歷次掃描命中者，找出他們目前所在的伺服器")
+            with m_col2:
+                monitor_interval = st.number_input("輪詢間隔 (秒)", min_value=10, value=GAME_MONITOR_INTERVAL, step=10, disabled=not continuous)
         if btn_game_scan:
             if not target_place_id.isdigit():
                 st.error("❌ 請輸入有效的數字 Place ID")
             else:
-                with st.spinner("🕵️ 正在讀取遊戲伺服器雲端數據..."):
-                    game_info = get_game_details(target_place_id)
-                    
-                    # 檢查資料是否完整
-                    if not game_info or 'universeId' not in game_info:
-                        st.error("❌ 無法獲取該遊戲資訊或 Universe ID。請確認 ID 是否正確。")
-                    else:
-                        u_id = game_info['universeId']
-                        game_thumb = get_game_thumbnail(u_id)
-                        
-                        st.markdown(f"### 🚀 監控目標：{game_info.get('name', '未知遊戲')}")
-                        
-                        with st.container(border=True):
-                            info_c1, info_c2 = st.columns([1, 3])
-                            with info_c1:
-                                st.image(game_thumb, use_container_width=True, caption=f"Universe ID: {u_id}")
-                            with info_c2:
-                                # 顯示 Display Name 與 ID 於同一行
-                                st.markdown(f"""
-                                    <div style='display: flex; align-items: baseline; gap: 12px; margin-bottom: 15px;'>
-                                        <h2 style='margin: 0; font-weight: 800;'>{game_info.get('name', '未知')}</h2>
-                                        <span style='color: #888; font-size: 1.1em;'>ID: {target_place_id}</span>
-                                    </div>
-                                """, unsafe_allow_html=True)
-                                
-                                m1, m2, m3 = st.columns(3)
-                                # 使用 get 確保即便 API 欄位缺失也不會報錯
-                                m1.metric("🔥 當前總人數", f"{game_info.get('playing', 0):,} 人")
-                                m2.metric("⭐ 收藏總數", f"{game_info.get('favoritedCount', 0):,} 次")
-                                m3.metric("📌 根場景 ID", game_info.get('rootPlaceId', 'N/A'))
-
-                                if game_info.get('description'):
-                                    with st.expander("📝 查看遊戲詳細介紹"):
-                                        st.write(game_info['description'])
-                        st.divider()
-                        
-                        # 伺服器詳情列表
-                        st.markdown("#### 🌐 公開伺服器即時狀況 (Top 20)")
-                        servers = get_game_servers(target_place_id)
-                        
-                        if servers:
-                            server_data = []
-                            for s in servers:
-                                # 建立快速進入連結
-                                join_link = f"roblox://experiences/start?placeId={target_place_id}&gameInstanceId={s['id']}"
-                                server_data.append({
-                                    "伺服器 ID": s['id'][:15] + "...",
-                                    "當前人數": f"{s['playing']} / {s['maxPlayers']}",
-                                    "延遲 (Ping)": f"{s['ping']} ms",
-                                    "FPS 表現": f"{s['fps']:.1f}",
-                                    "操作": join_link
-                                })
-                            
-                            st.dataframe(
-                                pd.DataFrame(server_data),
-                                column_config={
-                                    "操作": st.column_config.LinkColumn("🔗 快速加入伺服器", display_text="點擊加入")
-                                },
-                                hide_index=True,
-                                use_container_width=True
-                            )
-                        else:
-                            st.info("ℹ️ 此遊戲目前無公開伺服器資訊或暫無人遊玩。")
\ No newline at end of file
+                # 同一遊戲只保留一個持續監控工作
+                interval = int(monitor_interval) if continuous else 0
+                st.session_state.active_jobs["tab4"] = JOB_RUNNER.submit("game", f"遊戲 {target_place_id} {'持續監控' if interval else '即時數據'}", job_game_monitor, target_place_id, interval, watch_presence, key=("game_monitor", target_place_id, watch_presence) if interval else None, dedicated=bool(interval))
+
+        if st.session_state.active_jobs.get("tab4"):
+            draw_job_panel(st.session_state.active_jobs["tab4"], draw_game_monitor_job)
+
+    # ---------------- Tab 5: 歷史命中查詢 ----------------
+    with tab5:
+        st.subheader("📚 歷次掃描命中紀錄查詢")
+        st.caption("每次掃描的命中都會攤平成 (玩家, 群組, 職位, 階級, 關聯, 掃描, 時間) 保存，不必重新掃描即可跨掃描查詢與匯出。")
+        with st.container(border=True):
+            q_col1, q_col2, q_col3 = st.columns(3)
+            with q_col1:
+                q_days = st.number_input("最近幾天", min_value=1, value=30, step=1)
+                q_min_rank = st.number_input("最低 Rank", min_value=0, max_value=255, value=200, step=1)
+            with q_col2:
+                q_types = st.multiselect("命中類型", list(ALERT_MATCH_TYPES.values()), default=["core"], help="core：預警核心社群 / ally：核心成員所屬同盟 / ally_only：僅加入同盟 / scanned_ally：額外監控同盟")
+            with q_col3:
+                q_groups = st.text_input("限定群組 ID (逗號分隔，留空為全部)")
+            btn_alert_query = st.button("🔍 查詢", type="primary", use_container_width=True, key="btn_alert_query")
+        if btn_alert_query:
+            # 只在按下查詢時讀取資料庫；其他分頁的操作重新執行腳本時沿用上次結果，不隨歷史筆數變慢
+            rows = ALERT_STORE.query(q_min_rank, time.time() - q_days * 86400, [int(g) for g in q_groups.replace(" ", "").split(",") if g.isdigit()], q_types)
+            st.session_state.alert_query = {"rows": rows, "users": ALERT_STORE.summarize_users(rows)}
+        alert_query = st.session_state.get("alert_query")
+        if alert_query is None:
+            st.caption("設定條件後按「查詢」。")
+        else:
+            draw_alert_query(alert_query["rows"], alert_query["users"])
+
+    # ---------------- Tab 6: 增量監控 ----------------
+    with tab6:
+        st.subheader("🔁 定期增量監控 (只重查有變動的成員)")
+        st.caption("保存每個目標的成員快照與預警群組職位，之後每輪只抓變動部分，輸出「加入預警社群」、「晉升」等變動事件。使用目前側邊欄的預警社群設定。")
+        with st.container(border=True):
+            a_col1, a_col2, a_col3 = st.columns([1, 2, 1])
+            with a_col1:
+                monitor_kind = st.radio("目標類型", ["群組", "玩家"], horizontal=True)
+            with a_col2:
+                monitor_input = st.text_input("群組 ID 或玩家名稱 / ID", key="input_monitor")
+            with a_col3:
+                st.markdown("<br>", unsafe_allow_html=True)
+                btn_add_monitor = st.button("➕ 加入監控", use_container_width=True)
+        if btn_add_monitor:
+            if monitor_kind == "群組":
+                roles = get_group_roles(monitor_input) if monitor_input.isdigit() else None
+                if not roles: st.error("❌ 無法取得群組階層，請確認群組 ID。")
+                else:
+                    MONITOR_STORE.add_target("group", monitor_input, f"群組 {monitor_input}", WARNING_GROUP_IDS, FLAG_ALLY_ONLY)
+                    st.success(f"✅ 已加入群組 {monitor_input}")
+            else:
+                uid, uname = resolve_user_input(monitor_input)
+                if not uid: st.error("❌ 無法解析目標玩家。")
+                else:
+                    MONITOR_STORE.add_target("user", uid, uname, WARNING_GROUP_IDS, FLAG_ALLY_ONLY)
+                    st.success(f"✅ 已加入玩家 {uname}")
+
+        targets = MONITOR_STORE.targets()
+        if targets:
+            st.dataframe(pd.DataFrame([{
+                "目標": t["title"], "類型": "群組" if t["kind"] == "group" else "玩家", "ID": str(t["target_id"]),
+                "預警社群": ", ".join(map(str, t["config"]["warning_ids"])), "上次檢查": pd.to_datetime(t["last_run"], unit="s") if t["last_run"] else "尚未建立基準",
+            } for t in targets]), hide_index=True, use_container_width=True)
+            r_col1, r_col2, r_col3 = st.columns([1, 1, 2])
+            with r_col1:
+                monitor_continuous = st.checkbox("🔁 定期執行")
+            with r_col2:
+                monitor_hours = st.number_input("間隔 (小時)", min_value=1, value=MONITOR_DEFAULT_INTERVAL // 3600, disabled=not monitor_continuous)
+            with r_col3:
+                if st.button("▶️ 立即增量檢查全部目標", type="primary", use_container_width=True):
+                    interval = int(monitor_hours) * 3600 if monitor_continuous else 0
+                    st.session_state.active_jobs["tab6"] = JOB_RUNNER.submit("monitor", f"增量監控 {len(targets)} 個目標", job_incremental_monitor, None, interval, key=("monitor",) if interval else None, dedicated=bool(interval))
+            with st.expander("🗑️ 移除監控目標"):
+                removing = st.multiselect("選擇要移除的目標 (快照與變動紀錄會一併刪除)", targets, format_func=lambda t: f"{t['title']} ({t['key']})")
+                if st.button("移除", disabled=not removing):
+                    for t in removing: MONITOR_STORE.remove_target(t["key"])
+                    st.rerun()
+        else:
+            st.info("ℹ️ 尚未加入任何監控目標。")
+
+        if st.session_state.active_jobs.get("tab6"):
+            draw_job_panel(st.session_state.active_jobs["tab6"], draw_incremental_monitor_job)
+
+        history = MONITOR_STORE.changes(limit=200)
+        if history:
+            with st.expander(f"📜 最近變動紀錄 ({len(history)} 筆)", expanded=not st.session_state.active_jobs.get("tab6")):
+                st.dataframe(monitor_changes_df(history), hide_index=True, use_container_width=True)
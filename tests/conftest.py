@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# 匯入 roblox_core 前先把預設資料庫指到暫存目錄，測試不會寫入工作目錄
+os.environ.setdefault("ROBLOX_MONITOR_CACHE_DB", os.path.join(tempfile.mkdtemp(prefix="roblox_test_"), "cache.sqlite3"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
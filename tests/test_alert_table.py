@@ -0,0 +1,21 @@
+from roblox_core import AlertTable
+
+def _report(uid, group_id=1, rank=10):
+    return {"user_id": uid, "user_name": f"u{uid}", "core_groups": [{"group_id": group_id, "group_name": f"g{group_id}", "rank_num": rank}], "ally_groups": []}
+
+def test_aggregate_is_rebuilt_only_when_rows_are_added():
+    alerts, builds = [_report(1), _report(2)], []
+    table = AlertTable().sync(alerts)
+    summary = lambda reports: builds.append(len(reports)) or [r["user_id"] for r in reports]
+    assert table.aggregate("ids", summary) == [1, 2]
+    assert table.aggregate("ids", summary) == [1, 2]
+    alerts.append(_report(3, group_id=2, rank=200))
+    assert table.sync(alerts).aggregate("ids", summary) == [1, 2, 3]
+    assert builds == [2, 3]
+
+def test_query_filters_columns_without_reports():
+    table = AlertTable().sync([_report(1), _report(22, group_id=2, rank=200), _report(3)])
+    assert table.query(group_ids={2}) == [1]
+    assert table.query(min_rank=100) == [1]
+    assert table.query(text="u3") == [2]
+    assert table.query(by_rank=True)[0] == 1
@@ -0,0 +1,18 @@
+from roblox_core import IdSpool, merge_relation_ids
+
+def test_spool_spills_sorted_runs_and_keeps_duplicates():
+    spool = IdSpool(chunk=3)
+    spool.extend([9, 1, 5])
+    spool.extend([5, 2])
+    assert len(spool.runs) == 1 and spool.count == 5
+    assert list(spool) == [1, 2, 5, 5, 9]
+    spool.close()
+    assert list(spool) == []
+
+def test_merge_dedups_across_relations_with_bitmask():
+    friends, followers, followings = IdSpool(chunk=2), IdSpool(chunk=2), IdSpool()
+    friends.extend([3, 1, 7])
+    followers.extend([7, 3, 3, 8])
+    followings.extend([1])
+    merged = list(merge_relation_ids([(friends, 1), (followings, 2), (followers, 4)]))
+    assert merged == [(1, 1 | 2), (3, 1 | 4), (7, 1 | 4), (8, 4)]
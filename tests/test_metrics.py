@@ -0,0 +1,11 @@
+from roblox_core import Metrics
+
+def test_quantile_reports_overflow_bucket_as_infinity():
+    m = Metrics(buckets=(0.5, 1.0))
+    assert m.quantile("t", 0.5) is None
+    for s in (0.1, 0.2, 0.8, 30.0): m.observe("t", s)
+    assert m.quantile("t", 0.5) == 0.5
+    assert m.quantile("t", 0.75) == 1.0
+    assert m.quantile("t", 0.95) == float("inf")
+    assert [m.format_quantile(m.quantile("t", q)) for q in (0.5, 0.95)] == ["≤0.5s", ">1s"]
+    assert m.format_quantile(None) == "—"
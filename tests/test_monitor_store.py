@@ -0,0 +1,21 @@
+import sqlite3
+import time
+
+from roblox_core import MonitorStore
+
+def test_states_record_when_each_member_was_checked(tmp_path):
+    store = MonitorStore(str(tmp_path / "monitor.sqlite3"))
+    key = store.add_target("group", 5, "g", {1000})
+    before = time.time()
+    store.save_run(key, {7: {"name": "a", "rel": "成員", "role_id": 1}}, {}, {7: ("1000:3", {1000: ["w", "Officer", 200, "core"]}), 8: ("", {})}, [], [])
+    states = store.states(key)
+    assert list(states) == [7]
+    sig, groups, checked_at = states[7]
+    assert sig == "1000:3" and groups == {1000: ["w", "Officer", 200, "core"]} and checked_at >= before
+
+def test_legacy_states_are_due_for_recheck(tmp_path):
+    path = str(tmp_path / "monitor.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE monitor_states (target_key TEXT, user_id INTEGER, sig TEXT, groups TEXT, PRIMARY KEY (target_key, user_id))")
+        conn.execute("INSERT INTO monitor_states VALUES ('k', 7, '1000:3', '{}')")
+    assert MonitorStore(path).states("k") == {7: ("1000:3", {}, 0)}
@@ -0,0 +1,21 @@
+import time
+
+from roblox_core import PersistentCache
+
+def _age(cache, kind, key, seconds):
+    with cache.conn: cache.conn.execute("UPDATE cache SET fetched_at = ? WHERE kind = ? AND key = ?", (time.time() - seconds, kind, str(key)))
+
+def test_stale_window_is_per_kind(tmp_path):
+    cache = PersistentCache(str(tmp_path / "cache.sqlite3"), {"user_groups": 100, "profiles": 100}, {"user_groups": 50, "profiles": 1000})
+    cache.set_many("user_groups", {1: [7]})
+    cache.set_many("profiles", {1: {"name": "a"}})
+    _age(cache, "user_groups", 1, 120)
+    _age(cache, "profiles", 1, 120)
+    assert cache.get_many("user_groups", [1]) == ({"1": [7]}, ["1"])
+    assert cache.get_many("profiles", [1]) == ({"1": {"name": "a"}}, ["1"])
+
+    # 超過該類別的寬限期後視為未命中，必須重新抓取
+    _age(cache, "user_groups", 1, 200)
+    _age(cache, "profiles", 1, 200)
+    assert cache.get_many("user_groups", [1]) == ({}, [])
+    assert cache.get_many("profiles", [1])[0] == {"1": {"name": "a"}}
@@ -0,0 +1,43 @@
+import time
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import pytest
+
+from roblox_core import RATE_INCREASE_STEP, RATE_MAX_MULTIPLIER, RATE_MIN, HostRateLimiter, parse_retry_after
+
+def _res(**headers):
+    return SimpleNamespace(headers=headers)
+
+def test_success_increases_rate_additively_up_to_cap():
+    limiter = HostRateLimiter(10)
+    limiter.on_success({})
+    assert limiter.rate == pytest.approx(10 + 10 * RATE_INCREASE_STEP)
+    for _ in range(10_000): limiter.on_success({})
+    assert limiter.rate == pytest.approx(10 * RATE_MAX_MULTIPLIER)
+
+def test_throttle_halves_once_per_wave_and_blocks():
+    limiter = HostRateLimiter(10)
+    limiter.on_throttle(5)
+    limiter.on_throttle(5)  # 同一波並行的 429
+    assert limiter.rate == pytest.approx(5)
+    assert limiter.tokens == 0 and limiter.blocked_until > time.monotonic() + 4
+    for _ in range(20):
+        limiter.blocked_until = 0
+        limiter.on_throttle(0)
+    assert limiter.rate == pytest.approx(RATE_MIN)
+
+def test_exhausted_quota_header_pauses_without_speeding_up():
+    limiter = HostRateLimiter(10)
+    limiter.on_success({"x-ratelimit-remaining": "0", "x-ratelimit-reset": "30, 30;w=60"})
+    assert limiter.rate == 10
+    assert limiter.blocked_until > time.monotonic() + 29
+
+def test_parse_retry_after_formats():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after(_res(**{"Retry-After": "3"})) == 3.0
+    assert parse_retry_after(_res(**{"Retry-After": "-1"})) == 0.0
+    assert 8 < parse_retry_after(_res(**{"Retry-After": formatdate(time.time() + 10, usegmt=True)})) <= 10
+    assert parse_retry_after(_res(**{"Retry-After": "soon"})) is None
+    assert parse_retry_after(_res(**{"x-ratelimit-reset": "12"})) == 12.0
+    assert parse_retry_after(_res()) is None
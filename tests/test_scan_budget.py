@@ -0,0 +1,49 @@
+import contextvars
+
+import roblox_core
+from roblox_core import JOB_REQUEST_COUNTER, ScanBudget, SocialCrawl
+
+def _spend(n):
+    for _ in range(n): JOB_REQUEST_COUNTER.get().inc()
+
+def _run(fn, *args):
+    # 每個工作都在獨立的 Context 中執行，與 JobRunner 相同
+    return contextvars.Context().run(fn, *args)
+
+def test_budget_counts_only_requests_after_start():
+    stop = ScanBudget(max_calls=5)
+    def job():
+        stop.start()
+        _spend(3)
+        return stop.calls_left(), stop.exhausted(0)
+    assert _run(job) == (2, None)
+    assert ScanBudget(max_hits=3).calls_left() is None
+
+def test_budget_reports_first_limit_reached():
+    stop = ScanBudget(max_hits=2, max_calls=4)
+    def job():
+        stop.start()
+        _spend(4)
+        return stop.calls_left(), stop.exhausted(0), stop.exhausted(2)
+    left, by_calls, by_hits = _run(job)
+    assert left == 0 and "API" in by_calls and "命中" in by_hits
+
+def test_crawl_caps_pagination_within_one_parent(monkeypatch):
+    asked = []
+    def fake_list(user_id, limit=None):
+        asked.append(limit)
+        _spend(max(1, -(-limit // 100)))
+        return [{"id": 1000 + i, "name": f"u{i}"} for i in range(limit)]
+    monkeypatch.setattr(roblox_core, "get_user_friends", lambda user_id: (_spend(1), [{"id": 1, "name": "f"}])[1])
+    monkeypatch.setattr(roblox_core, "get_user_followings", fake_list)
+    monkeypatch.setattr(roblox_core, "get_user_followers", fake_list)
+
+    stop = ScanBudget(max_calls=4)
+    def job():
+        stop.start()
+        crawl = SocialCrawl(42, "root")
+        crawl.expand([crawl.nodes[crawl.root_id]], 1, stop)
+        return stop.calls()
+    # 好友用掉 1 次後只剩 3 頁：關注名單限制在 300 人，粉絲名單不再抓取
+    assert _run(job) == 4
+    assert asked == [300]
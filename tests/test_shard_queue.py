@@ -0,0 +1,52 @@
+import time
+
+import pytest
+
+from roblox_core import SHARD_MAX_ATTEMPTS, ShardQueue
+
+ROLES = [{"id": 10, "name": "Member", "rank": 1, "memberCount": 250}]
+
+@pytest.fixture
+def queue(tmp_path):
+    q = ShardQueue(str(tmp_path / "shards.sqlite3"))
+    q.open_sweep("s1", 1234, ROLES, {99})
+    return q
+
+def test_failed_shard_is_requeued_when_sweep_resumes(queue):
+    for _ in range(SHARD_MAX_ATTEMPTS):
+        queue.release(queue.lease("w1", "s1"), failed=True)
+    assert queue.lease("w1", "s1") is None
+    assert queue.finished("s1")
+    assert queue.stats("s1")["failed"] == 1
+
+    # 按「繼續」會重新開啟同一個掃描
+    queue.open_sweep("s1", 1234, ROLES, {99})
+    shard = queue.lease("w1", "s1")
+    assert shard is not None and shard["attempts"] == 1
+    assert not queue.finished("s1")
+    queue.complete(shard, "w1", 0)
+    assert queue.finished("s1")
+    stats = queue.stats("s1")
+    assert (stats["done"], stats["failed"]) == (1, 0)
+
+def test_voluntary_release_does_not_use_up_attempts(queue):
+    for _ in range(SHARD_MAX_ATTEMPTS * 2):
+        queue.release(queue.lease("w1", "s1"))
+    shard = queue.lease("w1", "s1")
+    assert shard is not None and shard["attempts"] == 1
+
+def test_expired_lease_is_redispatched_and_old_worker_loses_it(queue):
+    dead = queue.lease("dead", "s1")
+    queue.conn.execute("UPDATE shard_tasks SET lease_until = ? WHERE token = ?", (time.time() - 1, dead["token"]))
+    queue.conn.commit()
+    alive = queue.lease("alive", "s1")
+    assert alive is not None and alive["attempts"] == 2
+    assert not queue.heartbeat("dead", "s1", dead)
+    assert queue.heartbeat("alive", "s1", alive)
+
+def test_results_skip_already_processed_members(queue):
+    queue.record_results("s1", "w1", [(1, None), (2, {"user_id": 2})])
+    queue.record_results("s1", "w2", [(2, None)])
+    assert queue.processed_ids("s1", range(1, 1200)) == {1, 2}
+    rows = queue.results_since("s1")
+    assert [(uid, report) for _, uid, report in rows] == [(1, None), (2, {"user_id": 2})]
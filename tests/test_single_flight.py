@@ -0,0 +1,39 @@
+import threading
+
+import pytest
+
+from roblox_core import SingleFlight
+
+def _run_concurrently(flight, key, fn, callers=5):
+    results, started = [], threading.Barrier(callers)
+    def call():
+        started.wait()
+        try: results.append(flight.do(key, fn, "test"))
+        except Exception as e: results.append(e)
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for t in threads: t.start()
+    for t in threads: t.join(5)
+    return results
+
+def test_concurrent_callers_share_one_fetch():
+    flight, release, calls = SingleFlight(), threading.Event(), []
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return {"ok": True}
+    threading.Timer(0.2, release.set).start()
+    assert _run_concurrently(flight, "k", fetch) == [{"ok": True}] * 5
+    assert len(calls) == 1 and flight.in_flight() == 0
+
+def test_error_reaches_every_waiter_and_is_not_cached():
+    flight, release = SingleFlight(), threading.Event()
+    def fail():
+        release.wait(5)
+        raise RuntimeError("boom")
+    threading.Timer(0.2, release.set).start()
+    results = _run_concurrently(flight, "k", fail)
+    assert len(results) == 5 and all(isinstance(r, RuntimeError) for r in results)
+    assert flight.in_flight() == 0
+    assert flight.do("k", lambda: 42) == 42
+    with pytest.raises(ValueError):
+        flight.do("k", lambda: int("x"))
@@ -0,0 +1,43 @@
+import sqlite3
+
+from roblox_core import WatchlistStore
+
+def avatar(name):
+    return f"https://tr.rbxcdn.com/{name}/150/150/AvatarHeadshot/Png"
+
+def alert(uid, url, name=None):
+    return {"user_id": uid, "user_name": name or f"user{uid}", "relation": "好友", "avatar_url": url}
+
+def test_shared_avatar_keeps_every_candidate(tmp_path):
+    store = WatchlistStore(str(tmp_path / "w.sqlite3"))
+    store.add_alerts([alert(1, avatar("outfit")), alert(2, avatar("outfit"))])
+    assert {c["user_id"] for c in store.match(avatar("outfit"))} == {1, 2}
+    assert len(store) == 2
+
+def test_avatar_change_only_removes_own_pairing(tmp_path):
+    path = str(tmp_path / "w.sqlite3")
+    store = WatchlistStore(path)
+    store.add_alerts([alert(1, avatar("outfit")), alert(2, avatar("outfit"))])
+    store.add_alerts([alert(1, avatar("new-look"))])
+    assert [c["user_id"] for c in store.match(avatar("outfit"))] == [2]
+    assert [c["user_id"] for c in store.match(avatar("new-look"))] == [1]
+    assert len(store) == 2
+    # 重新載入後與記憶體內的索引一致
+    reloaded = WatchlistStore(path)
+    assert [c["user_id"] for c in reloaded.match(avatar("outfit"))] == [2]
+    assert [c["user_id"] for c in reloaded.match(avatar("new-look"))] == [1]
+
+def test_cdn_host_is_ignored_and_unknown_avatar_matches_nothing(tmp_path):
+    store = WatchlistStore(str(tmp_path / "w.sqlite3"))
+    store.add_alerts([alert(1, avatar("outfit"))])
+    assert [c["user_id"] for c in store.match(avatar("outfit").replace("tr.", "t3."))] == [1]
+    assert store.match(avatar("someone-else")) == []
+
+def test_legacy_table_is_migrated(tmp_path):
+    path = str(tmp_path / "w.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE watch_headshots (image_key TEXT PRIMARY KEY, user_id INTEGER UNIQUE, user_name TEXT, relation TEXT, updated_at REAL)")
+    conn.execute("INSERT INTO watch_headshots VALUES ('/outfit/150/150/AvatarHeadshot/Png', 7, 'user7', '好友', 0)")
+    conn.commit(); conn.close()
+    store = WatchlistStore(path)
+    assert [c["user_id"] for c in store.match(avatar("outfit"))] == [7]